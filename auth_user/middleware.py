@@ -0,0 +1,97 @@
+"""
+Authentication without a User query on every request.
+
+Each worker keeps the users it has recently authenticated for
+AUTH_USER_CACHE_SECONDS, keyed by (user id, session auth hash) from the
+session. The hash is derived from the password, so a session that logged in
+with an old password never matches the entry of a newer one. A miss goes
+through django.contrib.auth.get_user(), which verifies the hash, and caches
+the result. Saving or deleting a user bumps their version in the shared
+``sessions`` cache; every worker compares it with the version it loaded the
+user under, so a deactivated user or a new password takes effect on the next
+request everywhere, at the cost of one cache get.
+"""
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import HASH_SESSION_KEY, SESSION_KEY, get_user
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.core.cache import caches
+from django.utils.functional import SimpleLazyObject
+
+
+VERSION_KEY = "auth_user:user-version:{}"
+
+
+def user_version(user_id):
+    return caches[settings.SESSION_CACHE_ALIAS].get(VERSION_KEY.format(user_id))
+
+
+def bump_user_version(user_id):
+    cache = caches[settings.SESSION_CACHE_ALIAS]
+    try:
+        cache.incr(VERSION_KEY.format(user_id))
+    except ValueError:
+        cache.set(VERSION_KEY.format(user_id), time.time_ns(), None)
+
+
+class UserCache:
+    """
+    Users by (id, session hash) for this worker, each kept
+    AUTH_USER_CACHE_SECONDS and only while their version is unchanged.
+    """
+
+    def __init__(self, max_entries=1000):
+        self._lock = threading.Lock()
+        self._users = {}
+        self.max_entries = max_entries
+
+    def get(self, key, version):
+        with self._lock:
+            found = self._users.get(key)
+        if found is None or found[0] < time.monotonic() or found[1] != version:
+            return None
+        # each request gets its own copy, views may set attributes on it
+        return copy.copy(found[2])
+
+    def set(self, key, version, user):
+        with self._lock:
+            if len(self._users) >= self.max_entries:
+                self._users.clear()
+            self._users[key] = (time.monotonic() + settings.AUTH_USER_CACHE_SECONDS, version, copy.copy(user))
+
+    def forget(self, user_id):
+        with self._lock:
+            for key in [key for key in self._users if key[0] == str(user_id)]:
+                del self._users[key]
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+users = UserCache()
+
+
+def cached_user(request):
+    key = (request.session.get(SESSION_KEY), request.session.get(HASH_SESSION_KEY))
+    if None in key:
+        return get_user(request)
+    # read before loading the user, a save in between then shows as a new version
+    version = user_version(key[0])
+    user = users.get(key, version)
+    if user is None:
+        user = get_user(request)
+        if user.is_authenticated:
+            users.set(key, version, user)
+    return user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """AuthenticationMiddleware with request.user served from the worker's UserCache."""
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: cached_user(request))
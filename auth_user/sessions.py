@@ -0,0 +1,66 @@
+"""
+Session engine: sessions are read from the ``sessions`` cache and written to
+it on every change, the django_session row is written behind.
+
+A request with a cached session runs no session query. Saves that change who
+is logged in (login, logout, key cycling) and new sessions go to the database
+straight away. Any other change (flash messages, expiry refresh) updates the
+cache and reaches the database at most once per SESSION_DB_WRITE_INTERVAL
+seconds, so if the cache loses an entry the session falls back to a copy that
+is at most that old and still has the same login.
+
+Like the ``lists`` cache, with several workers the ``sessions`` cache must be
+one they all share (SESSION_CACHE_BACKEND / SESSION_CACHE_LOCATION).
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth import HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = "auth_user.sessions"
+
+    @property
+    def synced_key(self):
+        return f"{self.cache_key}:synced"
+
+    @staticmethod
+    def _login(data):
+        return data.get(SESSION_KEY), data.get(HASH_SESSION_KEY)
+
+    def _mark_synced(self, data):
+        # wall clock, workers sharing the cache compare each other's stamps
+        self._cache.set(self.synced_key, (time.time(), self._login(data)), self.get_expiry_age())
+
+    def load(self):
+        try:
+            data = self._cache.get(self.cache_key)
+        except Exception:
+            data = None  # invalid key on some backends, same as cached_db
+        if data is None:
+            stored = self._get_session_from_db()
+            if stored is None:
+                return {}
+            data = self.decode(stored.session_data)
+            self._cache.set(self.cache_key, data, self.get_expiry_age(expiry=stored.expire_date))
+            self._mark_synced(data)
+        return data
+
+    def save(self, must_create=False):
+        synced = None if must_create or self.session_key is None else self._cache.get(self.synced_key)
+        if (
+            synced is None
+            or synced[1] != self._login(self._session)
+            or time.time() - synced[0] >= settings.SESSION_DB_WRITE_INTERVAL
+        ):
+            super().save(must_create)  # database and cache
+            self._mark_synced(self._session)
+        else:
+            self._cache.set(self.cache_key, self._session, self.get_expiry_age())
+
+    def delete(self, session_key=None):
+        if session_key or self.session_key:
+            self._cache.delete(f"{self.cache_key_prefix}{session_key or self.session_key}:synced")
+        super().delete(session_key)
@@ -1,3 +1,156 @@
-from django.test import TestCase
+import io
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .middleware import bump_user_version, users
+from .sessions import SessionStore
+
+
+def auth_queries(ctx):
+    return [q["sql"] for q in ctx.captured_queries if '"django_session"' in q["sql"] or '"auth_user"' in q["sql"]]
+
+
+class LoginTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("driver", password="right-password")
+
+    def login(self, password, username="driver", **extra):
+        return self.client.post(reverse("login_pg"), {"username": username, "password": password}, **extra)
+
+    def test_wrong_password_goes_back_to_the_form(self):
+        response = self.login("wrong")
+        self.assertRedirects(response, reverse("login_pg"))
+        self.assertNotIn("_auth_user_id", self.client.session)
+
+    def test_login(self):
+        self.assertRedirects(self.login("right-password"), reverse("dashboard"), fetch_redirect_response=False)
+        self.assertEqual(self.client.session["_auth_user_id"], str(self.user.pk))
+
+    def test_throttle_refuses_before_hashing(self):
+        for _ in range(settings.LOGIN_MAX_ATTEMPTS):
+            self.login("wrong")
+        with mock.patch("auth_user.views.authenticate") as authenticate:
+            response = self.login("right-password")
+        self.assertEqual(response.status_code, 429)
+        authenticate.assert_not_called()
+
+    def test_success_resets_the_count(self):
+        for _ in range(settings.LOGIN_MAX_ATTEMPTS - 1):
+            self.login("wrong")
+        self.login("right-password")
+        self.client.logout()
+        self.login("wrong")
+        self.assertEqual(self.login("right-password").status_code, 302)
+
+
+    @override_settings(TRUSTED_PROXY_HOPS=1)
+    def test_addresses_come_from_the_proxy_header(self):
+        for n in range(settings.LOGIN_MAX_ATTEMPTS):
+            self.login("wrong", username=f"guess{n}", HTTP_X_FORWARDED_FOR="spoofed, 203.0.113.9")
+        self.assertEqual(self.login("wrong", username="other", HTTP_X_FORWARDED_FOR="203.0.113.9").status_code, 429)
+        # everyone else behind the same proxy still gets in
+        response = self.login("right-password", HTTP_X_FORWARDED_FOR="198.51.100.7")
+        self.assertRedirects(response, reverse("dashboard"), fetch_redirect_response=False)
+
+    @override_settings(TRUSTED_PROXY_HOPS=1)
+    def test_username_backs_off_instead_of_locking(self):
+        for n in range(settings.LOGIN_MAX_ATTEMPTS + 1):
+            self.login("wrong", HTTP_X_FORWARDED_FOR=f"203.0.113.{n}")
+        self.assertEqual(self.login("right-password", HTTP_X_FORWARDED_FOR="198.51.100.7").status_code, 429)
+
+        later = time.time() + 3
+        with mock.patch("auth_user.throttle.time.time", return_value=later):
+            response = self.login("right-password", HTTP_X_FORWARDED_FOR="198.51.100.7")
+        self.assertRedirects(response, reverse("dashboard"), fetch_redirect_response=False)
+
+
+class CachedAuthTests(TestCase):
+    def setUp(self):
+        caches[settings.SESSION_CACHE_ALIAS].clear()
+        users.clear()
+        self.user = User.objects.create_user("staff", password="pw")
+        self.client.force_login(self.user)
+        self.url = reverse("route_sheet")
+
+    def test_repeat_requests_skip_session_and_user_queries(self):
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(self.url)
+        with CaptureQueriesContext(connection) as second:
+            self.client.get(self.url)
+        self.assertEqual(len(auth_queries(first)), 1)  # the user, the session came from the cache
+        self.assertEqual(auth_queries(second), [])
+
+    def test_session_falls_back_to_the_database(self):
+        caches[settings.SESSION_CACHE_ALIAS].clear()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_deactivated_user_is_dropped(self):
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_password_change_ends_other_sessions(self):
+        self.client.get(self.url)
+        self.user.set_password("new")
+        User.objects.filter(pk=self.user.pk).update(password=self.user.password)  # no signal
+        users.clear()  # as another worker would see it
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+
+    def test_change_made_by_another_worker_is_seen(self):
+        self.client.get(self.url)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        bump_user_version(self.user.pk)  # what the other worker's signal leaves in the shared cache
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+
+class WriteBehindSessionTests(TestCase):
+    def setUp(self):
+        caches[settings.SESSION_CACHE_ALIAS].clear()
+
+    def stored(self, session):
+        return Session.objects.get(session_key=session.session_key).get_decoded()
+
+    def test_plain_changes_are_written_behind(self):
+        session = SessionStore()
+        session["cart"] = 1
+        session.create()
+        session["cart"] = 2
+        session.save()
+
+        self.assertEqual(self.stored(session)["cart"], 1)
+        self.assertEqual(SessionStore(session.session_key)["cart"], 2)
+
+        with override_settings(SESSION_DB_WRITE_INTERVAL=0):
+            session["cart"] = 3
+            session.save()
+        self.assertEqual(self.stored(session)["cart"], 3)
+
+    def test_login_changes_are_written_through(self):
+        session = SessionStore()
+        session.create()
+        session["_auth_user_id"] = "7"
+        session.save()
+        self.assertEqual(self.stored(session)["_auth_user_id"], "7")
+
+    def test_benchmark_leaves_live_sessions_alone(self):
+        session = SessionStore()
+        session.create()
+        session["cart"] = 2
+        session.save()
+
+        call_command("bench_auth", requests=2, stdout=io.StringIO())
+        self.assertEqual(SessionStore(session.session_key)["cart"], 2)
@@ -0,0 +1,69 @@
+"""
+Login throttling.
+
+Failed logins are counted per client address and per username in the
+default cache, and login_pg turns attempts away before authenticate(), so a
+brute-force run never gets to spend the password hasher's time.
+
+* address: LOGIN_MAX_ATTEMPTS failures within LOGIN_THROTTLE_SECONDS block it
+  for the rest of the window. The address is the client's, taken from
+  X-Forwarded-For behind TRUSTED_PROXY_HOPS proxies (Render puts one in front).
+* username: past LOGIN_MAX_ATTEMPTS failures each further attempt has to wait
+  1, 2, 4, ... seconds after the last failure, up to LOGIN_BACKOFF_MAX_SECONDS.
+  Guessing gets slow, but nobody can lock a chosen account out for good.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def client_address(request):
+    """The client's address: the entry the outermost trusted proxy added to X-Forwarded-For."""
+    hops = settings.TRUSTED_PROXY_HOPS
+    if hops:
+        forwarded = [part.strip() for part in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",")]
+        if len(forwarded) >= hops and forwarded[-hops]:
+            return forwarded[-hops]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def _address_key(request):
+    return f"auth_user:login-failures:addr:{client_address(request)}"
+
+
+def _user_key(username):
+    return f"auth_user:login-failures:user:{(username or '').lower()}"
+
+
+def _backoff(failures):
+    over = failures - settings.LOGIN_MAX_ATTEMPTS
+    if over < 0:
+        return 0
+    return min(2 ** over, settings.LOGIN_BACKOFF_MAX_SECONDS)
+
+
+def is_locked(request, username):
+    counts = cache.get_many([_address_key(request), _user_key(username)])
+    if counts.get(_address_key(request), 0) >= settings.LOGIN_MAX_ATTEMPTS:
+        return True
+    failures, last = counts.get(_user_key(username), (0, 0))
+    return time.time() - last < _backoff(failures)
+
+
+def record_failure(request, username):
+    key = _address_key(request)
+    # add() starts the window, incr() keeps it
+    if not cache.add(key, 1, settings.LOGIN_THROTTLE_SECONDS):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, settings.LOGIN_THROTTLE_SECONDS)
+
+    key = _user_key(username)
+    failures, _ = cache.get(key, (0, 0))
+    cache.set(key, (failures + 1, time.time()), settings.LOGIN_THROTTLE_SECONDS)
+
+
+def reset(request, username):
+    cache.delete_many([_address_key(request), _user_key(username)])
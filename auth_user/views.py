@@ -1,25 +1,30 @@
 from django.shortcuts import render , redirect
 from django.contrib import messages
-from django.contrib.auth.models import User
 from django.contrib.auth import authenticate , login , logout
 from django.contrib.auth.decorators import login_required
 
+from . import throttle
+
 # Create your views here.
 def  login_pg(request):
     if request.method == "POST":
         username = request.POST.get("username")
         password = request.POST.get("password")
 
-        if not User.objects.filter(username = username):
-            messages.error(request, "Username Invalid ! ")
-            return redirect('login_pg')
-        
-        user = authenticate(username = username , password = password)
+        # ✅ refuse before authenticate(), the password hasher is the slow part
+        if throttle.is_locked(request, username):
+            messages.error(request, "Too many failed logins, try again in a few minutes.")
+            return render(request, 'login.html', status=429)
+
+        # ✅ unknown usernames and wrong passwords look the same, one query either way
+        user = authenticate(request, username = username , password = password)
 
-        if User is None:
-            messages.error(request, "Username Invalid ! ")
+        if user is None:
+            throttle.record_failure(request, username)
+            messages.error(request, "Username or password invalid ! ")
             return redirect('login_pg')
         else:
+            throttle.reset(request, username)
             login(request, user)
             return redirect('dashboard')
 
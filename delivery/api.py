@@ -0,0 +1,242 @@
+"""
+Versioned JSON API (/api/v1/) over customers, deliveries and transactions.
+
+* Lists page with cursors: deliveries and transactions reuse the (date, id)
+  keyset pagination of the HTML lists, customers page on id.
+* ``?fields=a,b`` returns only those fields (and skips the customer join when
+  customer_name isn't asked for).
+* GETs carry an ETag built from the model versions like the HTML pages
+  (conditional.py), a matching If-None-Match gets a 304 before any query.
+* ``deliveries/bulk/`` posts or edits a whole batch in one atomic write with a
+  fixed number of queries, see importer.post_batch() and
+  posting.post_delivery_edits().
+* ``sync/`` is the drivers' idempotent offline upload, see sync.py.
+"""
+import hashlib
+
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework.views import APIView
+
+from .caching import versions
+from .forms import DateRangeFilterForm, TransactionFilterForm
+from .importer import post_batch
+from .models import Customer, Delivery, Transaction
+from .pagination import keyset_paginate
+from .posting import post_delivery_edits, snapshot
+from .pricing import price_on
+from .routers import replica_reads
+from .serializers import (
+    BULK_LIMIT, BulkDeliverySerializer, BulkDeliveryUpdateSerializer, CustomerSerializer,
+    DeliverySerializer, TransactionSerializer, requested_fields,
+)
+from .sync import COLUMNS as SYNC_COLUMNS, MAX_EVENTS, SyncConflict, events_since, sync_cursor, sync_events
+
+
+MAX_PAGE_SIZE = 500
+
+
+def _page_size(request, default):
+    try:
+        return min(max(int(request.query_params["page_size"]), 1), MAX_PAGE_SIZE)
+    except (KeyError, ValueError):
+        return default
+
+
+class KeysetPagination(BasePagination):
+    """DRF front end for pagination.keyset_paginate(), newest first."""
+    page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page = keyset_paginate(
+            queryset, request.query_params.get("cursor"), _page_size(request, self.page_size)
+        )
+        return self.page.items
+
+    def get_next_link(self):
+        if not self.page.has_next:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), "cursor", self.page.next_cursor)
+
+    def get_previous_link(self):
+        # keyset cursors only go forward, this is the way back to the start
+        if self.page.is_first:
+            return None
+        return remove_query_param(self.request.build_absolute_uri(), "cursor")
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "first": self.get_previous_link(), "results": data})
+
+
+class CustomerPagination(CursorPagination):
+    ordering = "id"
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = MAX_PAGE_SIZE
+
+
+class ETagMixin:
+    """
+    ETag GETs from the versions of ``etag_models``, the URL, the user and the
+    format, like conditional.page_etag(), and answer a matching If-None-Match
+    with 304 before list()/retrieve() query or serialize anything.
+    """
+    etag_models = ()
+    etag = None
+
+    def get_etag(self, request):
+        parts = [
+            versions(*self.etag_models),
+            request.get_full_path(),
+            str(request.user.pk),
+            request.accepted_renderer.format,
+        ]
+        return quote_etag(hashlib.md5("|".join(parts).encode(), usedforsecurity=False).hexdigest())
+
+    def not_modified(self, request):
+        self.etag = self.get_etag(request)
+        return get_conditional_response(request._request, etag=self.etag)
+
+    def list(self, request, *args, **kwargs):
+        return self.not_modified(request) or super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.not_modified(request) or super().retrieve(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.etag and response.status_code in (200, 304):
+            response["ETag"] = self.etag
+        return response
+
+
+class CustomerViewSet(ETagMixin, mixins.CreateModelMixin, mixins.UpdateModelMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Customer.objects.all()
+    serializer_class = CustomerSerializer
+    etag_models = (Customer,)
+    pagination_class = CustomerPagination
+    lookup_value_regex = r"\d+"
+
+
+class LedgerViewSetMixin:
+    """Filters and the conditional customer join shared by deliveries and transactions."""
+    filter_form = DateRangeFilterForm
+    pagination_class = KeysetPagination
+    lookup_value_regex = r"\d+"
+
+    def get_queryset(self):
+        queryset = self.queryset
+        if self.action == "list":
+            queryset = self.filter_form(self.request.query_params).filter(queryset)
+        wanted = requested_fields(self.request)
+        if wanted is None or "customer_name" in wanted:
+            queryset = queryset.select_related("customer")
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        with replica_reads():
+            return super().list(request, *args, **kwargs)
+
+
+class DeliveryViewSet(ETagMixin, LedgerViewSetMixin, mixins.CreateModelMixin, mixins.UpdateModelMixin,
+                      viewsets.ReadOnlyModelViewSet):
+    queryset = Delivery.objects.all()
+    serializer_class = DeliverySerializer
+    etag_models = (Delivery, Customer)  # customer_name
+
+    @action(detail=False, methods=["post", "patch"])
+    def bulk(self, request, *args, **kwargs):
+        """POST a list to create deliveries, PATCH a list of {id, ...} to edit them. All or nothing."""
+        if request.method == "POST":
+            return self.bulk_create(request)
+        return self.bulk_update(request)
+
+    def bulk_create(self, request):
+        rows = BulkDeliverySerializer(data=request.data, many=True, max_length=BULK_LIMIT, allow_empty=False)
+        rows.is_valid(raise_exception=True)
+
+        deliveries, errors = post_batch([BulkDeliverySerializer.to_row(row) for row in rows.validated_data])
+        if errors:
+            return Response(
+                {"errors": [{"index": index, "detail": message} for index, message in errors]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(DeliverySerializer(deliveries, many=True).data, status=status.HTTP_201_CREATED)
+
+    def bulk_update(self, request):
+        rows = BulkDeliveryUpdateSerializer(data=request.data, many=True, max_length=BULK_LIMIT, allow_empty=False)
+        rows.is_valid(raise_exception=True)
+        edits = {row.pop("id"): row for row in rows.validated_data}
+
+        with transaction.atomic():
+            deliveries = Delivery.objects.in_bulk(edits)
+            missing = [pk for pk in edits if pk not in deliveries]
+            if missing:
+                return Response(
+                    {"errors": [{"id": pk, "detail": "Delivery does not exist"} for pk in missing]},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            changes = []
+            for pk, values in edits.items():
+                delivery = deliveries[pk]
+                previous = snapshot(delivery)
+                for field, value in values.items():
+                    setattr(delivery, field, value)
+                delivery.total_amount = delivery.bottles_delivered * price_on(delivery.date)
+                changes.append((delivery, previous))
+            post_delivery_edits(changes)
+
+        return Response(DeliverySerializer([delivery for delivery, _ in changes], many=True).data)
+
+
+class TransactionViewSet(ETagMixin, LedgerViewSetMixin, mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Transaction.objects.all()
+    serializer_class = TransactionSerializer
+    filter_form = TransactionFilterForm
+    etag_models = (Transaction, Customer)  # customer_name
+
+
+class SyncView(APIView):
+    """
+    POST {"device": "...", "events": [[key, customer, date, delivered, returned, received], ...]}
+    to sync a route, GET ?device=...&cursor=n to list the keys stored since a cursor.
+    """
+
+    def get(self, request, *args, **kwargs):
+        device = request.query_params.get("device", "")
+        try:
+            cursor = int(request.query_params.get("cursor", 0))
+        except ValueError:
+            return Response({"detail": "cursor must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+        events = events_since(device, cursor)
+        return Response({
+            "cursor": events[-1]["id"] if events else max(cursor, 0),
+            "latest": sync_cursor(device),
+            "events": [[event["key"], event["delivery_id"]] for event in events],
+        })
+
+    def post(self, request, *args, **kwargs):
+        data = request.data if isinstance(request.data, dict) else {}
+        events = data.get("events")
+        device = str(data.get("device") or "")[:64]
+        if not isinstance(events, list) or not events:
+            return Response(
+                {"detail": f"events must be a non-empty list of [{', '.join(SYNC_COLUMNS)}]"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(events) > MAX_EVENTS:
+            return Response({"detail": f"At most {MAX_EVENTS} events per upload"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            results, cursor = sync_events(events, device)
+        except SyncConflict as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response({"cursor": cursor, "results": results})
@@ -0,0 +1,13 @@
+from django.urls import path
+from rest_framework.routers import DefaultRouter
+
+from . import api
+
+router = DefaultRouter()
+router.register("customers", api.CustomerViewSet)
+router.register("deliveries", api.DeliveryViewSet)
+router.register("transactions", api.TransactionViewSet)
+
+urlpatterns = router.urls + [
+    path("sync/", api.SyncView.as_view(), name="sync"),
+]
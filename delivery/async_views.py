@@ -0,0 +1,93 @@
+"""
+Async versions of the dashboard and list pages, served instead of the sync
+views when the app runs under ASGI (settings.ASYNC_VIEWS, see asgi.py).
+
+Django's async ORM methods (acount(), aaggregate(), ...) all go through
+sync_to_async on the one thread a request gets, so gathering them would still
+run the queries back to back. Independent reads go through run_read()
+instead: each runs in its own worker thread with its own read-alias
+connection, and SQLite releases the GIL while a query runs, so gathered reads
+really overlap. Templates render in the request's sync thread because
+context processors touch the session and user.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.db import close_old_connections
+from django.db.models import Count, Sum
+from django.shortcuts import render
+from django.utils import timezone
+
+from . import views
+from .conditional import conditional
+from .forms import DateRangeFilterForm, TransactionFilterForm
+from .metrics import instrument_connections
+from .models import Customer, Delivery, Transaction
+from .rollups import dashboard_totals, monthly_totals
+from .routers import replica_reads
+
+
+async def run_read(query, *args, **kwargs):
+    """Run a sync read in a worker thread on the read alias."""
+    def call():
+        # pool threads outlive requests, drop connections past CONN_MAX_AGE or broken
+        close_old_connections()
+        with replica_reads(), instrument_connections():
+            return query(*args, **kwargs)
+    return await sync_to_async(call, thread_sensitive=False)()
+
+
+async def render_async(request, template_name, context):
+    def call():
+        with instrument_connections():
+            return render(request, template_name, context)
+    return await sync_to_async(call)()
+
+
+@login_required
+async def dashboard(request):
+    today = timezone.localdate()
+    customers, sales, months = await asyncio.gather(
+        run_read(Customer.objects.aggregate, count=Count("id"), bottles=Sum("bottles_at_site")),
+        run_read(dashboard_totals, today),
+        run_read(lambda: list(monthly_totals(today.year))),
+    )
+    return await render_async(request, "delivery/dashboard.html", views.dashboard_context(customers, sales, months))
+
+
+@login_required
+@conditional(Customer)
+async def customer_list(request):
+    query, page = views.customer_list_params(request)
+    table = await run_read(views.customer_table, query, page)
+    return await render_async(request, "delivery/customers.html", {"query": query, "table": table})
+
+
+@login_required
+@conditional(Delivery, Customer)
+async def delivery_list(request):
+    filters = DateRangeFilterForm(request.GET)
+    filters.is_valid()  # validate here, not concurrently in the worker threads
+    table, daily_totals, customer = await asyncio.gather(
+        run_read(views.delivery_table, request, filters),
+        run_read(views.daily_delivery_totals, timezone.localdate()),
+        run_read(views.selected_customer, filters),
+    )
+    context = views.delivery_list_context(request, filters, table, daily_totals, customer)
+    return await render_async(request, "delivery/deliveries.html", context)
+
+
+@login_required
+@conditional(Transaction, Customer)
+async def transaction_list(request):
+    filters = TransactionFilterForm(request.GET)
+    filters.is_valid()
+    transactions = filters.filter(Transaction.objects.all())
+    table, totals, customer = await asyncio.gather(
+        run_read(views.transaction_table, request, transactions),
+        run_read(views.transaction_totals, request, transactions),
+        run_read(views.selected_customer, filters),
+    )
+    context = views.transaction_list_context(request, filters, table, totals, customer)
+    return await render_async(request, "delivery/transactions.html", context)
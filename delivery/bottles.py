@@ -0,0 +1,130 @@
+"""
+Point-in-time bottle counts.
+
+BottleSnapshot and FleetBottleSnapshot hold the running bottle count at the
+end of every day with a bottle movement, per customer and for the whole
+fleet. Movements are deliveries and the ledger's adjustment entries (opening
+counts and manual edits of Customer.bottles_at_site, see ledger.py), so the
+latest snapshot agrees with the counter. SQLite triggers (migrations 0016 and
+0021) keep them current on every delivery insert, edit and delete and every
+adjustment; a backdated one also shifts the later rows of its customer and
+of the fleet. This module rebuilds them from the ledger and reads them: "as
+of date X" is the latest row on or before X, one lookup on the
+(customer, date) or (date) unique index.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from .models import BottleSnapshot, Customer, Delivery, FleetBottleSnapshot, LedgerEntry
+
+
+def rebuild_bottle_snapshots(
+    snapshot_model=BottleSnapshot, fleet_model=FleetBottleSnapshot, delivery_model=Delivery,
+    entry_model=LedgerEntry,
+):
+    """
+    Recompute both snapshot tables from deliveries and bottle adjustments with
+    two grouped queries.
+
+    Model arguments exist so the data migrations can pass historical models,
+    ``entry_model=None`` leaves adjustments out (before the ledger existed).
+    """
+    deliveries = delivery_model.objects.filter(date__isnull=False).annotate(
+        net=F("bottles_delivered") - F("bottles_returned"),
+    )
+    per_customer = deliveries.values("customer_id", "date").annotate(delta=Sum("net"))
+    per_day = deliveries.values("date").annotate(delta=Sum("net"))
+    if entry_model is not None:
+        # the ledger outlives deleted customers, their adjustments don't count
+        customer_model = snapshot_model._meta.get_field("customer").related_model
+        adjustments = entry_model.objects.filter(
+            Exists(customer_model.objects.filter(pk=OuterRef("customer_id"))),
+            source="adjustment",
+        ).exclude(bottles=0)
+        per_customer = per_customer.union(
+            adjustments.values("customer_id", "date").annotate(delta=Sum("bottles")), all=True,
+        )
+        per_day = per_day.union(adjustments.values("date").annotate(delta=Sum("bottles")), all=True)
+    # a day can come from both sides, rows of the same day are merged below
+    per_customer = per_customer.order_by("customer_id", "date")
+    per_day = per_day.order_by("date")
+
+    with transaction.atomic():
+        snapshot_model.objects.all().delete()
+        fleet_model.objects.all().delete()
+
+        batch, customer_id, running = [], None, 0
+        for row in per_customer.iterator(chunk_size=5000):
+            if row["customer_id"] != customer_id:
+                customer_id, running = row["customer_id"], 0
+            running += row["delta"]
+            if batch and (batch[-1].customer_id, batch[-1].date) == (customer_id, row["date"]):
+                batch[-1].delta += row["delta"]
+                batch[-1].bottles_at_site = running
+                continue
+            if len(batch) >= 5000:
+                # keep the last row, the next one may be the same day
+                snapshot_model.objects.bulk_create(batch[:-1], batch_size=500)
+                batch = batch[-1:]
+            batch.append(snapshot_model(
+                customer_id=customer_id, date=row["date"], delta=row["delta"], bottles_at_site=running,
+            ))
+        snapshot_model.objects.bulk_create(batch, batch_size=500)
+
+        days, running = [], 0
+        for row in per_day:
+            running += row["delta"]
+            if days and days[-1].date == row["date"]:
+                days[-1].delta += row["delta"]
+                days[-1].bottles_out = running
+                continue
+            days.append(fleet_model(date=row["date"], delta=row["delta"], bottles_out=running))
+        fleet_model.objects.bulk_create(days, batch_size=500)
+    return snapshot_model.objects.count(), len(days)
+
+
+def _as_of(rows, on):
+    return rows.filter(date__lte=on).order_by("-date")
+
+
+def bottles_at_site(customer_id, on):
+    """One customer's bottles at the end of ``on``."""
+    rows = _as_of(BottleSnapshot.objects.filter(customer_id=customer_id), on)
+    return rows.values_list("bottles_at_site", flat=True).first() or 0
+
+
+def fleet_bottles_out(on):
+    """Bottles out across all customers at the end of ``on``."""
+    return _as_of(FleetBottleSnapshot.objects.all(), on).values_list("bottles_out", flat=True).first() or 0
+
+
+def bottles_as_of(on):
+    """Subquery for annotating customers with their bottles at the end of ``on``."""
+    rows = _as_of(BottleSnapshot.objects.filter(customer=OuterRef("pk")), on)
+    return Subquery(rows.values("bottles_at_site")[:1])
+
+
+def customers_holding(on):
+    """Customers with bottles out at the end of ``on``, annotated with ``bottles``."""
+    return Customer.objects.annotate(bottles=bottles_as_of(on)).filter(bottles__gt=0)
+
+
+def long_holders(days=60, on=None):
+    """
+    Customers who have had bottles out without a break for more than ``days``
+    days up to ``on``: they held bottles at the cutoff and never got back to
+    zero since. Annotated with ``bottles`` (as of ``on``).
+    """
+    on = on or timezone.localdate()
+    cutoff = on - timedelta(days=days)
+    emptied_since = BottleSnapshot.objects.filter(
+        customer=OuterRef("pk"), date__gt=cutoff, date__lte=on, bottles_at_site__lte=0,
+    )
+    return (
+        Customer.objects.annotate(held=bottles_as_of(cutoff), bottles=bottles_as_of(on))
+        .filter(held__gt=0)
+        .exclude(Exists(emptied_since))
+    )
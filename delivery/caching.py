@@ -0,0 +1,140 @@
+"""
+Versioned caching for the list pages.
+
+Rendered table fragments and aggregate results are stored under the current
+version of every model they were built from, so a write never has to find
+and delete keys: bumping a model's version makes everything built on the old
+one unreachable and the backend expires it. Versions live in the ``lists``
+cache (settings.CACHES), which must be shared by all workers: with
+WEB_CONCURRENCY > 1 the system check below refuses per-process caches.
+
+Versions are bumped by post_save/post_delete (signals.py). Queryset
+updates and bulk writes send no signals, so the posting, import and
+reconcile code calls changed() itself; anything else that writes with
+.update()/bulk_create() has to do the same.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.db import connections, transaction
+
+from .routers import WRITE_ALIAS
+
+
+VERSION_KEY = "delivery:version:{}"
+PER_PROCESS_BACKEND = "django.core.cache.backends.locmem.LocMemCache"
+
+_missing = object()
+
+
+def _cache():
+    return caches["lists"]
+
+
+def _label(model):
+    return model._meta.model_name
+
+
+def versions(*models):
+    """Current versions of ``models`` joined into one key part, one cache round trip."""
+    cache = _cache()
+    keys = [VERSION_KEY.format(_label(model)) for model in models]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        # start from a clock value after a cache flush, like pricing does, so
+        # a reset never lands on a version older pages were cached under
+        for key in missing:
+            cache.add(key, time.time_ns(), None)
+        found.update(cache.get_many(missing))
+    return ".".join(str(found[key]) for key in keys)
+
+
+def _bump(labels):
+    cache = _cache()
+    for label in labels:
+        key = VERSION_KEY.format(label)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def changed(*models):
+    """Invalidate everything cached from ``models``."""
+    labels = [_label(model) for model in models]
+    _bump(labels)
+    if connections[WRITE_ALIAS].in_atomic_block:
+        # a page rendered between this bump and the commit still read the old
+        # rows, under the new version; bumping again on commit drops it
+        transaction.on_commit(lambda: _bump(labels), using=WRITE_ALIAS)
+
+
+class CacheCounters:
+    """Hits and misses per cached name, kept in this worker's memory."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hits = Counter()
+        self._misses = Counter()
+
+    def record(self, name, hit):
+        with self._lock:
+            (self._hits if hit else self._misses)[name] += 1
+
+    def reset(self):
+        with self._lock:
+            self._hits.clear()
+            self._misses.clear()
+
+    def summary(self):
+        with self._lock:
+            return [
+                {
+                    "name": name,
+                    "hits": self._hits[name],
+                    "misses": self._misses[name],
+                    "hit_rate": self._hits[name] / (self._hits[name] + self._misses[name]),
+                }
+                for name in sorted(self._hits.keys() | self._misses.keys())
+            ]
+
+
+counters = CacheCounters()
+
+
+def cached(name, models, parts, compute):
+    """
+    ``compute()`` cached under ``name``, the versions of ``models`` and
+    ``parts`` (anything with a stable repr: filters, page, cursor).
+    """
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    key = f"delivery:{name}:{versions(*models)}:{digest}"
+    cache = _cache()
+    value = cache.get(key, _missing)
+    counters.record(name, hit=value is not _missing)
+    if value is _missing:
+        value = compute()
+        cache.set(key, value, settings.LIST_CACHE_TIMEOUT)
+    return value
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_caches(app_configs, **kwargs):
+    """Versions, prices, sessions and ETags go stale across workers that don't share their caches."""
+    if settings.WEB_CONCURRENCY <= 1:
+        return []
+    return [
+        checks.Error(
+            f"The '{alias}' cache is per process but WEB_CONCURRENCY is {settings.WEB_CONCURRENCY}.",
+            hint="Use a shared backend (FileBasedCache, memcached, redis) or run a single worker.",
+            id="delivery.E001",
+        )
+        for alias, config in settings.CACHES.items()
+        if config["BACKEND"] == PER_PROCESS_BACKEND
+    ]
@@ -0,0 +1,70 @@
+"""
+Cheaper repeat navigation: conditional GETs and compressed HTML.
+
+Pages wrapped in conditional() send an ETag made from the version counters
+of the models they show (caching.versions(), bumped on every write, see
+caching.py), the URL, the logged-in user, the CSRF cookie and the day. A
+browser coming back with that ETag in If-None-Match gets a 304 after one
+cache round trip, before the view runs a query or renders a template. The
+pages are marked private/no-cache so the browser always asks and shared
+caches keep out. There's no Last-Modified: the versions aren't timestamps
+and the ETag alone is enough for revalidation.
+
+A page is never answered with 304 while a flash message is waiting, or the
+message would only show on the next change.
+
+CompressTextMiddleware gzips text responses (HTML, JSON, CSV, ...) that
+clients accept it for. Other content types are already compressed (XLSX
+exports, images), and precompressed static files carry their own
+Content-Encoding.
+"""
+import hashlib
+
+from django.contrib.auth import SESSION_KEY
+from django.contrib.messages import get_messages
+from django.middleware.csrf import get_token
+from django.middleware.gzip import GZipMiddleware
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from .caching import versions
+
+
+COMPRESSED_TYPES = ("text/", "application/json", "application/javascript", "application/xml", "image/svg+xml")
+
+
+def page_etag(*models):
+    def etag(request, *args, **kwargs):
+        if len(get_messages(request)):
+            return None
+        # the session is already loaded by login_required, no query here
+        get_token(request)  # a first visit gets its CSRF secret now, so the next ETag matches
+        parts = [
+            versions(*models),
+            request.get_full_path(),
+            str(request.session.get(SESSION_KEY)),
+            request.META["CSRF_COOKIE"],
+            timezone.localdate().isoformat(),
+        ]
+        return hashlib.md5("|".join(parts).encode()).hexdigest()
+    return etag
+
+
+def conditional(*models):
+    """
+    ETag the page from the versions of ``models`` and answer 304 when the
+    browser's copy is current. Goes under login_required.
+    """
+    def decorator(view):
+        return cache_control(private=True, no_cache=True)(condition(etag_func=page_etag(*models))(view))
+    return decorator
+
+
+class CompressTextMiddleware(GZipMiddleware):
+    """GZipMiddleware for text content types only."""
+
+    def process_response(self, request, response):
+        if not response.get("Content-Type", "").startswith(COMPRESSED_TYPES):
+            return response
+        return super().process_response(request, response)
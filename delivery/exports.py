@@ -0,0 +1,202 @@
+"""
+Streaming CSV and XLSX exports.
+
+Rows come from QuerySet.iterator() over values_list() projections and are
+written out chunk by chunk, so memory stays flat however many rows there are.
+The XLSX writer streams a minimal write-only workbook (inline strings, one
+sheet) straight into a zip without any third-party dependency.
+
+Customer-entered text is made safe for spreadsheets: CSV cells that Excel
+would read as a formula get a leading quote, and XLSX strings lose the
+control characters XML can't hold.
+"""
+import csv
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.db.models import F
+
+from .models import Customer, Delivery, Transaction
+
+
+CHUNK_SIZE = 2000
+
+# text starting with one of these is a formula to Excel and friends
+_FORMULA_START = frozenset("=+-@\t\r")
+# allowed in a Python str, not in XML 1.0
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+class _Buffer:
+    """Write-only sink for ZipFile, drained after every chunk."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+EXPORTS = {
+    "deliveries": {
+        "queryset": lambda: Delivery.objects.order_by("date", "id"),
+        "header": ["Date", "Customer ID", "Customer", "Bottles Delivered", "Bottles Returned",
+                   "Total Amount", "Amount Received", "Paid"],
+        "fields": ["date", "customer_id", "customer__name", "bottles_delivered", "bottles_returned",
+                   "total_amount", "amount_received", "is_paid"],
+        "dated": True,
+    },
+    "transactions": {
+        "queryset": lambda: Transaction.objects.order_by("date", "id"),
+        "header": ["Date", "Customer ID", "Customer", "Type", "Amount", "Description"],
+        "fields": ["date", "customer_id", "customer__name", "transaction_type", "amount", "description"],
+        "dated": True,
+    },
+    "balances": {
+        "queryset": lambda: Customer.objects.annotate(net=F("balance") - F("pending_balance")).order_by("id"),
+        "header": ["Customer ID", "Name", "Phone", "Balance", "Pending Balance", "Net Balance",
+                   "Bottles At Site", "Active"],
+        "fields": ["id", "name", "phone", "balance", "pending_balance", "net", "bottles_at_site", "is_active"],
+        "dated": False,
+    },
+}
+
+
+def export_rows(kind, date_from=None, date_to=None, customer=None):
+    """Header and a lazy row iterator for one export."""
+    spec = EXPORTS[kind]
+    queryset = spec["queryset"]()
+    if spec["dated"]:
+        if date_from:
+            queryset = queryset.filter(date__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(date__lte=date_to)
+        if customer:
+            queryset = queryset.filter(customer_id=customer)
+    elif customer:
+        queryset = queryset.filter(pk=customer)
+
+    # pin the alias the router picks now, the rows are read after the view returns
+    queryset = queryset.using(queryset.db)
+    rows = queryset.values_list(*spec["fields"]).iterator(chunk_size=CHUNK_SIZE)
+    return spec["header"], rows
+
+
+def _csv_value(value):
+    if value.__class__ is str and value[:1] in _FORMULA_START:
+        return "'" + value
+    return value
+
+
+def stream_csv(header, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    batch = []
+    for row in rows:
+        batch.append(writer.writerow([_csv_value(value) for value in row]))
+        if len(batch) == CHUNK_SIZE:
+            yield "".join(batch)
+            batch = []
+    if batch:
+        yield "".join(batch)
+
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_END = "</sheetData></worksheet>"
+
+
+def _cell(value):
+    if value is None:
+        return "<c/>"
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f"<c><v>{value}</v></c>"
+    if isinstance(value, (date, datetime)):
+        value = value.isoformat()
+    text = str(value)
+    if not text.isprintable():
+        text = _XML_INVALID.sub("", text)
+    return f'<c t="inlineStr"><is><t>{escape(text)}</t></is></c>'
+
+
+def _row(values):
+    return "<row>" + "".join(_cell(v) for v in values) + "</row>"
+
+
+def stream_xlsx(header, rows, sheet_name="Export"):
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as book:
+        book.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        book.writestr("_rels/.rels", _ROOT_RELS)
+        book.writestr("xl/workbook.xml", _WORKBOOK.format(name=escape(sheet_name)))
+        book.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        yield buffer.drain()
+
+        with book.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write((_SHEET_START + _row(header)).encode())
+            batch = []
+            for row in rows:
+                batch.append(_row(row))
+                if len(batch) == CHUNK_SIZE:
+                    sheet.write("".join(batch).encode())
+                    batch = []
+                    yield buffer.drain()
+            sheet.write(("".join(batch) + _SHEET_END).encode())
+    yield buffer.drain()
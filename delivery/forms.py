@@ -1,7 +1,43 @@
 from django import forms
+from django.urls import reverse_lazy
+
 from .models import Customer, Delivery, Transaction, BottlePrice
 
 
+class CustomerPicker(forms.Select):
+    """
+    Select that only renders the chosen customer. The rest are fetched while
+    typing from the autocomplete endpoint, so the page doesn't carry every
+    customer as an <option>.
+    """
+    template_name = "delivery/widgets/customer_picker.html"
+
+    def __init__(self, attrs=None, empty_label="---------"):
+        super().__init__({"class": "form-control customer-picker", **(attrs or {})})
+        self.empty_label = empty_label
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context["widget"]["autocomplete_url"] = reverse_lazy("customer_autocomplete")
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        # ✅ only the selected pk, never self.choices (that iterates the whole table)
+        pks = [v for v in value if str(v).isdigit()]
+        options = [self.create_option(name, "", self.empty_label, not pks, 0)]
+        for index, customer in enumerate(Customer.objects.filter(pk__in=pks), start=1):
+            options.append(self.create_option(name, customer.pk, str(customer), True, index))
+        return [(None, options, 0)]
+
+
+class CustomerChoiceField(forms.ModelChoiceField):
+    widget = CustomerPicker
+
+    def __init__(self, **kwargs):
+        # to_python() looks up the one posted pk, the queryset is never listed
+        super().__init__(queryset=Customer.objects.all(), **kwargs)
+
+
 class CustomerForm(forms.ModelForm):
     class Meta:
         model = Customer
@@ -9,10 +45,7 @@ class CustomerForm(forms.ModelForm):
 
 
 class DeliveryForm(forms.ModelForm):
-    customer = forms.ModelChoiceField(
-        queryset=Customer.objects.all(),
-        widget=forms.Select(attrs={"class": "form-control searchable-select"})
-    )
+    customer = CustomerChoiceField()
 
     date = forms.DateField(
         required=False,  # user can leave it empty -> auto-fills with today
@@ -36,6 +69,8 @@ class DeliveryForm(forms.ModelForm):
 
 
 class TransactionForm(forms.ModelForm):
+    customer = CustomerChoiceField()
+
     class Meta:
         model = Transaction
         fields = ["customer", "amount", "transaction_type", "description"]
@@ -57,3 +92,54 @@ class BottleUpdateForm(forms.ModelForm):
     class Meta:
         model = Customer
         fields = ["bottles_at_site"]
+
+
+class DeliveryImportForm(forms.Form):
+    file = forms.FileField(
+        help_text="CSV or JSONL with customer, date, bottles_delivered, bottles_returned, amount_received",
+        widget=forms.ClearableFileInput(attrs={"class": "form-control", "accept": ".csv,.jsonl,.json"}),
+    )
+
+
+class DateRangeFilterForm(forms.Form):
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={"class": "form-control", "type": "date"}))
+    date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={"class": "form-control", "type": "date"}))
+    # a pk rather than CustomerChoiceField: an unknown customer filters to nothing
+    # instead of invalidating the form and dropping every filter
+    customer = forms.IntegerField(required=False, widget=CustomerPicker(empty_label="All customers"))
+
+    def filter(self, queryset, date_field="date"):
+        """Apply whatever filters are valid, ignore the rest."""
+        if not self.is_valid():
+            return queryset
+        data = self.cleaned_data
+        if data["date_from"]:
+            queryset = queryset.filter(**{f"{date_field}__gte": data["date_from"]})
+        if data["date_to"]:
+            queryset = queryset.filter(**{f"{date_field}__lte": data["date_to"]})
+        if data["customer"]:
+            queryset = queryset.filter(customer_id=data["customer"])
+        return queryset
+
+
+class TransactionFilterForm(DateRangeFilterForm):
+    transaction_type = forms.ChoiceField(
+        required=False,
+        choices=[("", "All types")] + Transaction.TRANSACTION_TYPES,
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+    amount_min = forms.DecimalField(required=False, widget=forms.NumberInput(attrs={"class": "form-control", "step": "0.01"}))
+    amount_max = forms.DecimalField(required=False, widget=forms.NumberInput(attrs={"class": "form-control", "step": "0.01"}))
+
+    def filter(self, queryset, date_field="date"):
+        queryset = super().filter(queryset, date_field)
+        if not self.is_valid():
+            return queryset
+        data = self.cleaned_data
+        if data["transaction_type"]:
+            queryset = queryset.filter(transaction_type=data["transaction_type"])
+        if data["amount_min"] is not None:
+            queryset = queryset.filter(amount__gte=data["amount_min"])
+        if data["amount_max"] is not None:
+            queryset = queryset.filter(amount__lte=data["amount_max"])
+        return queryset
@@ -0,0 +1,218 @@
+import csv
+import io
+import json
+import time
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+
+from .caching import changed
+from .models import Customer, Delivery, Transaction
+from .posting import apply_in_memory, delivery_effects
+from .pricing import price_on
+
+
+CHUNK_SIZE = 500
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.errors = []  # (line number, message)
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        if not self.seconds:
+            return 0.0
+        return self.imported / self.seconds
+
+
+def read_rows(stream, fmt="csv"):
+    """Yield (line_no, dict) lazily from a CSV or JSONL text stream."""
+    if fmt == "jsonl":
+        for line_no, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except ValueError:
+                yield line_no, None
+    else:
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+
+
+def _parse_row(row):
+    """Turn a raw row into clean values, raises ValueError with a readable message."""
+    if not isinstance(row, dict):
+        raise ValueError("Row is not valid JSON")
+
+    try:
+        customer_id = int(row.get("customer"))
+    except (TypeError, ValueError):
+        raise ValueError("customer must be a customer id")
+
+    raw_date = str(row.get("date") or "").strip()
+    try:
+        row_date = date.fromisoformat(raw_date) if raw_date else None
+    except ValueError:
+        raise ValueError(f"Invalid date {raw_date!r}, expected YYYY-MM-DD")
+
+    try:
+        delivered = int(row.get("bottles_delivered") or 0)
+        returned = int(row.get("bottles_returned") or 0)
+    except (TypeError, ValueError):
+        raise ValueError("bottle counts must be whole numbers")
+    if delivered < 0 or returned < 0:
+        raise ValueError("bottle counts can't be negative")
+
+    try:
+        received = Decimal(str(row.get("amount_received") or 0))
+        total = row.get("total_amount")
+        total = Decimal(str(total)) if total not in (None, "") else None
+    except InvalidOperation:
+        raise ValueError("amounts must be numbers")
+
+    return {
+        "customer_id": customer_id,
+        "date": row_date,
+        "bottles_delivered": delivered,
+        "bottles_returned": returned,
+        "amount_received": received,
+        "total_amount": total,
+    }
+
+
+def _post_chunk(rows, result):
+    customers = Customer.objects.in_bulk({r["customer_id"] for _, r in rows})
+
+    deliveries = []
+    transactions = []
+    touched = {}
+    for line_no, r in rows:
+        customer = customers.get(r["customer_id"])
+        if customer is None:
+            result.errors.append((line_no, f"Customer {r['customer_id']} does not exist"))
+            continue
+
+        delivery_date = r["date"] or date.today()
+        delivery = Delivery(
+            customer=customer,
+            date=delivery_date,
+            bottles_delivered=r["bottles_delivered"],
+            bottles_returned=r["bottles_returned"],
+            amount_received=r["amount_received"],
+            total_amount=(
+                r["total_amount"] if r["total_amount"] is not None
+                else r["bottles_delivered"] * price_on(delivery_date)
+            ),
+        )
+
+        # Same effects as post_delivery(), applied to the in-memory customer
+        delivery.is_paid, transaction_type, description, net = delivery_effects(delivery)
+        apply_in_memory(customer, net, delivery.bottles_delivered - delivery.bottles_returned)
+
+        transactions.append(Transaction(
+            customer=customer,
+            delivery=delivery,
+            amount=delivery.amount_received,
+            transaction_type=transaction_type,
+            description=description,
+            date=delivery.date,
+        ))
+        deliveries.append(delivery)
+        touched[customer.pk] = customer
+
+    if not deliveries:
+        return deliveries
+
+    now = timezone.now()
+    for customer in touched.values():
+        customer.updated_at = now
+
+    # deliveries first so the transactions can point at their new pks
+    Delivery.objects.bulk_create(deliveries)
+    Transaction.objects.bulk_create(transactions)
+    Customer.objects.bulk_update(
+        touched.values(),
+        ["balance", "pending_balance", "bottles_at_site", "updated_at"],
+    )
+    changed(Delivery, Transaction, Customer)
+    result.imported += len(deliveries)
+    return deliveries
+
+
+def import_deliveries(stream, fmt="csv", chunk_size=CHUNK_SIZE):
+    """
+    Post deliveries from a CSV/JSONL stream in chunks.
+
+    Each chunk is one database transaction with a handful of bulk queries,
+    instead of the queries per row that post_delivery() needs. Invalid rows
+    are skipped and reported, the rest of the chunk still gets posted.
+    """
+    result = ImportResult()
+    started = time.perf_counter()
+
+    rows = read_rows(stream, fmt)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+
+        valid = []
+        for line_no, row in chunk:
+            result.rows += 1
+            try:
+                valid.append((line_no, _parse_row(row)))
+            except ValueError as exc:
+                result.errors.append((line_no, str(exc)))
+
+        with transaction.atomic():
+            _post_chunk(valid, result)
+
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def post_rows(numbered_rows):
+    """
+    Post (number, row) pairs, rows as _parse_row() returns them, inside the
+    caller's transaction.
+
+    Returns ({number: delivery}, errors). Rows for customers that don't exist
+    are skipped and reported as (number, message).
+    """
+    result = ImportResult()
+    deliveries = _post_chunk(numbered_rows, result)
+    failed = {number for number, _ in result.errors}
+    posted = [number for number, _ in numbered_rows if number not in failed]
+    return dict(zip(posted, deliveries)), result.errors
+
+
+def post_batch(rows):
+    """
+    Post already validated rows all or nothing.
+
+    Returns (deliveries, errors) with errors as (index, message). If any row
+    fails nothing is written.
+    """
+    with transaction.atomic():
+        posted, errors = post_rows(list(enumerate(rows)))
+        if errors:
+            transaction.set_rollback(True)
+            return [], errors
+    return list(posted.values()), []
+
+
+def import_uploaded_file(uploaded, chunk_size=CHUNK_SIZE):
+    """Import an UploadedFile, format is picked from the file extension."""
+    fmt = "jsonl" if uploaded.name.lower().endswith((".jsonl", ".json")) else "csv"
+    stream = io.TextIOWrapper(uploaded.file, encoding="utf-8-sig", newline="")
+    return import_deliveries(stream, fmt=fmt, chunk_size=chunk_size)
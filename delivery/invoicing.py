@@ -0,0 +1,275 @@
+"""
+Month-end statements for every active customer.
+
+The month is read in five grouped queries (customers with their month-end
+bottles, opening balances from transactions and from deliveries, the month's
+deliveries and the month's transactions), the per-customer statements are
+built in memory, and rendering and writing the files is spread over a
+process pool; workers never touch the database.
+
+Output goes to <STATEMENTS_DIR>/<YYYY-MM>/, one .html and one .txt per
+customer plus index.html and index.csv. Each file is written to a temporary
+name and renamed, so a statement whose .html exists is complete; a rerun
+skips those and only renders what an interrupted run didn't get to.
+
+Amounts follow statements.py: deliveries charge their total, credit types
+(payments, advances, partials) credit, anything else charges. Balances are
+net, positive meaning the customer is in advance.
+"""
+import csv
+import io
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, F, Q, Sum, When
+from django.template.loader import render_to_string
+from django.utils.text import slugify
+
+from .bottles import bottles_as_of
+from .models import Customer, Delivery, Transaction
+from .posting import CREDIT_TYPES, ZERO
+
+
+@dataclass
+class StatementRun:
+    directory: Path
+    customers: int
+    rendered: int
+    skipped: int
+    gather_seconds: float
+    render_seconds: float
+
+    @property
+    def per_second(self):
+        return self.rendered / self.render_seconds if self.render_seconds else 0.0
+
+
+def month_bounds(day):
+    """First and last day of ``day``'s month."""
+    start = day.replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return start, end
+
+
+def month_directory(start, root=None):
+    return Path(root or settings.STATEMENTS_DIR) / start.strftime("%Y-%m")
+
+
+def _by_customer(rows):
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[row[0]].append(row[1:])
+    return grouped
+
+
+def gather_month(start, end, customer_ids=None):
+    """Every active customer's statement for start..end, built from five queries."""
+    customers = Customer.objects.filter(is_active=True)
+    if customer_ids:
+        customers = customers.filter(pk__in=customer_ids)
+    customers = customers.annotate(bottles_closing=bottles_as_of(end)).order_by("id").values(
+        "id", "name", "phone", "address", "bottles_closing",
+    )
+
+    signed = Case(When(transaction_type__in=CREDIT_TYPES, then=F("amount")), default=-F("amount"))
+    credited = dict(
+        # undated transactions sort before everything, like on the statement page
+        Transaction.objects.filter(Q(date__lt=start) | Q(date__isnull=True))
+        .values("customer_id").annotate(net=Sum(signed)).values_list("customer_id", "net")
+    )
+    charged = dict(
+        Delivery.objects.filter(date__lt=start)
+        .values("customer_id").annotate(total=Sum("total_amount")).values_list("customer_id", "total")
+    )
+    deliveries = _by_customer(
+        Delivery.objects.filter(date__range=(start, end)).order_by("customer_id", "date", "id").values_list(
+            "customer_id", "id", "date", "bottles_delivered", "bottles_returned", "total_amount",
+        )
+    )
+    transactions = _by_customer(
+        Transaction.objects.filter(date__range=(start, end)).order_by("customer_id", "date", "id").values_list(
+            "customer_id", "id", "date", "transaction_type", "amount", "description",
+        )
+    )
+
+    return [
+        build_statement(
+            customer, start, end,
+            (credited.get(customer["id"]) or ZERO) - (charged.get(customer["id"]) or ZERO),
+            deliveries.get(customer["id"], []),
+            transactions.get(customer["id"], []),
+        )
+        for customer in customers
+    ]
+
+
+def build_statement(customer, start, end, opening, deliveries, transactions):
+    lines = []
+    for pk, day, delivered, returned, total in deliveries:
+        lines.append(((day, 0, pk), {
+            "date": day, "entry": "delivery", "bottles_delivered": delivered, "bottles_returned": returned,
+            "charge": total, "credit": None, "description": "",
+        }))
+    for pk, day, kind, amount, description in transactions:
+        credit = kind in CREDIT_TYPES
+        lines.append(((day, 1, pk), {
+            "date": day, "entry": kind, "bottles_delivered": None, "bottles_returned": None,
+            "charge": None if credit else amount, "credit": amount if credit else None,
+            "description": description or "",
+        }))
+    lines = [line for _, line in sorted(lines, key=lambda pair: pair[0])]
+
+    balance = opening = Decimal(opening).quantize(Decimal("0.01"))
+    for line in lines:
+        balance += (line["credit"] or ZERO) - (line["charge"] or ZERO)
+        line["balance"] = balance
+
+    delivered = sum(line["bottles_delivered"] or 0 for line in lines)
+    returned = sum(line["bottles_returned"] or 0 for line in lines)
+    bottles_closing = customer["bottles_closing"] or 0
+    return {
+        "customer": customer,
+        "filename": f"{customer['id']:06d}-{slugify(customer['name'])[:40] or 'customer'}",
+        "start": start,
+        "end": end,
+        "opening": opening,
+        "closing": balance,
+        "charges": sum((line["charge"] or ZERO for line in lines), ZERO),
+        "credits": sum((line["credit"] or ZERO for line in lines), ZERO),
+        "delivered": delivered,
+        "returned": returned,
+        "bottles_opening": bottles_closing - (delivered - returned),
+        "bottles_closing": bottles_closing,
+        "lines": lines,
+    }
+
+
+def render_text(statement):
+    customer = statement["customer"]
+    out = io.StringIO()
+    out.write(f"Statement for {customer['name']} (#{customer['id']})\n")
+    if customer["phone"]:
+        out.write(f"Phone: {customer['phone']}\n")
+    out.write(f"Period: {statement['start']} to {statement['end']}\n\n")
+    out.write(f"Opening balance: {statement['opening']}\n")
+    out.write(f"{'Date':10}  {'Entry':10}  {'Del':>4}  {'Ret':>4}  {'Charge':>10}  {'Credit':>10}  {'Balance':>11}\n")
+    for line in statement["lines"]:
+        out.write(
+            f"{line['date'].isoformat():10}  {line['entry']:10}  "
+            f"{'' if line['bottles_delivered'] is None else line['bottles_delivered']:>4}  "
+            f"{'' if line['bottles_returned'] is None else line['bottles_returned']:>4}  "
+            f"{'' if line['charge'] is None else line['charge']:>10}  "
+            f"{'' if line['credit'] is None else line['credit']:>10}  {line['balance']:>11}\n"
+        )
+    out.write(f"\nCharges: {statement['charges']}  Credits: {statement['credits']}\n")
+    out.write(f"Closing balance: {statement['closing']}\n")
+    out.write(
+        f"Bottles at site: {statement['bottles_opening']} -> {statement['bottles_closing']} "
+        f"(delivered {statement['delivered']}, returned {statement['returned']})\n"
+    )
+    return out.getvalue()
+
+
+def _write(path, content):
+    partial = path.with_name(path.name + ".part")
+    partial.write_text(content, encoding="utf-8")
+    os.replace(partial, path)
+
+
+def write_statement(statement, directory):
+    """Render one statement to <filename>.txt and .html, the .html last."""
+    base = Path(directory) / statement["filename"]
+    _write(base.with_name(base.name + ".txt"), render_text(statement))
+    _write(
+        base.with_name(base.name + ".html"),
+        render_to_string("delivery/statement_month.html", {"statement": statement}),
+    )
+    return statement["customer"]["id"]
+
+
+def _write_job(job):
+    return write_statement(*job)
+
+
+def is_written(statement, directory):
+    return (Path(directory) / f"{statement['filename']}.html").exists()
+
+
+def write_index(statements, directory):
+    summary = [
+        {
+            "id": s["customer"]["id"],
+            "name": s["customer"]["name"],
+            "opening": s["opening"],
+            "closing": s["closing"],
+            "bottles_closing": s["bottles_closing"],
+            "filename": s["filename"],
+        }
+        for s in statements
+    ]
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["customer_id", "name", "opening_balance", "closing_balance", "bottles_at_site", "html", "txt"])
+    for row in summary:
+        writer.writerow([
+            row["id"], row["name"], row["opening"], row["closing"], row["bottles_closing"],
+            f"{row['filename']}.html", f"{row['filename']}.txt",
+        ])
+    _write(Path(directory) / "index.csv", out.getvalue())
+    start, end = (statements[0]["start"], statements[0]["end"]) if statements else (None, None)
+    _write(Path(directory) / "index.html", render_to_string("delivery/statement_index.html", {
+        "start": start, "end": end, "statements": summary,
+    }))
+
+
+def generate_statements(day, root=None, workers=None, force=False, customer_ids=None, progress=None):
+    """
+    Write the statements for ``day``'s month, skipping customers already
+    written unless ``force``. ``progress(done, total)`` is called as files land.
+    """
+    start, end = month_bounds(day)
+    directory = month_directory(start, root)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    started = time.perf_counter()
+    statements = gather_month(start, end, customer_ids)
+    gathered = time.perf_counter()
+
+    pending = [s for s in statements if force or not is_written(s, directory)]
+    workers = workers or os.cpu_count() or 1
+    jobs = [(statement, directory) for statement in pending]
+    done = 0
+    if workers > 1 and len(jobs) > 1:
+        # workers get a copy of this process, don't hand them open SQLite handles
+        connections.close_all()
+        chunksize = max(1, len(jobs) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+            for _ in pool.map(_write_job, jobs, chunksize=chunksize):
+                done += 1
+                if progress:
+                    progress(done, len(jobs))
+    else:
+        for job in jobs:
+            _write_job(job)
+            done += 1
+            if progress:
+                progress(done, len(jobs))
+
+    write_index(statements, directory)
+    return StatementRun(
+        directory=directory,
+        customers=len(statements),
+        rendered=len(pending),
+        skipped=len(statements) - len(pending),
+        gather_seconds=gathered - started,
+        render_seconds=time.perf_counter() - gathered,
+    )
@@ -0,0 +1,164 @@
+"""
+The append-only ledger and historical balances.
+
+Deliveries and transactions write LedgerEntry rows through SQLite triggers
+(migration 0018), so every write path, including bulk import, admin and
+cascaded deletes, is recorded without extra round trips from posting. A
+delivery charges its total and moves bottles, a transaction credits or
+charges its amount like statements.py signs it, and an edit or delete posts
+a reversing entry. Manual edits of a customer's counters are adjustment
+entries, recorded by Customer.save() (models.py).
+
+"What did customer X owe on date D" is the closing LedgerSnapshot of the
+last closed month before D plus the entries from then up to D: one
+snapshot lookup and a sum over at most the unclosed months' entries.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import connections, router, transaction
+from django.db.models import Max, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import LedgerEntry, LedgerSnapshot
+from .posting import CREDIT_TYPES, ZERO
+from .statements import NO_DATE, _as_date, _money  # undated transactions come first, like on the statement
+
+
+def _month_start(day):
+    return day.replace(day=1)
+
+
+def _next_month(month):
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def balance_on(customer_id, day):
+    """
+    (net balance, bottles at site) at the end of ``day``: the last closing
+    snapshot before ``day``'s month plus the entries since, two indexed queries.
+    Raw SQL like statements.py, the ORM costs more than the lookups here.
+    """
+    start = _month_start(day)
+    with connections[router.db_for_read(LedgerEntry)].cursor() as cursor:
+        cursor.execute(
+            "SELECT month, balance, bottles FROM delivery_ledgersnapshot "
+            "WHERE customer_id = %s AND month < %s ORDER BY month DESC LIMIT 1",
+            [customer_id, start],
+        )
+        month, balance, bottles = cursor.fetchone() or (None, 0, 0)
+        since = _next_month(_as_date(month)) if month else NO_DATE
+        cursor.execute(
+            "SELECT SUM(amount), SUM(bottles) FROM delivery_ledgerentry "
+            "WHERE customer_id = %s AND date >= %s AND date <= %s",
+            [customer_id, since, day],
+        )
+        amount, moved = cursor.fetchone()
+    return _money(balance) + _money(amount), bottles + (moved or 0)
+
+
+def record_adjustment(customer, net_delta, bottles_delta, description="Manual edit"):
+    """Ledger entry for a counter change that didn't come from a delivery or transaction."""
+    if not net_delta and not bottles_delta:
+        return None
+    return LedgerEntry.objects.create(
+        customer_id=customer.pk, date=timezone.localdate(), amount=net_delta, bottles=bottles_delta,
+        source="adjustment", source_id=customer.pk, description=description,
+    )
+
+
+def signed_amount(amount, transaction_type):
+    return amount if transaction_type in CREDIT_TYPES else -amount
+
+
+def close_months(through=None, entry_model=LedgerEntry, snapshot_model=LedgerSnapshot):
+    """
+    Write snapshots for every month after the last closed one up to
+    ``through`` (default: last month), only for customers with entries in it.
+    Returns the number of snapshots written.
+    """
+    through = _month_start(through or _month_start(timezone.localdate()) - timedelta(days=1))
+    with transaction.atomic():
+        last_closed = snapshot_model.objects.aggregate(last=Max("month"))["last"]
+        entries = entry_model.objects.filter(date__lt=_next_month(through))
+        if last_closed:
+            entries = entries.filter(date__gte=_next_month(last_closed))
+
+        latest = snapshot_model.objects.filter(
+            month=Subquery(
+                snapshot_model.objects.filter(customer_id=OuterRef("customer_id"))
+                .order_by("-month").values("month")[:1]
+            )
+        )
+        running = defaultdict(lambda: [ZERO, 0])
+        for customer_id, balance, bottles in latest.values_list("customer_id", "balance", "bottles"):
+            running[customer_id] = [balance, bottles]
+
+        monthly = (
+            entries.annotate(month=TruncMonth("date")).values("customer_id", "month")
+            .annotate(amount=Sum("amount"), moved=Sum("bottles")).order_by("customer_id", "month")
+        )
+        snapshots = []
+        for row in monthly.iterator(chunk_size=5000):
+            closing = running[row["customer_id"]]
+            closing[0] += row["amount"] or ZERO
+            closing[1] += row["moved"] or 0
+            snapshots.append(snapshot_model(
+                customer_id=row["customer_id"], month=row["month"], balance=closing[0], bottles=closing[1],
+            ))
+        snapshot_model.objects.bulk_create(snapshots, batch_size=500)
+    return len(snapshots)
+
+
+def rebuild_snapshots(through=None):
+    with transaction.atomic():
+        LedgerSnapshot.objects.all().delete()
+        return close_months(through)
+
+
+def replay_history(entry_model, delivery_model, transaction_model, customer_model):
+    """
+    Seed the ledger from existing deliveries and transactions, for the data
+    migration: two INSERT ... SELECTs, the rows never come through Python.
+    Whatever the customers' counters hold beyond that history (opening
+    balances, manual edits, deleted transactions) becomes one adjustment per
+    customer dated when the customer was created, so the ledger starts out
+    agreeing with the counters.
+    """
+    entries = entry_model._meta.db_table
+    columns = "customer_id, date, amount, bottles, source, source_id, is_reversal, description, created_at"
+    credit_types = sorted(CREDIT_TYPES)
+    connection = connections[router.db_for_write(entry_model)]
+    no_date = connection.ops.adapt_datefield_value(NO_DATE)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {entries} ({columns}) "
+            f"SELECT customer_id, COALESCE(date, %s), -total_amount, bottles_delivered - bottles_returned, "
+            f"'delivery', id, %s, '', %s FROM {delivery_model._meta.db_table} ORDER BY id",
+            [no_date, False, now],
+        )
+        cursor.execute(
+            f"INSERT INTO {entries} ({columns}) "
+            f"SELECT customer_id, COALESCE(date, %s), "
+            f"CASE WHEN transaction_type IN ({', '.join(['%s'] * len(credit_types))}) THEN amount ELSE -amount END, "
+            f"0, 'transaction', id, %s, transaction_type, %s FROM {transaction_model._meta.db_table} ORDER BY id",
+            [no_date, *credit_types, False, now],
+        )
+
+    replayed = {
+        row["customer_id"]: (row["amount"], row["moved"])
+        for row in entry_model.objects.values("customer_id").annotate(amount=Sum("amount"), moved=Sum("bottles"))
+    }
+    counters = customer_model.objects.values_list("id", "balance", "pending_balance", "bottles_at_site", "created_at")
+    adjustments = []
+    for pk, balance, pending, bottles, created_at in counters.iterator(chunk_size=5000):
+        amount, moved = replayed.get(pk, (ZERO, 0))
+        net_delta = balance - pending - amount
+        if net_delta or bottles - moved:
+            adjustments.append(entry_model(
+                customer_id=pk, date=timezone.localdate(created_at), amount=net_delta, bottles=bottles - moved,
+                source="adjustment", source_id=pk, description="Opening balance",
+            ))
+    entry_model.objects.bulk_create(adjustments, batch_size=500)
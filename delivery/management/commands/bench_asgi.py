@@ -0,0 +1,171 @@
+import os
+import shutil
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.base import VALID_KEY_CHARS
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from delivery.metrics import percentile
+
+
+ROUTES = ["/", "/customers/", "/deliveries/", "/transactions/"]
+
+# the servers run on a copy of the database, the login only ever exists there
+COPY_ALIAS = "bench-asgi-copy"
+
+SERVERS = {
+    # one worker process each, so the comparison is per process
+    "wsgi": lambda port, concurrency: [
+        "gunicorn", "oroblue_project.wsgi:application", "-k", "gthread", "-w", "1",
+        "--threads", str(concurrency), "-b", f"127.0.0.1:{port}", "--log-level", "warning",
+    ],
+    "asgi": lambda port, concurrency: [
+        "uvicorn", "oroblue_project.asgi:application", "--workers", "1",
+        "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning", "--no-access-log",
+    ],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Start the app under gunicorn (sync WSGI views) and uvicorn (async ASGI views) in turn, "
+        "hit the dashboard and list pages with concurrent clients and compare latency. "
+        "The servers run on a temporary copy of the SQLite database that holds the benchmark login."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--requests", type=int, default=200, help="Requests per route")
+        parser.add_argument("--mode", choices=SERVERS, action="append", help="Defaults to both")
+
+    def handle(self, *args, **options):
+        for mode in options["mode"] or SERVERS:
+            if shutil.which(SERVERS[mode](0, 1)[0]) is None:
+                raise CommandError(f"{SERVERS[mode](0, 1)[0]} isn't installed, see requirements.txt")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            copy = Path(tmp) / "db.sqlite3"
+            with closing(sqlite3.connect(settings.DATABASES["default"]["NAME"])) as live, \
+                    closing(sqlite3.connect(copy)) as target:
+                live.backup(target)
+            cookie = f"{settings.SESSION_COOKIE_NAME}={self.login(copy)}"
+
+            results = {}
+            for mode in options["mode"] or SERVERS:
+                results[mode] = self.run_server(mode, cookie, copy, options)
+
+        self.stdout.write(f"\n{options['concurrency']} concurrent clients, {options['requests']} requests per route")
+        for route in ROUTES:
+            for mode, routes in results.items():
+                timings, seconds, errors = routes[route]
+                self.stdout.write(
+                    f"  {route:15} {mode}  p50 {statistics.median(timings):8.1f} ms  "
+                    f"p95 {percentile(timings, 95):8.1f} ms  {len(timings) / seconds:7.1f} req/s"
+                    + (f"  {errors} errors" if errors else "")
+                )
+
+    def login(self, copy):
+        """A user and a session in the copy, returns the session key."""
+        connections.settings[COPY_ALIAS] = {**connections.settings["default"], "NAME": str(copy)}
+        try:
+            user = User.objects.db_manager(COPY_ALIAS).create_user("bench-asgi-runner")
+            session = Session.objects.using(COPY_ALIAS).create(
+                session_key=get_random_string(32, VALID_KEY_CHARS),
+                session_data=SessionStore().encode({
+                    "_auth_user_id": str(user.pk),
+                    "_auth_user_backend": "django.contrib.auth.backends.ModelBackend",
+                    "_auth_user_hash": user.get_session_auth_hash(),
+                }),
+                expire_date=timezone.now() + timedelta(seconds=settings.SESSION_COOKIE_AGE),
+            )
+        finally:
+            connections[COPY_ALIAS].close()
+            del connections[COPY_ALIAS]
+            del connections.settings[COPY_ALIAS]
+        return session.session_key
+
+    def run_server(self, mode, cookie, copy, options):
+        port = free_port()
+        env = {**os.environ, "ASYNC_VIEWS": "1" if mode == "asgi" else "0", "SQLITE_PATH": str(copy)}
+        server = subprocess.Popen(
+            SERVERS[mode](port, options["concurrency"]), env=env, cwd=settings.BASE_DIR,
+            stdout=subprocess.DEVNULL, stderr=sys.stderr,
+        )
+        base = f"http://127.0.0.1:{port}"
+        try:
+            self.wait_until_up(base, server)
+            routes = {}
+            for route in ROUTES:
+                # warm-up: connections, templates, price table
+                for _ in range(options["concurrency"]):
+                    self.fetch(base + route, cookie)
+                routes[route] = self.load(base + route, cookie, options["concurrency"], options["requests"])
+                self.stdout.write(f"{mode} {route} done")
+            return routes
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+
+    def wait_until_up(self, base, server):
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError("Server exited during startup")
+            try:
+                with socket.create_connection(("127.0.0.1", int(base.rsplit(":", 1)[1])), timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError("Server didn't start within 30s")
+
+    def fetch(self, url, cookie):
+        request = urllib.request.Request(url, headers={"Cookie": cookie})
+        started = time.perf_counter()
+        with urllib.request.urlopen(request, timeout=60) as response:
+            response.read()
+            if response.status != 200 or response.url != url:
+                raise RuntimeError(f"{url} answered {response.status} at {response.url}")
+        return (time.perf_counter() - started) * 1000
+
+    def load(self, url, cookie, concurrency, count):
+        errors = 0
+
+        def one(_):
+            nonlocal errors
+            try:
+                return self.fetch(url, cookie)
+            except Exception:
+                errors += 1
+                return None
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            timings = [t for t in pool.map(one, range(count)) if t is not None]
+        seconds = time.perf_counter() - started
+        if not timings:
+            raise CommandError(f"Every request to {url} failed")
+        return sorted(timings), seconds, errors
@@ -0,0 +1,93 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from auth_user.middleware import users
+
+
+STOCK_MIDDLEWARE = [
+    "django.contrib.auth.middleware.AuthenticationMiddleware"
+    if path == "auth_user.middleware.CachedAuthenticationMiddleware" else path
+    for path in settings.MIDDLEWARE
+]
+
+# The run gets caches of its own: clearing the deployment's sessions cache
+# would drop every live session's changes that aren't written behind yet.
+BENCH_CACHES = {
+    alias: {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": f"bench-auth-{alias}"}
+    for alias in settings.CACHES
+}
+
+SETUPS = {
+    "stock": {"SESSION_ENGINE": "django.contrib.sessions.backends.db", "MIDDLEWARE": STOCK_MIDDLEWARE},
+    "cached": {},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Queries and latency per authenticated request with database sessions and the stock "
+        "AuthenticationMiddleware against the cached session engine and user cache, plus the "
+        "cost of a throttled login attempt. Runs on private caches and is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--url", default="route_sheet", help="URL name of a page to request")
+
+    def handle(self, *args, **options):
+        path = reverse(options["url"])
+        with override_settings(CACHES=BENCH_CACHES), transaction.atomic():
+            user = User.objects.create_user("bench-auth-runner", password="benchmark")
+            for name, overrides in SETUPS.items():
+                with override_settings(**overrides):
+                    queries, auth_queries, timings = self.measure(user, path, options["requests"])
+                self.stdout.write(
+                    f"{name:7} {queries:5.2f} queries/request ({auth_queries:.2f} session/user), "
+                    f"p50 {statistics.median(timings):6.2f} ms"
+                )
+            self.stdout.write(self.throttled_login())
+            transaction.set_rollback(True)
+
+    def measure(self, user, path, requests):
+        caches[settings.SESSION_CACHE_ALIAS].clear()
+        users.clear()
+        client = Client(HTTP_HOST="localhost")
+        client.force_login(user)
+        client.get(path)  # warm-up: templates, first cache fill
+
+        queries, auth_queries, timings = 0, 0, []
+        for _ in range(requests):
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                client.get(path)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries += len(ctx)
+            auth_queries += sum(
+                1 for query in ctx.captured_queries
+                if '"django_session"' in query["sql"] or '"auth_user"' in query["sql"]
+            )
+        return queries / requests, auth_queries / requests, timings
+
+    def throttled_login(self):
+        client = Client(HTTP_HOST="localhost")
+        url = reverse("login_pg")
+        timings = []
+        for _ in range(settings.LOGIN_MAX_ATTEMPTS + 5):
+            started = time.perf_counter()
+            response = client.post(url, {"username": "bench-auth-runner", "password": "wrong"})
+            timings.append(((time.perf_counter() - started) * 1000, response.status_code))
+        failed = [ms for ms, status in timings if status != 429]
+        refused = [ms for ms, status in timings if status == 429]
+        return (
+            f"login: {len(failed)} failed attempts at {statistics.median(failed):.1f} ms, "
+            f"then {len(refused)} refused at {statistics.median(refused):.2f} ms"
+        )
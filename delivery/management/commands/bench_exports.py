@@ -0,0 +1,50 @@
+import resource
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from delivery.exports import EXPORTS, export_rows, stream_csv, stream_xlsx
+
+
+class Command(BaseCommand):
+    help = "Stream every export in CSV and XLSX and report throughput and peak memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--kind", choices=EXPORTS, action="append", help="Defaults to all exports")
+        parser.add_argument("--format", choices=["csv", "xlsx"], action="append", help="Defaults to both")
+
+    def handle(self, *args, **options):
+        for kind in options["kind"] or EXPORTS:
+            for fmt in options["format"] or ["csv", "xlsx"]:
+                header, rows = export_rows(kind)
+                counted = _Counter(rows)
+                stream = stream_xlsx(header, counted) if fmt == "xlsx" else stream_csv(header, counted)
+
+                tracemalloc.start()
+                started = time.perf_counter()
+                size = sum(len(chunk) for chunk in stream)
+                seconds = time.perf_counter() - started
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                self.stdout.write(
+                    f"{kind:13} {fmt:4} {counted.count:9} rows  {size / 1e6:8.1f} MB  "
+                    f"{counted.count / seconds if seconds else 0:9.0f} rows/s  "
+                    f"peak Python heap {peak / 1e6:6.1f} MB"
+                )
+
+        # ru_maxrss is KB on Linux
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(self.style.SUCCESS(f"Process peak RSS {rss:.1f} MB"))
+
+
+class _Counter:
+    def __init__(self, rows):
+        self.rows = rows
+        self.count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            self.count += 1
+            yield row
@@ -0,0 +1,68 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from delivery.models import Customer
+from delivery.search import normalize_phone, search_customers
+
+
+FIRST = ["Ali", "Ahmed", "Sara", "Fatima", "Usman", "Ayesha", "Bilal", "Hina", "Hamza", "Zainab"]
+LAST = ["Khan", "Malik", "Butt", "Sheikh", "Qureshi", "Chaudhry", "Raza", "Iqbal", "Hussain", "Siddiqui"]
+AREAS = ["Gulberg", "DHA", "Model Town", "Johar Town", "Bahria Town", "Cantt", "Township", "Garden Town"]
+
+
+class Command(BaseCommand):
+    help = "Time customer search against a synthetic customer table (rolled back afterwards)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--customers", type=int, default=100_000)
+        parser.add_argument("--queries", type=int, default=500)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+
+        with transaction.atomic():
+            self.stdout.write(f"Creating {options['customers']} customers...")
+            batch = []
+            for i in range(options["customers"]):
+                phone = f"03{rng.randint(0, 49):02d}-{rng.randint(0, 9_999_999):07d}"
+                batch.append(Customer(
+                    name=f"{rng.choice(FIRST)} {rng.choice(LAST)} {i}",
+                    address=f"House {rng.randint(1, 999)}, {rng.choice(AREAS)}",
+                    phone=phone,
+                    phone_digits=normalize_phone(phone),
+                    phone_reversed=normalize_phone(phone)[::-1],
+                ))
+                if len(batch) == 5000:
+                    Customer.objects.bulk_create(batch)
+                    batch = []
+            Customer.objects.bulk_create(batch)
+
+            queries = []
+            for _ in range(options["queries"]):
+                kind = rng.random()
+                if kind < 0.4:
+                    queries.append(rng.choice(FIRST)[:rng.randint(2, 5)])
+                elif kind < 0.7:
+                    queries.append(f"{rng.choice(FIRST)} {rng.choice(LAST)[:3]}")
+                else:
+                    queries.append(f"03{rng.randint(0, 49):02d}-{rng.randint(0, 999)}")
+
+            timings = []
+            for query in queries:
+                started = time.perf_counter()
+                search_customers(query)
+                timings.append((time.perf_counter() - started) * 1000)
+
+            transaction.set_rollback(True)
+
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(timings)} searches: median {statistics.median(timings):.2f} ms, "
+            f"p95 {p95:.2f} ms, max {timings[-1]:.2f} ms"
+        ))
@@ -0,0 +1,18 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from delivery.ledger import close_months, rebuild_snapshots
+
+
+class Command(BaseCommand):
+    help = "Write month-end ledger snapshots for every month not closed yet, through last month."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--through", type=date.fromisoformat, help="Close up to this date's month (YYYY-MM-DD)")
+        parser.add_argument("--rebuild", action="store_true", help="Drop all snapshots and close from the start")
+
+    def handle(self, *args, **options):
+        close = rebuild_snapshots if options["rebuild"] else close_months
+        written = close(options["through"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} ledger snapshots"))
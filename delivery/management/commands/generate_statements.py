@@ -0,0 +1,46 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from delivery.invoicing import generate_statements
+
+
+class Command(BaseCommand):
+    help = (
+        "Write a month's statement for every active customer to STATEMENTS_DIR/<YYYY-MM>/ "
+        "(HTML and text, plus an index). Rerunning skips statements already written."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--month", help="YYYY-MM, defaults to last month")
+        parser.add_argument("--output", help="Root directory, defaults to settings.STATEMENTS_DIR")
+        parser.add_argument("--workers", type=int, help="Render processes, defaults to the CPU count")
+        parser.add_argument("--customer", type=int, action="append", help="Only this customer id (repeatable)")
+        parser.add_argument("--force", action="store_true", help="Rewrite statements that already exist")
+
+    def handle(self, *args, **options):
+        if options["month"]:
+            try:
+                day = date.fromisoformat(f"{options['month']}-01")
+            except ValueError:
+                raise CommandError("--month must be YYYY-MM")
+        else:
+            day = timezone.localdate().replace(day=1) - timedelta(days=1)
+
+        def progress(done, total):
+            if done == total or done % 500 == 0:
+                self.stdout.write(f"  {done}/{total} written")
+
+        run = generate_statements(
+            day, root=options["output"], workers=options["workers"], force=options["force"],
+            customer_ids=options["customer"], progress=progress,
+        )
+        self.stdout.write(
+            f"Gathered {run.customers} statements in {run.gather_seconds:.2f}s, "
+            f"skipped {run.skipped} already written"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {run.rendered} statements to {run.directory} in {run.render_seconds:.2f}s "
+            f"({run.per_second:.0f} customers/s)"
+        ))
@@ -0,0 +1,35 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from delivery.importer import CHUNK_SIZE, import_deliveries
+
+
+class Command(BaseCommand):
+    help = "Bulk import a route sheet of deliveries from a CSV or JSONL file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSONL file, use - for stdin")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file extension")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("jsonl" if path.endswith((".jsonl", ".json")) else "csv")
+
+        if path == "-":
+            result = import_deliveries(sys.stdin, fmt=fmt, chunk_size=options["chunk_size"])
+        else:
+            try:
+                with open(path, encoding="utf-8-sig", newline="") as stream:
+                    result = import_deliveries(stream, fmt=fmt, chunk_size=options["chunk_size"])
+            except OSError as exc:
+                raise CommandError(f"Can't read {path}: {exc}")
+
+        for line_no, message in result.errors:
+            self.stderr.write(f"line {line_no}: {message}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.imported}/{result.rows} rows in {result.seconds:.2f}s "
+            f"({result.rows_per_second:.0f} rows/s)"
+        ))
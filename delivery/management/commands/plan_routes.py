@@ -0,0 +1,34 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from delivery.routes import DEFAULT_DAYS, plan_routes
+
+
+class Command(BaseCommand):
+    help = (
+        "Plan delivery stops for the next days from each customer's delivery history. "
+        "Run nightly; only customers with new activity or due stops are replanned unless --full."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=DEFAULT_DAYS)
+        parser.add_argument("--from", dest="start", help="First day to plan, YYYY-MM-DD (default today)")
+        parser.add_argument("--full", action="store_true", help="Replan every customer")
+
+    def handle(self, *args, **options):
+        start = None
+        if options["start"]:
+            try:
+                start = date.fromisoformat(options["start"])
+            except ValueError:
+                raise CommandError("--from must be YYYY-MM-DD")
+        if options["days"] < 1:
+            raise CommandError("--days must be at least 1")
+
+        run = plan_routes(start, days=options["days"], full=options["full"])
+        scope = "full" if run.full else "incremental"
+        self.stdout.write(self.style.SUCCESS(
+            f"{scope} plan from {run.start} for {run.days} days: "
+            f"replanned {run.customers_planned} customers, {run.stops} stops"
+        ))
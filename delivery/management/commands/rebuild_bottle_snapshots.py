@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from delivery.bottles import rebuild_bottle_snapshots
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-customer and fleet bottle snapshots from deliveries."
+
+    def handle(self, *args, **options):
+        customer_days, fleet_days = rebuild_bottle_snapshots()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {customer_days} customer snapshots and {fleet_days} fleet snapshots"
+        ))
@@ -0,0 +1,23 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from delivery.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the DailyRollup table from deliveries and transactions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="start", help="Only rebuild days on or after YYYY-MM-DD")
+
+    def handle(self, *args, **options):
+        start = None
+        if options["start"]:
+            try:
+                start = date.fromisoformat(options["start"])
+            except ValueError:
+                raise CommandError("--from must be YYYY-MM-DD")
+
+        days = rebuild_rollups(start=start)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {days} daily rollups"))
@@ -0,0 +1,55 @@
+import csv
+
+from django.core.management.base import BaseCommand
+
+from delivery.reconcile import reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute customer balances and bottles at site from the ledger and "
+        "report drift. Checks customers with activity since the last run unless --full."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Check every customer")
+        parser.add_argument("--repair", action="store_true", help="Write the recomputed counters back")
+        parser.add_argument("--report", metavar="PATH", help="Write every drifted customer to a CSV file")
+        parser.add_argument("--top", type=int, default=10, help="Largest drifts to print")
+
+    def handle(self, *args, **options):
+        result = reconcile(full=options["full"], repair=options["repair"])
+        run, drift = result.run, result.drift
+
+        scope = "full" if run.full else "incremental"
+        self.stdout.write(f"{scope} run: checked {run.customers_checked} customers, {run.drifted} drifted")
+
+        drift.sort(key=lambda row: (abs(row.net_drift), abs(row.bottle_drift)), reverse=True)
+        for row in drift[:options["top"]]:
+            self.stdout.write(
+                f"  #{row.customer_id} {row.name}: net {row.balance - row.pending_balance} "
+                f"expected {row.expected_balance - row.expected_pending} ({row.net_drift:+}), "
+                f"bottles {row.bottles_at_site} expected {row.expected_bottles} ({row.bottle_drift:+})"
+            )
+
+        if options["report"]:
+            with open(options["report"], "w", newline="") as handle:
+                writer = csv.writer(handle)
+                writer.writerow([
+                    "customer_id", "name", "balance", "pending_balance", "bottles_at_site",
+                    "expected_balance", "expected_pending", "expected_bottles", "net_drift", "bottle_drift",
+                ])
+                for row in drift:
+                    writer.writerow([
+                        row.customer_id, row.name, row.balance, row.pending_balance, row.bottles_at_site,
+                        row.expected_balance, row.expected_pending, row.expected_bottles,
+                        row.net_drift, row.bottle_drift,
+                    ])
+            self.stdout.write(f"Drift report written to {options['report']}")
+
+        if run.repaired:
+            self.stdout.write(self.style.SUCCESS(f"Repaired {run.repaired} customers"))
+        elif drift:
+            self.stdout.write(self.style.WARNING("Run with --repair to fix them"))
+        else:
+            self.stdout.write(self.style.SUCCESS("No drift"))
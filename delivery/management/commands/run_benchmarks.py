@@ -0,0 +1,186 @@
+import json
+import platform
+import statistics
+import time
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, URLPattern, reverse
+
+from auth_user import urls as auth_urls
+from delivery import urls as delivery_urls
+from delivery.metrics import percentile
+from delivery.models import Customer, Delivery, Transaction
+
+
+# which model a <pk> in a route refers to, by URL name prefix
+PK_MODELS = {
+    "customer_": Customer,
+    "delivery_": Delivery,
+    "transaction_": Transaction,
+}
+
+# fixed kwargs for routes that take something other than a pk
+ROUTE_KWARGS = {
+    "export": {"kind": "deliveries"},
+    "monthly_statement_file": {"month": "2025-01", "filename": "index.html"},
+}
+
+
+def write_scenarios(customer, delivery):
+    """POSTs that exercise the posting paths, keyed by URL name."""
+    today = date.today().isoformat()
+    return {
+        "delivery_add": ({}, {
+            "customer": customer.pk, "bottles_delivered": 3, "bottles_returned": 2,
+            "amount_received": 150, "date": today,
+        }),
+        "delivery_edit": ({"pk": delivery.pk}, {
+            "customer": delivery.customer_id, "bottles_delivered": delivery.bottles_delivered + 1,
+            "bottles_returned": delivery.bottles_returned, "amount_received": delivery.amount_received,
+            "date": delivery.date.isoformat() if delivery.date else today,
+        }),
+        "transaction_add": ({}, {
+            "customer": customer.pk, "amount": 200, "transaction_type": "payment", "description": "benchmark",
+        }),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive every route in delivery/urls.py and auth_user/urls.py through the test client, "
+        "record latency and query counts, and write or compare a JSON baseline. "
+        "Everything runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--output", help="Write results to this JSON file")
+        parser.add_argument("--compare", help="Baseline JSON to check for regressions")
+        parser.add_argument("--tolerance", type=float, default=1.5,
+                            help="Allowed p95 slowdown factor against the baseline")
+
+    def handle(self, *args, **options):
+        customer = Customer.objects.order_by("pk").first()
+        delivery = Delivery.objects.select_related("customer").order_by("pk").first()
+        if customer is None or delivery is None:
+            raise CommandError("No data to benchmark, run manage.py seed_data first")
+
+        with transaction.atomic():
+            user = User.objects.create_superuser("benchmark-runner", password="benchmark")
+            client = Client(HTTP_HOST="localhost")
+            results = {}
+            for name, method, path, data in self.routes(customer, delivery):
+                results[name] = self.measure(client, user, method, path, data, options["iterations"])
+                self.stdout.write(
+                    f"{name:28} {method:4} p50 {results[name]['p50_ms']:8.2f} ms  "
+                    f"p95 {results[name]['p95_ms']:8.2f} ms  {results[name]['queries']:4} queries  "
+                    f"[{results[name]['status']}]"
+                )
+            transaction.set_rollback(True)
+
+        report = {
+            "meta": {
+                "date": date.today().isoformat(),
+                "python": platform.python_version(),
+                "iterations": options["iterations"],
+                "customers": Customer.objects.count(),
+                "deliveries": Delivery.objects.count(),
+                "transactions": Transaction.objects.count(),
+            },
+            "routes": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                json.dump(report, fh, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+        if options["compare"]:
+            self.compare(report, options["compare"], options["tolerance"])
+
+    def routes(self, customer, delivery):
+        """(name, method, path, data) for every named route, GETs first, then writes, logout last."""
+        samples = {
+            prefix: model.objects.order_by("pk").values_list("pk", flat=True).first()
+            for prefix, model in PK_MODELS.items()
+        }
+        gets, last = [], []
+        for pattern in delivery_urls.urlpatterns + auth_urls.urlpatterns:
+            if not isinstance(pattern, URLPattern) or not pattern.name:
+                continue
+            kwargs = dict(ROUTE_KWARGS.get(pattern.name, {}))
+            if "pk" in pattern.pattern.converters:
+                prefix = next((p for p in PK_MODELS if pattern.name.startswith(p)), None)
+                if prefix is None or samples[prefix] is None:
+                    self.stderr.write(f"Skipping {pattern.name}, no sample pk")
+                    continue
+                kwargs["pk"] = samples[prefix]
+            try:
+                route = (pattern.name, "GET", reverse(pattern.name, kwargs=kwargs), None)
+            except NoReverseMatch:
+                self.stderr.write(f"Skipping {pattern.name}, add its kwargs to ROUTE_KWARGS")
+                continue
+            (last if pattern.name == "logout_pg" else gets).append(route)
+
+        writes = [
+            (f"{name} (POST)", "POST", reverse(name, kwargs=kwargs), data)
+            for name, (kwargs, data) in write_scenarios(customer, delivery).items()
+        ]
+        return gets + writes + last
+
+    def measure(self, client, user, method, path, data, iterations):
+        timings, queries, status = [], [], None
+        for i in range(iterations + 1):
+            client.force_login(user)
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                if method == "POST":
+                    response = client.post(path, data)
+                else:
+                    response = client.get(path)
+                if response.streaming:
+                    b"".join(response.streaming_content)
+                elapsed = (time.perf_counter() - started) * 1000
+            status = response.status_code
+            if i == 0:
+                continue  # warm-up: template loading, price table, first connection
+            timings.append(elapsed)
+            queries.append(len(ctx))
+
+        timings.sort()
+        return {
+            "method": method,
+            "path": path,
+            "status": status,
+            "p50_ms": round(statistics.median(timings), 3),
+            "p95_ms": round(percentile(timings, 95), 3),
+            "max_ms": round(timings[-1], 3),
+            "queries": max(queries),
+        }
+
+    def compare(self, report, path, tolerance):
+        try:
+            with open(path) as fh:
+                baseline = json.load(fh)["routes"]
+        except (OSError, ValueError, KeyError) as exc:
+            raise CommandError(f"Can't read baseline {path}: {exc}")
+
+        regressions = []
+        for name, current in report["routes"].items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            if current["queries"] > before["queries"]:
+                regressions.append(f"{name}: {before['queries']} -> {current['queries']} queries")
+            if current["p95_ms"] > before["p95_ms"] * tolerance:
+                regressions.append(f"{name}: p95 {before['p95_ms']:.2f} -> {current['p95_ms']:.2f} ms")
+
+        if regressions:
+            for line in regressions:
+                self.stderr.write(line)
+            raise CommandError(f"{len(regressions)} regression(s) against {path}")
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {path}"))
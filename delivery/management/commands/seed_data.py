@@ -0,0 +1,180 @@
+import random
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from delivery import pricing
+from delivery.caching import changed
+from delivery.models import BottlePrice, Customer, Delivery, Transaction
+from delivery.posting import apply_in_memory, delivery_effects
+from delivery.search import normalize_phone
+
+
+FIRST = ["Ali", "Ahmed", "Sara", "Fatima", "Usman", "Ayesha", "Bilal", "Hina", "Hamza", "Zainab",
+         "Imran", "Nadia", "Kamran", "Saima", "Tariq", "Rabia", "Asad", "Mehwish", "Faisal", "Sana"]
+LAST = ["Khan", "Malik", "Butt", "Sheikh", "Qureshi", "Chaudhry", "Raza", "Iqbal", "Hussain", "Siddiqui"]
+AREAS = ["Gulberg", "DHA", "Model Town", "Johar Town", "Bahria Town", "Cantt", "Township", "Garden Town",
+         "Faisal Town", "Wapda Town", "Iqbal Town", "Valencia"]
+
+SCALES = {
+    # customers, days of history
+    "small": (500, 180),
+    "medium": (5_000, 365),
+    "large": (50_000, 730),
+}
+
+
+class Command(BaseCommand):
+    help = "Generate deterministic synthetic customers, deliveries, transactions and prices."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", choices=SCALES, default="small")
+        parser.add_argument("--customers", type=int, help="Overrides the scale's customer count")
+        parser.add_argument("--days", type=int, help="Overrides the scale's days of history")
+        parser.add_argument("--end", help="Last day of history, YYYY-MM-DD (default today)")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--batch", type=int, default=1000, help="Customers per insert batch")
+        parser.add_argument("--clear", action="store_true", help="Delete existing ledger data first")
+
+    def handle(self, *args, **options):
+        customers, days = SCALES[options["scale"]]
+        customers = options["customers"] or customers
+        days = options["days"] or days
+        try:
+            end = date.fromisoformat(options["end"]) if options["end"] else timezone.localdate()
+        except ValueError:
+            raise CommandError("--end must be YYYY-MM-DD")
+        start = end - timedelta(days=days - 1)
+        rng = random.Random(options["seed"])
+
+        if options["clear"]:
+            Transaction.objects.all().delete()
+            Delivery.objects.all().delete()
+            Customer.objects.all().delete()
+            BottlePrice.objects.all().delete()
+            changed(Customer, Delivery, Transaction)
+
+        started = time.perf_counter()
+        prices = self.create_prices(rng, start, end)
+
+        totals = {"customers": 0, "deliveries": 0, "transactions": 0}
+        for offset in range(0, customers, options["batch"]):
+            size = min(options["batch"], customers - offset)
+            with transaction.atomic():
+                counts = self.create_batch(rng, offset, size, start, end, prices)
+                changed(Customer, Delivery, Transaction)  # bulk_create, no post_save
+            for key, value in counts.items():
+                totals[key] += value
+            self.stdout.write(f"  {offset + size}/{customers} customers")
+
+        seconds = time.perf_counter() - started
+        rows = sum(totals.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {totals['customers']} customers, {totals['deliveries']} deliveries and "
+            f"{totals['transactions']} transactions in {seconds:.1f}s ({rows / seconds:.0f} rows/s)"
+        ))
+
+    def create_prices(self, rng, start, end):
+        """A price change every few months, returned as a sorted (day, price) list."""
+        history = []
+        day, price = start, Decimal(rng.choice([60, 70, 80]))
+        while day <= end:
+            history.append((day, price))
+            day += timedelta(days=rng.randint(90, 180))
+            price += Decimal(rng.choice([5, 10, 10, 20]))
+
+        for day, price in history:
+            row = BottlePrice.objects.create(price_per_bottle=price)
+            # updated_at is auto_now, back-date it so pricing sees the real history
+            BottlePrice.objects.filter(pk=row.pk).update(
+                updated_at=timezone.make_aware(datetime.combine(day, datetime.min.time()))
+            )
+        pricing.invalidate()
+        return history
+
+    def create_batch(self, rng, offset, size, start, end, prices):
+        customers = []
+        histories = []
+        for i in range(offset, offset + size):
+            phone = f"03{rng.randint(0, 49):02d}-{rng.randint(0, 9_999_999):07d}"
+            customer = Customer(
+                name=f"{rng.choice(FIRST)} {rng.choice(LAST)} {i + 1}",
+                phone=phone,
+                phone_digits=normalize_phone(phone),
+                phone_reversed=normalize_phone(phone)[::-1],
+                address=f"House {rng.randint(1, 999)}, Street {rng.randint(1, 60)}, {rng.choice(AREAS)}",
+                is_active=rng.random() > 0.05,
+            )
+            deliveries, transactions = self.simulate(rng, customer, start, end, prices)
+            customers.append(customer)
+            histories.append((deliveries, transactions))
+
+        Customer.objects.bulk_create(customers)
+
+        all_deliveries = []
+        for customer, (deliveries, _) in zip(customers, histories):
+            for delivery in deliveries:
+                delivery.customer = customer
+            all_deliveries.extend(deliveries)
+        Delivery.objects.bulk_create(all_deliveries, batch_size=2000)
+
+        all_transactions = []
+        for customer, (_, transactions) in zip(customers, histories):
+            for txn in transactions:
+                txn.customer = customer
+            all_transactions.extend(transactions)
+        Transaction.objects.bulk_create(all_transactions, batch_size=2000)
+
+        return {"customers": len(customers), "deliveries": len(all_deliveries), "transactions": len(all_transactions)}
+
+    def simulate(self, rng, customer, start, end, prices):
+        """Build a customer's deliveries and payments and leave their counters in the final state."""
+        interval = rng.choice([1, 2, 3, 3, 4, 7])
+        usual = rng.randint(1, 4)
+        habit = rng.random()
+        price_index = 0
+
+        deliveries, transactions = [], []
+        day = start + timedelta(days=rng.randint(0, interval))
+        while day <= end:
+            while price_index + 1 < len(prices) and prices[price_index + 1][0] <= day:
+                price_index += 1
+            delivered = max(usual + rng.randint(-1, 1), 1)
+            # empties usually come back one for one, sometimes one is held back
+            returned = min(max(customer.bottles_at_site, 0), delivered - rng.choice([0, 0, 0, 1]))
+            total = delivered * prices[price_index][1]
+
+            if habit < 0.7:
+                received = total
+            elif habit < 0.9:
+                received = (total * Decimal(rng.choice(["0", "0.5", "0.75"]))).quantize(Decimal("1"))
+            else:
+                received = total + Decimal(rng.choice([100, 200, 500]))
+
+            delivery = Delivery(
+                date=day, bottles_delivered=delivered, bottles_returned=returned,
+                total_amount=total, amount_received=received,
+            )
+            delivery.is_paid, transaction_type, description, net = delivery_effects(delivery)
+            apply_in_memory(customer, net, delivered - returned)
+            deliveries.append(delivery)
+            transactions.append(Transaction(
+                delivery=delivery, date=day, amount=received,
+                transaction_type=transaction_type, description=description,
+            ))
+
+            # customers who run a tab settle it now and then
+            if customer.pending_balance > 0 and rng.random() < 0.1:
+                amount = customer.pending_balance
+                transactions.append(Transaction(
+                    date=day, amount=amount, transaction_type="payment", description="Settled pending balance",
+                ))
+                apply_in_memory(customer, amount, 0)
+
+            day += timedelta(days=max(interval + rng.randint(-1, 1), 1))
+
+        return deliveries, transactions
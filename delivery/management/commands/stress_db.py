@@ -0,0 +1,158 @@
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+from django.utils import timezone
+
+from delivery.exports import export_rows
+from delivery.metrics import percentile
+from delivery.models import Customer, Delivery
+from delivery.pagination import keyset_paginate
+from delivery.posting import post_delivery
+from delivery.rollups import dashboard_totals
+from delivery.routers import READ_ALIAS, WRITE_ALIAS, replica_reads
+from delivery.sync import SyncConflict, sync_events
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer a copy of the database with concurrent delivery writers and report/list readers "
+        "and count 'database is locked' errors. --baseline runs the same load with the old "
+        "connection setup (rollback journal, deferred transactions, no read alias) for comparison."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seconds", type=float, default=10)
+        parser.add_argument("--writers", type=int, default=4)
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--baseline", action="store_true")
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        source = connections[WRITE_ALIAS].settings_dict["NAME"]
+        if connections[WRITE_ALIAS].vendor != "sqlite" or not Path(source).exists():
+            raise CommandError("stress_db needs the SQLite database file")
+        customers = list(Customer.objects.values_list("pk", flat=True)[:2000])
+        if not customers:
+            raise CommandError("No customers to post to, run manage.py seed_data first")
+
+        workdir = Path(tempfile.mkdtemp(prefix="oroblue-stress-"))
+        try:
+            self.prepare(source, workdir / "stress.sqlite3", options["baseline"])
+            results = self.run_load(customers, options)
+        finally:
+            connections.close_all()
+            shutil.rmtree(workdir, ignore_errors=True)
+        self.report(results, options)
+
+    def prepare(self, source, copy, baseline):
+        """Copy the database and point both aliases at the copy, with the old or the new settings."""
+        connections.close_all()
+        with sqlite3.connect(source) as src, sqlite3.connect(copy) as dst:
+            src.backup(dst)
+            dst.execute(f"PRAGMA journal_mode={'DELETE' if baseline else 'WAL'}")
+
+        for alias in {WRITE_ALIAS, READ_ALIAS} & set(connections.settings):
+            settings_dict = connections.settings[alias]
+            settings_dict["NAME"] = copy
+            settings_dict["CONN_MAX_AGE"] = 0 if baseline else 600
+            if baseline:
+                # what settings.py had before: Python's 5s lock timeout and nothing else
+                settings_dict["OPTIONS"] = {}
+
+    def run_load(self, customers, options):
+        results = defaultdict(lambda: {"ok": 0, "locked": 0, "timings": []})
+        lock = threading.Lock()
+        deadline = time.monotonic() + options["seconds"]
+
+        def record(kind, started, error=None):
+            with lock:
+                entry = results[kind]
+                if error is None:
+                    entry["ok"] += 1
+                    entry["timings"].append((time.perf_counter() - started) * 1000)
+                else:
+                    entry["locked"] += 1
+
+        def worker(task, seed):
+            rng = random.Random(seed)
+            try:
+                while time.monotonic() < deadline:
+                    kind, operation = task(rng)
+                    started = time.perf_counter()
+                    try:
+                        operation()
+                    except (OperationalError, SyncConflict) as exc:
+                        if "locked" not in str(exc) and not isinstance(exc, SyncConflict):
+                            raise
+                        record(kind, started, exc)
+                    else:
+                        record(kind, started)
+            finally:
+                connections.close_all()
+
+        def writer(rng):
+            customer = rng.choice(customers)
+            if rng.random() < 0.7:
+                delivered = rng.randint(1, 4)
+                return "write: delivery", lambda: post_delivery(Delivery(
+                    customer_id=customer, bottles_delivered=delivered, bottles_returned=rng.randint(0, delivered),
+                    total_amount=delivered * 100, amount_received=rng.choice([0, 100, delivered * 100]),
+                ))
+            # sync reads the known keys before it writes, the lock upgrade that deferred transactions trip on
+            events = [[uuid.uuid4().hex, customer, None, 1, 1, "100"] for _ in range(20)]
+            return "write: driver sync", lambda: sync_events(events, device="stress")
+
+        def reader(rng):
+            choice = rng.random()
+            if choice < 0.4:
+                return "read: dashboard", lambda: self.read(lambda: dashboard_totals(timezone.localdate()))
+            if choice < 0.9:
+                return "read: delivery list", lambda: self.read(
+                    lambda: list(keyset_paginate(Delivery.objects.select_related("customer")))
+                )
+            return "read: export", lambda: self.read(lambda: sum(1 for _ in export_rows("deliveries")[1]))
+
+        threads = [
+            threading.Thread(target=worker, args=(writer, options["seed"] + n))
+            for n in range(options["writers"])
+        ] + [
+            threading.Thread(target=worker, args=(reader, options["seed"] + 1000 + n))
+            for n in range(options["readers"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def read(self, query):
+        with replica_reads():
+            return query()
+
+    def report(self, results, options):
+        mode = "baseline (old settings)" if options["baseline"] else "WAL + IMMEDIATE + read alias"
+        self.stdout.write(
+            f"{mode}: {options['writers']} writers, {options['readers']} readers, {options['seconds']:.0f}s"
+        )
+        total_locked = 0
+        for kind in sorted(results):
+            entry = results[kind]
+            timings = sorted(entry["timings"])
+            total_locked += entry["locked"]
+            self.stdout.write(
+                f"  {kind:22} {entry['ok']:6} ok  {entry['locked']:5} locked  "
+                f"p50 {statistics.median(timings) if timings else 0:8.1f} ms  "
+                f"p95 {percentile(timings, 95):8.1f} ms"
+            )
+        style = self.style.SUCCESS if not total_locked else self.style.ERROR
+        self.stdout.write(style(f"'database is locked' errors: {total_locked}"))
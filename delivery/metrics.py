@@ -0,0 +1,280 @@
+"""
+Per-request query and latency instrumentation.
+
+RequestMetricsMiddleware wraps every database connection with an
+execute_wrapper for the duration of the request, then:
+
+* adds a Server-Timing header (db / render / app / total),
+* keeps per-worker latency samples per URL name for the /metrics page, with
+  each view's SQL and render time and its most repeated query fingerprints,
+* writes slow or query-heavy requests as JSON lines to the
+  ``delivery.slow_requests`` logger (a rotating file in settings.LOG_DIR,
+  see SlowRequestLogHandler and settings.LOGGING).
+
+Template render time comes from TimedDjangoTemplates, a thin wrapper around
+the Django template backend that reports into the current request's recorder.
+
+Under ASGI the middleware runs natively async. Queries the async views hand
+to worker threads are recorded through instrument_connections() in those
+threads; queries Django itself runs in its own sync threads (session and user
+lookups) aren't counted there.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+
+slow_log = logging.getLogger("delivery.slow_requests")
+
+
+class SlowRequestLogHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler for ``filename`` in settings.LOG_DIR. Nothing is
+    created until the first record, and a LOG_DIR changed since (tests)
+    moves the log there.
+    """
+
+    def __init__(self, filename, **kwargs):
+        self.name_in_dir = filename
+        super().__init__(self._path(), delay=True, **kwargs)
+
+    def _path(self):
+        return os.path.abspath(Path(settings.LOG_DIR) / self.name_in_dir)
+
+    def emit(self, record):
+        path = self._path()
+        if path != self.baseFilename:
+            with self.lock:
+                if self.stream:
+                    self.stream.close()
+                    self.stream = None
+                self.baseFilename = path
+        super().emit(record)
+
+    def _open(self):
+        Path(self.baseFilename).parent.mkdir(parents=True, exist_ok=True)
+        return super()._open()
+
+_current = ContextVar("request_metrics", default=None)
+
+SAMPLES_PER_VIEW = 1000
+TOP_DUPLICATES = 3
+DUPLICATES_PER_VIEW = 50  # fingerprints kept per view, the rarest are dropped past this
+
+_NUMBERS = re.compile(r"\b\d+(\.\d+)?\b")
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_IN_LISTS = re.compile(r"\((\s*\?\s*,)+\s*\?\s*\)")
+
+
+def fingerprint(sql):
+    """SQL with literals stripped, so the same query with other values matches."""
+    sql = _STRINGS.sub("?", sql)
+    sql = _NUMBERS.sub("?", sql)
+    return _IN_LISTS.sub("(...)", sql)
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.render_seconds = 0.0
+        self.fingerprints = Counter()
+        # async views run their queries from several threads at once
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.seconds += elapsed
+                self.count += 1
+                self.fingerprints[fingerprint(sql)] += 1
+
+    @property
+    def duplicates(self):
+        return {sql: n for sql, n in self.fingerprints.most_common() if n > 1}
+
+
+@contextmanager
+def instrument_connections():
+    """Record this thread's queries into the current request's recorder, if there is one."""
+    recorder = _current.get()
+    with ExitStack() as stack:
+        if recorder is not None:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+        yield
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+        self.origin = template.origin
+
+    def render(self, context=None, request=None):
+        recorder = _current.get()
+        if recorder is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        db_before = recorder.seconds
+        try:
+            return self.template.render(context, request)
+        finally:
+            # lazy querysets evaluated in the template are counted as db, not render
+            elapsed = time.perf_counter() - started
+            recorder.render_seconds += elapsed - (recorder.seconds - db_before)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class ViewStats:
+    """Rolling latency samples and time breakdown per URL name, kept in this worker's memory."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=SAMPLES_PER_VIEW))
+        self._requests = Counter()
+        self._queries = Counter()
+        self._sql_ms = Counter()
+        self._render_ms = Counter()
+        # fingerprint -> repeats beyond the first, summed over requests
+        self._duplicates = defaultdict(Counter)
+
+    def record(self, view, total_ms, queries, sql_ms=0.0, render_ms=0.0, duplicates=None):
+        with self._lock:
+            self._samples[view].append(total_ms)
+            self._requests[view] += 1
+            self._queries[view] += queries
+            self._sql_ms[view] += sql_ms
+            self._render_ms[view] += render_ms
+            if duplicates:
+                seen = self._duplicates[view]
+                for sql, n in duplicates.items():
+                    seen[sql] += n - 1
+                if len(seen) > DUPLICATES_PER_VIEW:
+                    self._duplicates[view] = Counter(dict(seen.most_common(DUPLICATES_PER_VIEW)))
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._requests.clear()
+            self._queries.clear()
+            self._sql_ms.clear()
+            self._render_ms.clear()
+            self._duplicates.clear()
+
+    def summary(self):
+        with self._lock:
+            rows = []
+            for view, samples in self._samples.items():
+                ordered = sorted(samples)
+                rows.append({
+                    "view": view,
+                    "requests": self._requests[view],
+                    "avg_queries": self._queries[view] / self._requests[view],
+                    "avg_sql_ms": self._sql_ms[view] / self._requests[view],
+                    "avg_render_ms": self._render_ms[view] / self._requests[view],
+                    "duplicates": self._duplicates[view].most_common(TOP_DUPLICATES),
+                    "p50": percentile(ordered, 50),
+                    "p95": percentile(ordered, 95),
+                    "p99": percentile(ordered, 99),
+                })
+        return sorted(rows, key=lambda row: row["p95"], reverse=True)
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+stats = ViewStats()
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        token = _current.set(recorder)
+        started = time.perf_counter()
+        try:
+            with instrument_connections():
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        token = _current.set(recorder)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, recorder, started)
+
+    def finish(self, request, response, recorder, started):
+        total_ms = (time.perf_counter() - started) * 1000
+        db_ms = recorder.seconds * 1000
+        render_ms = recorder.render_seconds * 1000
+
+        match = getattr(request, "resolver_match", None)
+        view = (match.view_name if match else None) or "unresolved"
+        duplicates = recorder.duplicates
+        stats.record(view, total_ms, recorder.count, db_ms, render_ms, duplicates)
+
+        response["Server-Timing"] = (
+            f'db;dur={db_ms:.1f};desc="{recorder.count} queries", render;dur={render_ms:.1f}, '
+            f"app;dur={max(total_ms - db_ms - render_ms, 0):.1f}, total;dur={total_ms:.1f}"
+        )
+
+        slow_ms = getattr(settings, "SLOW_REQUEST_MS", 500)
+        slow_queries = getattr(settings, "SLOW_REQUEST_QUERIES", 50)
+        if total_ms >= slow_ms or recorder.count >= slow_queries:
+            slow_log.warning(json.dumps({
+                "time": time.time(),
+                "view": view,
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "total_ms": round(total_ms, 1),
+                "db_ms": round(db_ms, 1),
+                "render_ms": round(render_ms, 1),
+                "queries": recorder.count,
+                "duplicates": dict(list(duplicates.items())[:10]),
+            }))
+        return response
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-17 17:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0008_alter_customer_phone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='delivery',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transactions', to='delivery.delivery'),
+        ),
+    ]
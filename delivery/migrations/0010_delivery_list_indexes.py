@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-17 17:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0009_transaction_delivery'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['date', 'id'], name='delivery_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['customer', 'date', 'id'], name='delivery_customer_date_idx'),
+        ),
+    ]
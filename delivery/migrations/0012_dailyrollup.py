@@ -0,0 +1,98 @@
+# Generated by Django 5.2.6 on 2026-10-17 17:16
+
+from django.db import migrations, models
+
+
+# Rollups are maintained by triggers so every write path (posting, bulk import,
+# admin, cascaded deletes) keeps them current without extra round trips.
+DELIVERY_COLUMNS = "bottles_delivered, bottles_returned, delivery_count, new_pending"
+TRANSACTION_COLUMNS = "cash_collected"
+
+
+def _upsert(columns, values, row):
+    assignments = ", ".join(f"{c} = {c} + excluded.{c}" for c in columns.split(", "))
+    return (
+        f"INSERT INTO delivery_dailyrollup (date, cash_collected, bottles_delivered, bottles_returned, "
+        f"delivery_count, new_pending) SELECT {row}.date, {values} WHERE {row}.date IS NOT NULL "
+        f"ON CONFLICT(date) DO UPDATE SET {assignments};"
+    )
+
+
+def _delivery_values(row, sign):
+    return (
+        f"0, {sign}{row}.bottles_delivered, {sign}{row}.bottles_returned, {sign}1, "
+        f"{sign}MAX({row}.total_amount - {row}.amount_received, 0)"
+    )
+
+
+def _transaction_values(row, sign):
+    return f"{sign}{row}.amount, 0, 0, 0, 0"
+
+
+def _triggers(table, name, columns, values):
+    return {
+        f"{name}_rollup_insert": (
+            f"AFTER INSERT ON {table} BEGIN {_upsert(columns, values('NEW', ''), 'NEW')} END"
+        ),
+        f"{name}_rollup_delete": (
+            f"AFTER DELETE ON {table} BEGIN {_upsert(columns, values('OLD', '-'), 'OLD')} END"
+        ),
+        f"{name}_rollup_update": (
+            f"AFTER UPDATE ON {table} BEGIN "
+            f"{_upsert(columns, values('OLD', '-'), 'OLD')} "
+            f"{_upsert(columns, values('NEW', ''), 'NEW')} END"
+        ),
+    }
+
+
+TRIGGERS = {
+    **_triggers("delivery_delivery", "delivery", DELIVERY_COLUMNS, _delivery_values),
+    **_triggers("delivery_transaction", "transaction", TRANSACTION_COLUMNS, _transaction_values),
+}
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for name, body in TRIGGERS.items():
+        schema_editor.execute(f"CREATE TRIGGER {name} {body}")
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for name in TRIGGERS:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def backfill(apps, schema_editor):
+    from delivery.rollups import rebuild_rollups
+    rebuild_rollups(
+        apps.get_model("delivery", "DailyRollup"),
+        apps.get_model("delivery", "Delivery"),
+        apps.get_model("delivery", "Transaction"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0011_transaction_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('cash_collected', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('bottles_delivered', models.IntegerField(default=0)),
+                ('bottles_returned', models.IntegerField(default=0)),
+                ('delivery_count', models.IntegerField(default=0)),
+                ('new_pending', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.2.6 on 2026-10-17 17:19
+
+import re
+
+from django.db import migrations, models
+
+
+FTS_COLUMNS = "name, address, phone_digits"
+
+# External-content FTS5 index over customers. Triggers only fire on the
+# searchable columns so balance updates from postings don't touch the index.
+FTS_SQL = [
+    f"""CREATE VIRTUAL TABLE delivery_customer_fts USING fts5(
+        {FTS_COLUMNS}, content='delivery_customer', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER customer_fts_insert AFTER INSERT ON delivery_customer BEGIN
+        INSERT INTO delivery_customer_fts(rowid, {FTS_COLUMNS})
+        VALUES (NEW.id, NEW.name, NEW.address, NEW.phone_digits);
+    END""",
+    f"""CREATE TRIGGER customer_fts_delete AFTER DELETE ON delivery_customer BEGIN
+        INSERT INTO delivery_customer_fts(delivery_customer_fts, rowid, {FTS_COLUMNS})
+        VALUES ('delete', OLD.id, OLD.name, OLD.address, OLD.phone_digits);
+    END""",
+    f"""CREATE TRIGGER customer_fts_update AFTER UPDATE OF {FTS_COLUMNS} ON delivery_customer BEGIN
+        INSERT INTO delivery_customer_fts(delivery_customer_fts, rowid, {FTS_COLUMNS})
+        VALUES ('delete', OLD.id, OLD.name, OLD.address, OLD.phone_digits);
+        INSERT INTO delivery_customer_fts(rowid, {FTS_COLUMNS})
+        VALUES (NEW.id, NEW.name, NEW.address, NEW.phone_digits);
+    END""",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS customer_fts_insert",
+    "DROP TRIGGER IF EXISTS customer_fts_delete",
+    "DROP TRIGGER IF EXISTS customer_fts_update",
+    "DROP TABLE IF EXISTS delivery_customer_fts",
+]
+
+
+def fill_phone_digits(apps, schema_editor):
+    Customer = apps.get_model("delivery", "Customer")
+    customers = list(Customer.objects.exclude(phone=None).exclude(phone="").only("phone"))
+    for customer in customers:
+        customer.phone_digits = re.sub(r"\D", "", customer.phone)
+    Customer.objects.bulk_update(customers, ["phone_digits"], batch_size=500)
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for sql in FTS_SQL:
+        schema_editor.execute(sql)
+    # name matches count most, then phone, then address
+    schema_editor.execute(
+        "INSERT INTO delivery_customer_fts(delivery_customer_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0, 5.0)')"
+    )
+    schema_editor.execute("INSERT INTO delivery_customer_fts(delivery_customer_fts) VALUES ('rebuild')")
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for sql in DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0012_dailyrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='phone_digits',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=15),
+        ),
+        migrations.RunPython(fill_phone_digits, migrations.RunPython.noop),
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.6 on 2026-10-17 17:49
+
+from django.db import migrations, models
+
+
+# Deleting a delivery or transaction leaves its customer's counters stale
+# without touching the customer row. These triggers bump updated_at so the
+# next incremental reconcile_balances run checks that customer.
+TRIGGERS = {
+    f"{name}_touch_customer_delete": (
+        f"AFTER DELETE ON {table} BEGIN "
+        f"UPDATE delivery_customer SET updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now') "
+        f"WHERE id = OLD.customer_id; END"
+    )
+    for name, table in [("delivery", "delivery_delivery"), ("transaction", "delivery_transaction")]
+}
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for name, body in TRIGGERS.items():
+        schema_editor.execute(f"CREATE TRIGGER {name} {body}")
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for name in TRIGGERS:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0014_syncevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconciliationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('last_delivery_id', models.BigIntegerField(default=0)),
+                ('last_transaction_id', models.BigIntegerField(default=0)),
+                ('full', models.BooleanField(default=False)),
+                ('dry_run', models.BooleanField(default=True)),
+                ('customers_checked', models.IntegerField(default=0)),
+                ('drifted', models.IntegerField(default=0)),
+                ('repaired', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
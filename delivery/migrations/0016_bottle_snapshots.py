@@ -0,0 +1,120 @@
+# Generated by Django 5.2.6 on 2026-10-17 17:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Snapshots are maintained by triggers, like the rollups in 0012, so posting,
+# bulk import, admin edits and cascaded deletes all keep them current. Every
+# change upserts the delivery's day (seeding a new row from the previous day's
+# count) and shifts the count of every later day by the same amount.
+def _movement(row, sign):
+    return f"{sign}({row}.bottles_delivered - {row}.bottles_returned)"
+
+
+def _customer_apply(row, sign):
+    delta = _movement(row, sign)
+    return (
+        f"INSERT INTO delivery_bottlesnapshot (customer_id, date, delta, bottles_at_site) "
+        f"SELECT {row}.customer_id, {row}.date, {delta}, {delta} + COALESCE(("
+        f"SELECT s.bottles_at_site FROM delivery_bottlesnapshot s WHERE s.customer_id = {row}.customer_id "
+        f"AND s.date < {row}.date ORDER BY s.date DESC LIMIT 1), 0) WHERE {row}.date IS NOT NULL "
+        # not for a customer already gone (flush, raw deletes in parent-first order)
+        f"AND EXISTS (SELECT 1 FROM delivery_customer c WHERE c.id = {row}.customer_id) "
+        f"ON CONFLICT(customer_id, date) DO UPDATE SET delta = delta + excluded.delta, "
+        f"bottles_at_site = bottles_at_site + excluded.delta; "
+        f"UPDATE delivery_bottlesnapshot SET bottles_at_site = bottles_at_site + {delta} "
+        f"WHERE customer_id = {row}.customer_id AND date > {row}.date;"
+    )
+
+
+def _fleet_apply(row, sign):
+    delta = _movement(row, sign)
+    return (
+        f"INSERT INTO delivery_fleetbottlesnapshot (date, delta, bottles_out) "
+        f"SELECT {row}.date, {delta}, {delta} + COALESCE(("
+        f"SELECT f.bottles_out FROM delivery_fleetbottlesnapshot f WHERE f.date < {row}.date "
+        f"ORDER BY f.date DESC LIMIT 1), 0) WHERE {row}.date IS NOT NULL "
+        f"ON CONFLICT(date) DO UPDATE SET delta = delta + excluded.delta, "
+        f"bottles_out = bottles_out + excluded.delta; "
+        f"UPDATE delivery_fleetbottlesnapshot SET bottles_out = bottles_out + {delta} WHERE date > {row}.date;"
+    )
+
+
+def _apply(row, sign):
+    return f"{_customer_apply(row, sign)} {_fleet_apply(row, sign)}"
+
+
+TRIGGERS = {
+    "delivery_bottles_insert": f"AFTER INSERT ON delivery_delivery BEGIN {_apply('NEW', '')} END",
+    "delivery_bottles_delete": f"AFTER DELETE ON delivery_delivery BEGIN {_apply('OLD', '-')} END",
+    # payment-only edits don't touch the snapshots
+    "delivery_bottles_update": (
+        f"AFTER UPDATE OF customer_id, date, bottles_delivered, bottles_returned ON delivery_delivery "
+        f"BEGIN {_apply('OLD', '-')} {_apply('NEW', '')} END"
+    ),
+    # a customer's deliveries may be deleted after its snapshots in a cascade,
+    # drop the rows their delete trigger put back
+    "customer_bottles_delete": (
+        "AFTER DELETE ON delivery_customer BEGIN "
+        "DELETE FROM delivery_bottlesnapshot WHERE customer_id = OLD.id; END"
+    ),
+}
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for name, body in TRIGGERS.items():
+        schema_editor.execute(f"CREATE TRIGGER {name} {body}")
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for name in TRIGGERS:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def backfill(apps, schema_editor):
+    from delivery.bottles import rebuild_bottle_snapshots
+    rebuild_bottle_snapshots(
+        apps.get_model("delivery", "BottleSnapshot"),
+        apps.get_model("delivery", "FleetBottleSnapshot"),
+        apps.get_model("delivery", "Delivery"),
+        entry_model=None,  # no ledger yet, 0021 adds the adjustments
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0015_reconciliationrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FleetBottleSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('delta', models.IntegerField(default=0)),
+                ('bottles_out', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BottleSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('delta', models.IntegerField(default=0)),
+                ('bottles_at_site', models.IntegerField(default=0)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bottle_snapshots', to='delivery.customer')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('customer', 'date'), name='bottlesnapshot_customer_date_uniq')],
+            },
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0016_bottle_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoutePlanRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('start', models.DateField()),
+                ('days', models.IntegerField()),
+                ('full', models.BooleanField(default=False)),
+                ('customers_planned', models.IntegerField(default=0)),
+                ('stops', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ScheduledStop',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('expected_bottles', models.IntegerField(default=0)),
+                ('interval_days', models.IntegerField(default=0)),
+                ('last_delivery', models.DateField()),
+                ('overdue_days', models.IntegerField(default=0)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scheduled_stops', to='delivery.customer')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['customer', 'date'], name='scheduledstop_customer_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'customer'), name='scheduledstop_date_customer_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,159 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Entries are written by triggers, like the rollups in 0012 and the bottle
+# snapshots in 0016, so posting, bulk import, admin edits and cascaded deletes
+# are all recorded without posting doing an extra query. An edit appends the
+# reversal of the old row and an entry for the new one, a delete the reversal.
+CREDIT_TYPES = "'advance', 'payment', 'partial'"  # posting.CREDIT_TYPES
+NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+
+def _entry(source, row, amount, bottles, reversal, description):
+    return (
+        f"INSERT INTO delivery_ledgerentry "
+        f"(customer_id, date, amount, bottles, source, source_id, is_reversal, description, created_at) "
+        f"SELECT {row}.customer_id, COALESCE({row}.date, '0001-01-01'), {amount}, {bottles}, "
+        f"'{source}', {row}.id, {reversal}, {description}, {NOW} "
+        # not for a customer already gone (flush, raw deletes in parent-first order)
+        f"WHERE EXISTS (SELECT 1 FROM delivery_customer c WHERE c.id = {row}.customer_id);"
+    )
+
+
+def _delivery(row, sign, reversal=0):
+    return _entry(
+        "delivery", row, f"{'' if sign == '-' else '-'}{row}.total_amount",
+        f"{sign}({row}.bottles_delivered - {row}.bottles_returned)", reversal, "''",
+    )
+
+
+def _transaction(row, sign, reversal=0):
+    amount = (
+        f"{sign}(CASE WHEN {row}.transaction_type IN ({CREDIT_TYPES}) "
+        f"THEN {row}.amount ELSE -{row}.amount END)"
+    )
+    return _entry("transaction", row, amount, "0", reversal, f"{row}.transaction_type")
+
+
+def _changed(*columns):
+    return " OR ".join(f"OLD.{column} IS NOT NEW.{column}" for column in columns)
+
+
+MONTH = "date(NEW.date, 'start of month')"
+
+TRIGGERS = {
+    "delivery_ledger_insert": f"AFTER INSERT ON delivery_delivery BEGIN {_delivery('NEW', '')} END",
+    "delivery_ledger_delete": f"AFTER DELETE ON delivery_delivery BEGIN {_delivery('OLD', '-', 1)} END",
+    # Model.save() writes every column, only record real changes
+    "delivery_ledger_update": (
+        f"AFTER UPDATE ON delivery_delivery "
+        f"WHEN {_changed('customer_id', 'date', 'total_amount', 'bottles_delivered', 'bottles_returned')} "
+        f"BEGIN {_delivery('OLD', '-', 1)} {_delivery('NEW', '')} END"
+    ),
+    "transaction_ledger_insert": f"AFTER INSERT ON delivery_transaction BEGIN {_transaction('NEW', '')} END",
+    "transaction_ledger_delete": f"AFTER DELETE ON delivery_transaction BEGIN {_transaction('OLD', '-', 1)} END",
+    "transaction_ledger_update": (
+        f"AFTER UPDATE ON delivery_transaction "
+        f"WHEN {_changed('customer_id', 'date', 'amount', 'transaction_type')} "
+        f"BEGIN {_transaction('OLD', '-', 1)} {_transaction('NEW', '')} END"
+    ),
+    "ledger_immutable": (
+        "BEFORE UPDATE ON delivery_ledgerentry BEGIN "
+        "SELECT RAISE(ABORT, 'ledger entries are immutable'); END"
+    ),
+    # an entry backdated into a closed month moves that month's closing and
+    # every later one; a customer without a row for that month gets one,
+    # seeded from their previous closing
+    "ledger_snapshot_shift": (
+        f"AFTER INSERT ON delivery_ledgerentry BEGIN "
+        f"INSERT INTO delivery_ledgersnapshot (customer_id, month, balance, bottles) "
+        f"SELECT NEW.customer_id, {MONTH}, "
+        f"COALESCE((SELECT s.balance FROM delivery_ledgersnapshot s WHERE s.customer_id = NEW.customer_id "
+        f"AND s.month < {MONTH} ORDER BY s.month DESC LIMIT 1), 0), "
+        f"COALESCE((SELECT s.bottles FROM delivery_ledgersnapshot s WHERE s.customer_id = NEW.customer_id "
+        f"AND s.month < {MONTH} ORDER BY s.month DESC LIMIT 1), 0) "
+        f"WHERE {MONTH} <= (SELECT MAX(month) FROM delivery_ledgersnapshot) "
+        f"ON CONFLICT(customer_id, month) DO NOTHING; "
+        f"UPDATE delivery_ledgersnapshot SET balance = balance + NEW.amount, bottles = bottles + NEW.bottles "
+        f"WHERE customer_id = NEW.customer_id AND month >= {MONTH}; END"
+    ),
+}
+
+
+def replay(apps, schema_editor):
+    from delivery.ledger import replay_history
+    replay_history(
+        apps.get_model("delivery", "LedgerEntry"),
+        apps.get_model("delivery", "Delivery"),
+        apps.get_model("delivery", "Transaction"),
+        apps.get_model("delivery", "Customer"),
+    )
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for name, body in TRIGGERS.items():
+        schema_editor.execute(f"CREATE TRIGGER {name} {body}")
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for name in TRIGGERS:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def close(apps, schema_editor):
+    from delivery.ledger import close_months
+    close_months(
+        entry_model=apps.get_model("delivery", "LedgerEntry"),
+        snapshot_model=apps.get_model("delivery", "LedgerSnapshot"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0017_scheduled_stops'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('bottles', models.IntegerField(default=0)),
+                ('source', models.CharField(choices=[('delivery', 'Delivery'), ('transaction', 'Transaction'), ('adjustment', 'Adjustment')], max_length=12)),
+                ('source_id', models.BigIntegerField()),
+                ('is_reversal', models.BooleanField(default=False)),
+                ('description', models.CharField(blank=True, default='', max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('customer', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='ledger_entries', to='delivery.customer')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['customer', 'date'], name='ledgerentry_customer_date_idx'), models.Index(fields=['source', 'source_id'], name='ledgerentry_source_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('bottles', models.IntegerField(default=0)),
+                ('customer', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='ledger_snapshots', to='delivery.customer')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('customer', 'month'), name='ledgersnapshot_customer_month_uniq')],
+            },
+        ),
+        migrations.RunPython(replay, migrations.RunPython.noop),
+        migrations.RunPython(create_triggers, drop_triggers),
+        migrations.RunPython(close, migrations.RunPython.noop),
+    ]
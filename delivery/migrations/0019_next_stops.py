@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0018_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NextStop',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='next_stop', serialize=False, to='delivery.customer')),
+                ('date', models.DateField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:54
+
+from django.db import migrations, models
+
+
+# SQLite can't ALTER TABLE ADD a NOT NULL column the way Django wants, so its
+# schema editor rebuilds the table. That would drop the customer triggers
+# (search index, ledger) and trip the other tables' triggers on the copy, so
+# on SQLite the column is added in place; the DEFAULT stays in the schema.
+def add_column(apps, schema_editor):
+    Customer = apps.get_model("delivery", "Customer")
+    field = Customer._meta.get_field("phone_reversed")
+    if schema_editor.connection.vendor != "sqlite":
+        schema_editor.add_field(Customer, field)
+        return
+    schema_editor.execute(
+        "ALTER TABLE delivery_customer ADD COLUMN phone_reversed varchar(15) NOT NULL DEFAULT ''"
+    )
+    schema_editor.execute(schema_editor._create_index_sql(Customer, fields=[field]))
+
+
+def drop_column(apps, schema_editor):
+    Customer = apps.get_model("delivery", "Customer")
+    field = Customer._meta.get_field("phone_reversed")
+    if schema_editor.connection.vendor != "sqlite":
+        schema_editor.remove_field(Customer, field)
+        return
+    schema_editor.execute(schema_editor._delete_index_sql(
+        Customer, schema_editor._create_index_name("delivery_customer", ["phone_reversed"], suffix="")
+    ))
+    schema_editor.execute("ALTER TABLE delivery_customer DROP COLUMN phone_reversed")
+
+
+def fill_phone_reversed(apps, schema_editor):
+    # one prepared UPDATE per row, bulk_update's CASE batches take ~30s on 100k customers
+    Customer = apps.get_model("delivery", "Customer")
+    rows = Customer.objects.exclude(phone_digits="").values_list("phone_digits", "id")
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            "UPDATE delivery_customer SET phone_reversed = %s WHERE id = %s",
+            [(digits[::-1], pk) for digits, pk in rows.iterator(chunk_size=5000)],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0019_next_stops'),
+    ]
+
+    operations = [
+        # the field goes into the state first, add_column reads it from there
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name='customer',
+                    name='phone_reversed',
+                    field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=15),
+                ),
+            ],
+        ),
+        migrations.RunPython(add_column, drop_column),
+        migrations.RunPython(fill_phone_reversed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,92 @@
+from django.db import migrations
+
+
+# Bottle adjustments (opening counts, manual edits, see ledger.record_adjustment)
+# move the snapshots like a delivery does, same upsert-and-shift as 0016 with
+# the entry's bottles as the movement. Ledger entries are never updated or
+# deleted, so inserts are all there is to follow.
+def _customer_apply(delta):
+    return (
+        f"INSERT INTO delivery_bottlesnapshot (customer_id, date, delta, bottles_at_site) "
+        f"SELECT NEW.customer_id, NEW.date, {delta}, {delta} + COALESCE(("
+        f"SELECT s.bottles_at_site FROM delivery_bottlesnapshot s WHERE s.customer_id = NEW.customer_id "
+        f"AND s.date < NEW.date ORDER BY s.date DESC LIMIT 1), 0) "
+        f"WHERE EXISTS (SELECT 1 FROM delivery_customer c WHERE c.id = NEW.customer_id) "
+        f"ON CONFLICT(customer_id, date) DO UPDATE SET delta = delta + excluded.delta, "
+        f"bottles_at_site = bottles_at_site + excluded.delta; "
+        f"UPDATE delivery_bottlesnapshot SET bottles_at_site = bottles_at_site + {delta} "
+        f"WHERE customer_id = NEW.customer_id AND date > NEW.date;"
+    )
+
+
+def _fleet_apply(delta):
+    return (
+        f"INSERT INTO delivery_fleetbottlesnapshot (date, delta, bottles_out) "
+        f"SELECT NEW.date, {delta}, {delta} + COALESCE(("
+        f"SELECT f.bottles_out FROM delivery_fleetbottlesnapshot f WHERE f.date < NEW.date "
+        f"ORDER BY f.date DESC LIMIT 1), 0) "
+        f"ON CONFLICT(date) DO UPDATE SET delta = delta + excluded.delta, "
+        f"bottles_out = bottles_out + excluded.delta; "
+        f"UPDATE delivery_fleetbottlesnapshot SET bottles_out = bottles_out + {delta} WHERE date > NEW.date;"
+    )
+
+
+def _adjusted(condition):
+    return (
+        f"COALESCE((SELECT SUM(e.bottles) FROM delivery_ledgerentry e WHERE e.customer_id = OLD.id "
+        f"AND e.source = 'adjustment' AND {condition}), 0)"
+    )
+
+
+TRIGGERS = {
+    "ledger_bottles_adjust": (
+        "AFTER INSERT ON delivery_ledgerentry WHEN NEW.source = 'adjustment' AND NEW.bottles <> 0 "
+        f"BEGIN {_customer_apply('NEW.bottles')} {_fleet_apply('NEW.bottles')} END"
+    ),
+    # a deleted customer's deliveries leave the fleet count through their own
+    # delete trigger, the adjustments stay in the ledger and are taken out here
+    "customer_fleet_adjustments_delete": (
+        "AFTER DELETE ON delivery_customer BEGIN "
+        "UPDATE delivery_fleetbottlesnapshot SET "
+        f"delta = delta - {_adjusted('e.date = delivery_fleetbottlesnapshot.date')}, "
+        f"bottles_out = bottles_out - {_adjusted('e.date <= delivery_fleetbottlesnapshot.date')} "
+        "WHERE date >= (SELECT MIN(e.date) FROM delivery_ledgerentry e WHERE e.customer_id = OLD.id "
+        "AND e.source = 'adjustment' AND e.bottles <> 0); END"
+    ),
+}
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for name, body in TRIGGERS.items():
+        schema_editor.execute(f"CREATE TRIGGER {name} {body}")
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for name in TRIGGERS:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def rebuild(apps, schema_editor):
+    from delivery.bottles import rebuild_bottle_snapshots
+    rebuild_bottle_snapshots(
+        apps.get_model("delivery", "BottleSnapshot"),
+        apps.get_model("delivery", "FleetBottleSnapshot"),
+        apps.get_model("delivery", "Delivery"),
+        apps.get_model("delivery", "LedgerEntry"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0020_customer_phone_reversed'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_triggers, drop_triggers),
+        migrations.RunPython(rebuild, migrations.RunPython.noop),
+    ]
@@ -1,12 +1,14 @@
 from django.db import models
 from decimal import Decimal
-from django.db.models import F
-from datetime import date
 
 
 class Customer(models.Model):
     name = models.CharField(max_length=100)
     phone = models.CharField(max_length=15, blank=True, null=True)
+    # ✅ digits only copy of phone for search, filled in save()
+    phone_digits = models.CharField(max_length=15, blank=True, default="", db_index=True, editable=False)
+    # ✅ same digits backwards, so "ends with" is an indexed prefix lookup too
+    phone_reversed = models.CharField(max_length=15, blank=True, default="", db_index=True, editable=False)
     address = models.TextField(blank=True, null=True)
 
     # Balances
@@ -30,10 +32,32 @@ class Customer(models.Model):
 
     def save(self, *args, **kwargs):
         """Ensure balance and pending_balance auto-adjust."""
+        from .search import normalize_phone
+        self.phone_digits = normalize_phone(self.phone)
+        self.phone_reversed = self.phone_digits[::-1]
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "phone" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "phone_digits", "phone_reversed"}
+
+        # ✅ a save that doesn't write the counters leaves them (and the ledger) alone
+        counters = ["balance", "pending_balance", "bottles_at_site"]
+        if update_fields is not None and not set(counters) & set(update_fields):
+            super().save(*args, **kwargs)
+            return
+
+        # ✅ counters before this save, edits of them go in the ledger as adjustments
+        before = (Decimal("0.00"), Decimal("0.00"), 0)
+        if self.pk is not None:
+            before = Customer.objects.filter(pk=self.pk).values_list(*counters).first() or before
+
         super().save(*args, **kwargs)  # ✅ save first (apply F() updates)
 
         # ✅ refresh with real values from DB (so not CombinedExpression)
-        self.refresh_from_db(fields=["balance", "pending_balance"])
+        self.refresh_from_db(fields=counters)
+        from .ledger import record_adjustment
+        record_adjustment(
+            self, self.net_balance - (before[0] - before[1]), self.bottles_at_site - before[2],
+        )
 
         # Now adjust with pure numbers
         if self.balance > 0 and self.pending_balance > 0:
@@ -68,61 +92,17 @@ class Delivery(models.Model):
     amount_received = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     is_paid = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # keyset pagination on the delivery list, with and without a customer filter
+            models.Index(fields=["date", "id"], name="delivery_date_id_idx"),
+            models.Index(fields=["customer", "date", "id"], name="delivery_customer_date_idx"),
+        ]
+
     def save(self, *args, **kwargs):
-        creating = self.pk is None
-
-        # ✅ Ensure date is always set
-        if not self.date:
-            self.date = date.today()
-
-        # Convert to Decimal
-        self.amount_received = Decimal(self.amount_received)
-        self.total_amount = Decimal(self.total_amount)
-
-        if not creating:
-            old = Delivery.objects.get(pk=self.pk)
-            self.customer.bottles_at_site -= old.bottles_delivered
-            self.customer.bottles_at_site += old.bottles_returned
-
-        # Update bottle counts
-        self.customer.bottles_at_site += self.bottles_delivered
-        self.customer.bottles_at_site -= self.bottles_returned
-
-        # Handle payments
-        if self.amount_received >= self.total_amount:
-            self.is_paid = True
-            extra = self.amount_received - self.total_amount
-            if extra > Decimal("0"):
-                self.customer.balance = F("balance") + extra
-                Transaction.objects.create(
-                    customer=self.customer,
-                    amount=self.amount_received,
-                    transaction_type="payment",
-                    description=f"Full payment received with extra {extra} added to advance",
-                    date=self.date  # ✅ transaction gets same date as delivery
-                )
-            else:
-                Transaction.objects.create(
-                    customer=self.customer,
-                    amount=self.amount_received,
-                    transaction_type="payment",
-                    description="Full delivery payment",
-                    date=self.date  # ✅ match delivery date
-                )
-        else:
-            self.is_paid = False
-            pending = self.total_amount - self.amount_received
-            self.customer.pending_balance = F("pending_balance") + pending
-            Transaction.objects.create(
-                customer=self.customer,
-                amount=self.amount_received,
-                transaction_type="partial",
-                description=f"Partial payment, pending {pending}",
-                date=self.date  # ✅ match delivery date
-            )
-
-        self.customer.save()
-        super().save(*args, **kwargs)
+        """Post through the ledger engine so every save updates the customer."""
+        from .posting import post_delivery
+        post_delivery(self)
 
 
 
@@ -141,6 +121,222 @@ class Transaction(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     transaction_type = models.CharField(max_length=10, choices=TRANSACTION_TYPES, default="payment")
     description = models.TextField(blank=True, null=True)
+    # ✅ set for the payment record a delivery posts, empty for manual entries
+    delivery = models.ForeignKey(
+        Delivery, on_delete=models.SET_NULL, blank=True, null=True, related_name="transactions"
+    )
+
+    class Meta:
+        indexes = [
+            # keyset pagination on the ledger browser, with and without a customer filter
+            models.Index(fields=["date", "id"], name="transaction_date_id_idx"),
+            models.Index(fields=["customer", "date"], name="transaction_customer_date_idx"),
+        ]
 
     def __str__(self):
         return f"{self.customer.name} - {self.transaction_type} ({self.amount}) on {self.date.strftime('%Y-%m-%d')}"
+
+
+
+class DailyRollup(models.Model):
+    """
+    Per-day totals for the dashboard, kept current by database triggers on
+    delivery_delivery and delivery_transaction (see migration 0012).
+    Run ``manage.py rebuild_rollups`` to backfill or repair.
+    """
+    date = models.DateField(unique=True)
+    cash_collected = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    bottles_delivered = models.IntegerField(default=0)
+    bottles_returned = models.IntegerField(default=0)
+    delivery_count = models.IntegerField(default=0)
+    new_pending = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.date}: {self.cash_collected} collected, {self.delivery_count} deliveries"
+
+
+
+class SyncEvent(models.Model):
+    """
+    Idempotency key of a delivery pushed through the driver sync endpoint.
+    A key is only stored once its delivery is posted, so a retried upload
+    finds it here and is answered from the row instead of posting again.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    device = models.CharField(max_length=64, blank=True, default="")
+    delivery = models.ForeignKey(Delivery, on_delete=models.SET_NULL, blank=True, null=True, related_name="+")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # "what landed since my cursor" per device
+            models.Index(fields=["device", "id"], name="syncevent_device_id_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.key} -> delivery {self.delivery_id}"
+
+
+class ReconciliationRun(models.Model):
+    """
+    One run of ``manage.py reconcile_balances``. The ids and start time are
+    the checkpoint the next incremental run starts from (see reconcile.py).
+    """
+    started_at = models.DateTimeField()
+    last_delivery_id = models.BigIntegerField(default=0)
+    last_transaction_id = models.BigIntegerField(default=0)
+    full = models.BooleanField(default=False)
+    dry_run = models.BooleanField(default=True)
+    customers_checked = models.IntegerField(default=0)
+    drifted = models.IntegerField(default=0)
+    repaired = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.started_at:%Y-%m-%d %H:%M}: {self.drifted} of {self.customers_checked} drifted"
+
+
+class BottleSnapshot(models.Model):
+    """
+    Bottles at one customer's site at the end of each day they had a delivery,
+    kept current by database triggers on delivery_delivery (see migration 0016).
+    The latest row on or before a date is that customer's count as of the date.
+    """
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="bottle_snapshots")
+    date = models.DateField()
+    delta = models.IntegerField(default=0)  # net bottles left on the day
+    bottles_at_site = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # also the index for "latest row on or before X" per customer
+            models.UniqueConstraint(fields=["customer", "date"], name="bottlesnapshot_customer_date_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.customer_id} on {self.date}: {self.bottles_at_site} bottles"
+
+
+class FleetBottleSnapshot(models.Model):
+    """Bottles out across all customers at the end of each day, same triggers as BottleSnapshot."""
+    date = models.DateField(unique=True)
+    delta = models.IntegerField(default=0)
+    bottles_out = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.date}: {self.bottles_out} bottles out"
+
+
+class ScheduledStop(models.Model):
+    """
+    A customer expected to need a delivery on ``date``, worked out from their
+    delivery history by ``manage.py plan_routes`` (see routes.py).
+    """
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="scheduled_stops")
+    date = models.DateField()
+    expected_bottles = models.IntegerField(default=0)
+    interval_days = models.IntegerField(default=0)
+    last_delivery = models.DateField()
+    overdue_days = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # also the index the route sheet reads a day through
+            models.UniqueConstraint(fields=["date", "customer"], name="scheduledstop_date_customer_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["customer", "date"], name="scheduledstop_customer_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.customer_id} on {self.date}: {self.expected_bottles} bottles"
+
+
+class NextStop(models.Model):
+    """
+    A planned customer's first due day past the materialized horizon, so an
+    incremental plan_routes picks them up when it enters the horizon even if
+    they have no ScheduledStop yet (intervals longer than the horizon).
+    """
+    customer = models.OneToOneField(Customer, on_delete=models.CASCADE, primary_key=True, related_name="next_stop")
+    date = models.DateField(db_index=True)
+
+    def __str__(self):
+        return f"{self.customer_id} next due {self.date}"
+
+
+class RoutePlanRun(models.Model):
+    """One plan_routes run; started_at is where the next incremental refresh picks up."""
+    started_at = models.DateTimeField()
+    start = models.DateField()
+    days = models.IntegerField()
+    full = models.BooleanField(default=False)
+    customers_planned = models.IntegerField(default=0)
+    stops = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.start} +{self.days} days: {self.stops} stops"
+
+
+class LedgerEntry(models.Model):
+    """
+    Append-only record of every change to a customer's net balance and
+    bottles. Deliveries and transactions write their entries through database
+    triggers (see migration 0018); an edit or delete appends a reversing entry
+    instead of touching the old one. Manual balance/bottle edits are
+    "adjustment" entries. ``amount`` is signed like Customer.net_balance.
+    """
+    SOURCES = [("delivery", "Delivery"), ("transaction", "Transaction"), ("adjustment", "Adjustment")]
+
+    # the ledger outlives deleted customers, so no FK constraint and no cascade
+    customer = models.ForeignKey(
+        Customer, on_delete=models.DO_NOTHING, db_constraint=False, related_name="ledger_entries",
+    )
+    date = models.DateField()
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    bottles = models.IntegerField(default=0)
+    source = models.CharField(max_length=12, choices=SOURCES)
+    source_id = models.BigIntegerField()
+    is_reversal = models.BooleanField(default=False)
+    description = models.CharField(max_length=50, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # historical balances: a bounded date range of one customer's entries
+            models.Index(fields=["customer", "date"], name="ledgerentry_customer_date_idx"),
+            models.Index(fields=["source", "source_id"], name="ledgerentry_source_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Ledger entries are immutable, post a reversing entry instead")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Ledger entries are immutable, post a reversing entry instead")
+
+    def __str__(self):
+        return f"{self.date} {self.source} #{self.source_id}: {self.amount}"
+
+
+class LedgerSnapshot(models.Model):
+    """
+    A customer's net balance and bottles at the end of ``month`` (its first
+    day), written by ``manage.py close_ledger_month`` for months with entries.
+    Entries backdated into a closed month update the snapshots from that
+    month on through a trigger (see migration 0018).
+    """
+    customer = models.ForeignKey(
+        Customer, on_delete=models.DO_NOTHING, db_constraint=False, related_name="ledger_snapshots",
+    )
+    month = models.DateField()
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    bottles = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["customer", "month"], name="ledgersnapshot_customer_month_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.customer_id} {self.month:%Y-%m}: {self.balance}"
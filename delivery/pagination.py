@@ -0,0 +1,86 @@
+"""
+Keyset (cursor) pagination on (date, id), newest first.
+
+Every page is a "WHERE (date, id) < cursor ORDER BY date DESC, id DESC LIMIT n"
+on an index, so it costs the same no matter how much history is behind it.
+"""
+from datetime import date
+
+from django.db.models import Q
+
+
+PER_PAGE = 50
+
+
+def encode_cursor(obj, date_field="date"):
+    value = getattr(obj, date_field)
+    return f"{value.isoformat() if value else ''}.{obj.pk}"
+
+
+def decode_cursor(cursor):
+    """Return (date or None, id), or None for a missing/garbled cursor."""
+    if not cursor:
+        return None
+    try:
+        raw_date, raw_id = cursor.rsplit(".", 1)
+        return (date.fromisoformat(raw_date) if raw_date else None), int(raw_id)
+    except ValueError:
+        return None
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor, cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def is_first(self):
+        return not self.cursor
+
+
+def keyset_paginate(queryset, cursor=None, per_page=PER_PAGE, date_field="date"):
+    """
+    One page of ``queryset`` ordered by ``-date_field, -id`` after ``cursor``.
+
+    Rows with no date sort last, like SQLite's DESC ordering puts NULLs.
+    """
+    position = decode_cursor(cursor)
+    if position:
+        last_date, last_id = position
+        if last_date is None:
+            queryset = queryset.filter(**{f"{date_field}__isnull": True, "id__lt": last_id})
+        else:
+            queryset = queryset.filter(
+                Q(**{f"{date_field}__lt": last_date})
+                | Q(**{date_field: last_date, "id__lt": last_id})
+                | Q(**{f"{date_field}__isnull": True})
+            )
+
+    queryset = queryset.order_by(f"-{date_field}", "-id")
+    items = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = encode_cursor(items[-1], date_field)
+
+    return KeysetPage(items, next_cursor, cursor if position else None)
+
+
+def page_querystring(request, cursor):
+    """Current GET params with the cursor swapped, for Next links."""
+    params = request.GET.copy()
+    params.pop("cursor", None)
+    if cursor:
+        params["cursor"] = cursor
+    return params.urlencode()
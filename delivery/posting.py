@@ -0,0 +1,265 @@
+"""
+Ledger posting for deliveries and transactions.
+
+All balance and bottle deltas are worked out in Python first and then applied
+with a single conditional UPDATE on the customer row, so a posting costs a
+fixed number of queries (insert/update the row, write its transaction, update
+the customer) instead of the read-modify-save chain in the old model code.
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Greatest
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
+
+from .caching import changed
+from .models import Customer, Delivery, Transaction
+
+
+ZERO = Decimal("0.00")
+
+# Transaction types that reduce what the customer owes, everything else adds to it
+CREDIT_TYPES = {"advance", "payment", "partial"}
+
+DELIVERY_FIELDS = ["bottles_delivered", "bottles_returned", "total_amount", "amount_received"]
+# an edit can move a delivery to another customer, the old one gets reversed
+SNAPSHOT_FIELDS = ["customer_id", *DELIVERY_FIELDS]
+
+
+def snapshot(delivery):
+    """Values of a saved delivery that posting needs to reverse it on edit."""
+    return {field: getattr(delivery, field) for field in SNAPSHOT_FIELDS}
+
+
+def delivery_effects(delivery):
+    """
+    What a delivery does to the books.
+
+    Returns (is_paid, transaction_type, description, net) where net is the
+    change to balance - pending_balance (positive = advance, negative = owed).
+    """
+    received = Decimal(delivery.amount_received)
+    total = Decimal(delivery.total_amount)
+
+    if received >= total:
+        extra = received - total
+        if extra > Decimal("0"):
+            description = f"Full payment received with extra {extra} added to advance"
+        else:
+            description = "Full delivery payment"
+        return True, "payment", description, extra
+
+    pending = total - received
+    return False, "partial", f"Partial payment, pending {pending}", -pending
+
+
+def split_net(net):
+    """Turn a net change into (balance delta, pending delta)."""
+    if net > 0:
+        return net, ZERO
+    return ZERO, -net
+
+
+def net_balances(balance, pending):
+    """Same netting rule as Customer.save(), on plain numbers."""
+    if balance > 0 and pending > 0:
+        if balance >= pending:
+            return balance - pending, ZERO
+        return ZERO, pending - balance
+    return balance, pending
+
+
+def customer_update(balance_delta=ZERO, pending_delta=ZERO, bottles_delta=0):
+    """
+    Update kwargs that add the deltas and net balance against pending in SQL.
+
+    Both CASE expressions read the pre-update column values, so this is the
+    same rule as net_balances() done inside one UPDATE statement.
+    """
+    money = models.DecimalField(max_digits=10, decimal_places=2)
+    new_balance = F("balance") + Value(Decimal(balance_delta), output_field=money)
+    new_pending = F("pending_balance") + Value(Decimal(pending_delta), output_field=money)
+    both_positive = Q(GreaterThan(new_balance, 0)) & Q(GreaterThan(new_pending, 0))
+    zero = Value(ZERO, output_field=money)
+
+    return {
+        "balance": Case(
+            When(both_positive, then=Greatest(new_balance - new_pending, zero)),
+            default=new_balance,
+            output_field=money,
+        ),
+        "pending_balance": Case(
+            When(both_positive, then=Greatest(new_pending - new_balance, zero)),
+            default=new_pending,
+            output_field=money,
+        ),
+        "bottles_at_site": F("bottles_at_site") + bottles_delta,
+        "updated_at": timezone.now(),
+    }
+
+
+def apply_to_customer(customer_id, balance_delta=ZERO, pending_delta=ZERO, bottles_delta=0):
+    Customer.objects.filter(pk=customer_id).update(
+        **customer_update(balance_delta, pending_delta, bottles_delta)
+    )
+    changed(Customer)  # queryset update, no post_save
+
+
+def apply_in_memory(customer, net, bottles_delta=0):
+    """Same as apply_to_customer() on a loaded customer, for batches saved with bulk_update."""
+    balance_delta, pending_delta = split_net(net)
+    customer.bottles_at_site += bottles_delta
+    customer.balance, customer.pending_balance = net_balances(
+        customer.balance + balance_delta, customer.pending_balance + pending_delta
+    )
+
+
+def post_delivery(delivery, previous=None):
+    """
+    Save a delivery and post its effects on the customer.
+
+    For edits pass ``previous`` (see snapshot()) taken before the form touched
+    the instance, otherwise the old values are read back from the database.
+    Editing reverses the old bottles and payment and posts the new ones, and
+    the delivery's transaction is updated in place rather than duplicated. If
+    the edit moves the delivery to another customer, the old customer gets
+    the full reversal and the new one the full posting.
+    """
+    creating = delivery.pk is None
+
+    if not delivery.date:
+        delivery.date = date.today()
+    delivery.amount_received = Decimal(delivery.amount_received)
+    delivery.total_amount = Decimal(delivery.total_amount)
+
+    if not creating and previous is None:
+        previous = Delivery.objects.filter(pk=delivery.pk).values(*SNAPSHOT_FIELDS).get()
+
+    is_paid, transaction_type, description, net = delivery_effects(delivery)
+    bottles = delivery.bottles_delivered - delivery.bottles_returned
+    moved_from = None
+    if previous:
+        old = Delivery(**previous)
+        old_net = delivery_effects(old)[3]
+        old_bottles = old.bottles_delivered - old.bottles_returned
+        if old.customer_id == delivery.customer_id:
+            net -= old_net
+            bottles -= old_bottles
+        else:
+            moved_from = (old.customer_id, old_net, old_bottles)
+    delivery.is_paid = is_paid
+
+    ledger = {
+        "customer_id": delivery.customer_id,
+        "amount": delivery.amount_received,
+        "transaction_type": transaction_type,
+        "description": description,
+        "date": delivery.date,
+    }
+
+    with transaction.atomic():
+        # Model.save() directly, Delivery.save() would post again
+        models.Model.save(delivery)
+        if creating or not Transaction.objects.filter(delivery=delivery).update(**ledger):
+            Transaction.objects.create(delivery=delivery, **ledger)
+        else:
+            changed(Transaction)  # updated in place, no post_save
+        if moved_from:
+            old_customer_id, old_net, old_bottles = moved_from
+            apply_to_customer(old_customer_id, *split_net(-old_net), bottles_delta=-old_bottles)
+        apply_to_customer(delivery.customer_id, *split_net(net), bottles_delta=bottles)
+
+    return delivery
+
+
+def post_delivery_edits(changes):
+    """
+    post_delivery() for many edits at once.
+
+    ``changes`` is a list of (delivery, previous) pairs, each delivery already
+    carrying its new values and ``previous`` its snapshot(). The linked
+    transactions and the customers are loaded once and everything is written
+    back with bulk_update, so the query count doesn't grow with the batch.
+    """
+    deliveries = [delivery for delivery, _ in changes]
+    with transaction.atomic():
+        ledger = {t.delivery_id: t for t in Transaction.objects.filter(delivery__in=deliveries)}
+        customers = Customer.objects.in_bulk(
+            {delivery.customer_id for delivery in deliveries}
+            | {previous["customer_id"] for _, previous in changes}
+        )
+
+        created, updated = [], []
+        now = timezone.now()
+        for delivery, previous in changes:
+            if not delivery.date:
+                delivery.date = date.today()
+            old = Delivery(**previous)
+            delivery.is_paid, transaction_type, description, net = delivery_effects(delivery)
+            bottles = delivery.bottles_delivered - delivery.bottles_returned
+            old_net = delivery_effects(old)[3]
+            old_bottles = old.bottles_delivered - old.bottles_returned
+            if old.customer_id == delivery.customer_id:
+                net -= old_net
+                bottles -= old_bottles
+            else:
+                apply_in_memory(customers[old.customer_id], -old_net, -old_bottles)
+                customers[old.customer_id].updated_at = now
+
+            delivery.customer = customers[delivery.customer_id]
+            apply_in_memory(delivery.customer, net, bottles)
+            delivery.customer.updated_at = now
+
+            txn = ledger.get(delivery.pk) or Transaction(delivery=delivery)
+            txn.customer_id = delivery.customer_id
+            txn.amount = delivery.amount_received
+            txn.transaction_type = transaction_type
+            txn.description = description
+            txn.date = delivery.date
+            (updated if txn.pk else created).append(txn)
+
+        Delivery.objects.bulk_update(deliveries, ["customer", "date", "is_paid", *DELIVERY_FIELDS])
+        if updated:
+            Transaction.objects.bulk_update(updated, ["customer", "amount", "transaction_type", "description", "date"])
+        if created:
+            Transaction.objects.bulk_create(created)
+        Customer.objects.bulk_update(
+            customers.values(), ["balance", "pending_balance", "bottles_at_site", "updated_at"]
+        )
+        changed(Delivery, Transaction, Customer)
+
+    return deliveries
+
+
+def post_transaction(txn):
+    """Save a manual transaction and apply it to the customer's balances."""
+    if not txn.date:
+        txn.date = timezone.localdate()
+
+    amount = Decimal(txn.amount)
+    net = amount if txn.transaction_type in CREDIT_TYPES else -amount
+
+    with transaction.atomic():
+        txn.save()
+        apply_to_customer(txn.customer_id, *split_net(net))
+
+    return txn
+
+
+def reverse_transaction(txn):
+    """
+    Delete a manual transaction and take its amount back off the customer's
+    balances. A delivery's payment record goes with the delivery: edit that
+    instead, or the next post_delivery() would credit it a second time.
+    """
+    if txn.delivery_id:
+        raise ValueError("A delivery's payment is corrected by editing the delivery")
+    amount = Decimal(txn.amount)
+    net = amount if txn.transaction_type in CREDIT_TYPES else -amount
+
+    with transaction.atomic():
+        txn.delete()
+        apply_to_customer(txn.customer_id, *split_net(-net))
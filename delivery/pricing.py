@@ -0,0 +1,79 @@
+"""
+Effective-dated bottle prices.
+
+Each worker keeps the whole price history as a sorted list of
+(effective_from, price) and looks prices up with bisect, so pricing a delivery
+costs no queries. A version number in the shared cache tells other workers
+to reload after bottle_price saves a new row.
+"""
+import bisect
+import threading
+import time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import BottlePrice
+
+
+VERSION_KEY = "delivery:bottle_price_version"
+
+_lock = threading.Lock()
+_table = {"version": None, "dates": [], "prices": []}
+
+
+def _current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # first lookup after a cache flush, start from a clock value so a reset
+        # can never land on a version some worker already has loaded
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _load():
+    rows = BottlePrice.objects.order_by("updated_at", "id").values_list("updated_at", "price_per_bottle")
+    dates, prices = [], []
+    for updated_at, price in rows:
+        effective_from = timezone.localdate(updated_at)
+        if dates and dates[-1] == effective_from:
+            # several changes on one day, the last one wins
+            prices[-1] = price
+        else:
+            dates.append(effective_from)
+            prices.append(price)
+    return dates, prices
+
+
+def _price_table():
+    version = _current_version()
+    if _table["version"] != version:
+        with _lock:
+            if _table["version"] != version:
+                _table["dates"], _table["prices"] = _load()
+                _table["version"] = version
+    return _table["dates"], _table["prices"]
+
+
+def price_on(day=None):
+    """
+    Bottle price in effect on ``day`` (today if not given).
+
+    Days before the first recorded price use the first price, and with no
+    prices at all a bottle costs 0 like the old views did.
+    """
+    dates, prices = _price_table()
+    if not prices:
+        return Decimal("0")
+    index = bisect.bisect_right(dates, day or timezone.localdate()) - 1
+    return prices[max(index, 0)]
+
+
+def invalidate():
+    """Make every worker reload prices on its next lookup."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
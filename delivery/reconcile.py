@@ -0,0 +1,140 @@
+"""
+Balance and bottle reconciliation.
+
+Customer.balance, pending_balance and bottles_at_site are running counters.
+They drift when deliveries or transactions are deleted without posting, or
+when the counters are updated around Customer.save(). This module recomputes
+them from the ledger (LedgerEntry, see ledger.py) for every customer in scope
+with one grouped aggregate. The ledger holds the opening balances and manual
+edits as adjustment entries next to the delivery and transaction entries, so:
+
+* net = sum of the customer's entry amounts, split the way posting nets it:
+  a positive net is balance, a negative one is pending_balance
+* bottles = sum of the entries' bottles
+
+Incremental runs check only customers with activity since the last
+checkpoint: new deliveries or transactions, or a changed customer row.
+Deleting a ledger row touches its customer's updated_at, see migration 0015.
+"""
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max, Q, Sum
+from django.utils import timezone
+
+from .caching import changed
+from .models import Customer, Delivery, LedgerEntry, ReconciliationRun, Transaction
+from .posting import ZERO
+
+
+@dataclass
+class Drift:
+    customer_id: int
+    name: str
+    balance: Decimal
+    pending_balance: Decimal
+    bottles_at_site: int
+    expected_balance: Decimal
+    expected_pending: Decimal
+    expected_bottles: int
+
+    @property
+    def net_drift(self):
+        return (self.balance - self.pending_balance) - (self.expected_balance - self.expected_pending)
+
+    @property
+    def bottle_drift(self):
+        return self.bottles_at_site - self.expected_bottles
+
+
+@dataclass
+class ReconcileResult:
+    run: ReconciliationRun
+    drift: list = field(default_factory=list)
+
+
+def last_checkpoint():
+    """The latest run that left the counters right: a repair, or a dry run without drift."""
+    return ReconciliationRun.objects.filter(Q(dry_run=False) | Q(drifted=0)).order_by("-id").first()
+
+
+def active_customers(checkpoint):
+    """Customers touched since ``checkpoint``, all of them without one."""
+    customers = Customer.objects.all()
+    if checkpoint is None:
+        return customers
+    return customers.filter(
+        Q(updated_at__gte=checkpoint.started_at)
+        | Q(id__in=Delivery.objects.filter(id__gt=checkpoint.last_delivery_id).values("customer_id"))
+        | Q(id__in=Transaction.objects.filter(id__gt=checkpoint.last_transaction_id).values("customer_id"))
+    )
+
+
+def expected_counters(customers):
+    """{customer id: (balance, pending, bottles)} from the ledger, one grouped query."""
+    totals = (
+        LedgerEntry.objects.filter(customer__in=customers)
+        .values("customer_id").annotate(net=Sum("amount"), bottles=Sum("bottles"))
+        .values_list("customer_id", "net", "bottles")
+    )
+    return {
+        customer_id: (max(net, ZERO), max(-net, ZERO), bottles)
+        for customer_id, net, bottles in totals
+    }
+
+
+def find_drift(customers):
+    expected = expected_counters(customers)
+    stored = customers.values_list("id", "name", "balance", "pending_balance", "bottles_at_site")
+    drift = []
+    for customer_id, name, balance, pending, bottles in stored.iterator(chunk_size=5000):
+        want = expected.get(customer_id, (ZERO, ZERO, 0))
+        if (balance, pending, bottles) != want:
+            drift.append(Drift(customer_id, name, balance, pending, bottles, *want))
+    return drift
+
+
+def reconcile(full=False, repair=False):
+    """
+    Check (and with ``repair`` fix) the counters of every customer with
+    activity since the last checkpoint, or of everyone when ``full``.
+
+    A repairing run holds the write transaction from the first read to the
+    bulk update, so no posting can land between computing and writing.
+    """
+    started_at = timezone.now()
+    checkpoint = None if full else last_checkpoint()
+
+    with transaction.atomic():
+        high = {
+            "last_delivery_id": Delivery.objects.aggregate(high=Max("id"))["high"] or 0,
+            "last_transaction_id": Transaction.objects.aggregate(high=Max("id"))["high"] or 0,
+        }
+        customers = active_customers(checkpoint)
+        checked = customers.count()
+        drift = find_drift(customers)
+
+        repaired = 0
+        if repair and drift:
+            fixes = [
+                Customer(
+                    id=row.customer_id, balance=row.expected_balance,
+                    pending_balance=row.expected_pending, bottles_at_site=row.expected_bottles,
+                )
+                for row in drift
+            ]
+            Customer.objects.bulk_update(fixes, ["balance", "pending_balance", "bottles_at_site"], batch_size=500)
+            changed(Customer)
+            repaired = len(fixes)
+
+        run = ReconciliationRun.objects.create(
+            started_at=started_at,
+            full=checkpoint is None,
+            dry_run=not repair,
+            customers_checked=checked,
+            drifted=len(drift),
+            repaired=repaired,
+            **high,
+        )
+    return ReconcileResult(run, drift)
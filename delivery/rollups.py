@@ -0,0 +1,89 @@
+"""
+Reading and rebuilding the DailyRollup table.
+
+Day-to-day maintenance happens in SQLite triggers (migration 0012), this module
+only backfills from the ledger and reads pre-aggregated rows for reports.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Greatest, TruncMonth
+
+from .models import DailyRollup, Delivery, Transaction
+
+
+def rebuild_rollups(rollup_model=DailyRollup, delivery_model=Delivery, transaction_model=Transaction, start=None):
+    """
+    Recompute rollups from the ledger with two grouped queries.
+
+    Model arguments exist so the data migration can pass historical models.
+    Only days on/after ``start`` are rebuilt when it's given.
+    """
+    deliveries = delivery_model.objects.filter(date__isnull=False)
+    transactions = transaction_model.objects.filter(date__isnull=False)
+    rollups = rollup_model.objects.all()
+    if start:
+        deliveries = deliveries.filter(date__gte=start)
+        transactions = transactions.filter(date__gte=start)
+        rollups = rollups.filter(date__gte=start)
+
+    days = {}
+    delivery_totals = deliveries.values("date").annotate(
+        delivered=Sum("bottles_delivered"),
+        returned=Sum("bottles_returned"),
+        count=Count("id"),
+        pending=Sum(Greatest(F("total_amount") - F("amount_received"), Value(Decimal("0")))),
+    )
+    for row in delivery_totals:
+        days[row["date"]] = rollup_model(
+            date=row["date"],
+            bottles_delivered=row["delivered"] or 0,
+            bottles_returned=row["returned"] or 0,
+            delivery_count=row["count"],
+            new_pending=row["pending"] or 0,
+        )
+    for row in transactions.values("date").annotate(cash=Sum("amount")):
+        day = days.setdefault(row["date"], rollup_model(date=row["date"]))
+        day.cash_collected = row["cash"] or 0
+
+    with transaction.atomic():
+        rollups.delete()
+        rollup_model.objects.bulk_create(days.values(), batch_size=500)
+    return len(days)
+
+
+def totals_between(start, end):
+    """Summed rollup columns for start..end inclusive, one query."""
+    return DailyRollup.objects.filter(date__gte=start, date__lte=end).aggregate(
+        cash_collected=Sum("cash_collected"),
+        bottles_delivered=Sum("bottles_delivered"),
+        bottles_returned=Sum("bottles_returned"),
+        delivery_count=Sum("delivery_count"),
+        new_pending=Sum("new_pending"),
+    )
+
+
+def dashboard_totals(today):
+    """Today's and this month's cash in a single query over this month's rows."""
+    return DailyRollup.objects.filter(date__gte=today.replace(day=1)).aggregate(
+        daily=Sum("cash_collected", filter=Q(date=today)),
+        monthly=Sum("cash_collected"),
+    )
+
+
+def monthly_totals(year):
+    """One row per month of ``year`` with summed rollup columns."""
+    return (
+        DailyRollup.objects.filter(date__year=year)
+        .annotate(month=TruncMonth("date"))
+        .values("month")
+        .annotate(
+            cash_collected=Sum("cash_collected"),
+            bottles_delivered=Sum("bottles_delivered"),
+            bottles_returned=Sum("bottles_returned"),
+            delivery_count=Sum("delivery_count"),
+            new_pending=Sum("new_pending"),
+        )
+        .order_by("month")
+    )
@@ -0,0 +1,64 @@
+"""
+Read/write split for the SQLite database.
+
+Both aliases open the same file in WAL mode (see settings.DATABASES), which
+lets any number of readers run alongside the one writer. The ``replica``
+alias is a query_only reader without the IMMEDIATE write lock, so report
+and list pages can't hold up delivery entry, and ledger writes always go to
+``default``.
+
+Reads only go to the replica inside replica_reads() / @reads_from_replica,
+for report and list views, and never while this thread has a transaction
+open on ``default`` (the replica can't see its uncommitted writes).
+Everything else reads from ``default`` as before.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+
+READ_ALIAS = "replica"
+WRITE_ALIAS = "default"
+
+_reading = ContextVar("replica_reads", default=False)
+
+
+def read_alias():
+    return READ_ALIAS if READ_ALIAS in settings.DATABASES else WRITE_ALIAS
+
+
+@contextmanager
+def replica_reads():
+    token = _reading.set(True)
+    try:
+        yield
+    finally:
+        _reading.reset(token)
+
+
+def reads_from_replica(view):
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        with replica_reads():
+            return view(*args, **kwargs)
+    return wrapped
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _reading.get() and not connections[WRITE_ALIAS].in_atomic_block:
+            return read_alias()
+        return WRITE_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return WRITE_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # same file behind both aliases
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == WRITE_ALIAS
@@ -0,0 +1,148 @@
+"""
+Route planning from delivery history.
+
+Each active customer's typical delivery interval (median gap between their
+recent delivery days) and expected bottles (mean of their recent deliveries)
+come from one windowed query: LAG(date) over each customer's deliveries in
+the lookback window. Their next stops follow from the last delivery, a
+missed stop rolls forward to the first planned day as overdue.
+
+Stops are materialized in ScheduledStop for the next N days so the route
+sheet is one indexed read of a single day. The nightly refresh is
+incremental: it only replans customers touched since the last run (any
+posting, edit or delete bumps Customer.updated_at), customers with a stop
+that has gone past, and customers whose next stop enters the horizon. The
+next stop past the horizon is kept per customer in NextStop, a customer
+whose interval is longer than the horizon has no ScheduledStop to go by.
+"""
+import statistics
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import Lag
+from django.utils import timezone
+
+from .models import Customer, Delivery, NextStop, RoutePlanRun, ScheduledStop
+
+
+DEFAULT_DAYS = 7
+LOOKBACK_DAYS = 120
+RECENT = 6  # gaps/deliveries that make up a customer's pattern
+LAPSED_AFTER = 4  # missed intervals before a customer drops off the route
+
+Pattern = namedtuple("Pattern", "interval expected_bottles last_delivery")
+
+
+def delivery_patterns(today, customer_ids=None):
+    """{customer id: Pattern} for active customers with at least two delivery days."""
+    deliveries = Delivery.objects.filter(
+        date__gte=today - timedelta(days=LOOKBACK_DAYS), date__lte=today,
+        bottles_delivered__gt=0, customer__is_active=True,
+    )
+    if customer_ids is not None:
+        deliveries = deliveries.filter(customer_id__in=customer_ids)
+    rows = deliveries.annotate(
+        previous=Window(Lag("date"), partition_by=[F("customer_id")], order_by=[F("date").asc(), F("id").asc()]),
+    ).order_by("customer_id", "date", "id").values_list("customer_id", "date", "previous", "bottles_delivered")
+
+    history = defaultdict(lambda: {"gaps": [], "bottles": [], "last": None})
+    for customer_id, day, previous, bottles in rows.iterator(chunk_size=5000):
+        entry = history[customer_id]
+        if previous is not None and day != previous:
+            entry["gaps"].append((day - previous).days)
+        entry["bottles"].append(bottles)
+        entry["last"] = day
+
+    return {
+        customer_id: Pattern(
+            max(round(statistics.median(entry["gaps"][-RECENT:])), 1),
+            max(round(statistics.mean(entry["bottles"][-RECENT:])), 1),
+            entry["last"],
+        )
+        for customer_id, entry in history.items()
+        if entry["gaps"]
+    }
+
+
+def stops_for(customer_id, pattern, start, end):
+    """(stops in start..end, first due day after end or None once lapsed)."""
+    due = pattern.last_delivery + timedelta(days=pattern.interval)
+    overdue = max((start - due).days, 0)
+    if overdue > pattern.interval * LAPSED_AFTER:
+        return [], None
+    stops = []
+    due = max(due, start)
+    while due <= end:
+        stops.append(ScheduledStop(
+            customer_id=customer_id, date=due, expected_bottles=pattern.expected_bottles,
+            interval_days=pattern.interval, last_delivery=pattern.last_delivery, overdue_days=overdue,
+        ))
+        overdue = 0
+        due += timedelta(days=pattern.interval)
+    return stops, due
+
+
+def customers_to_replan(checkpoint, today, end):
+    customers = set(
+        Customer.objects.filter(updated_at__gte=checkpoint.started_at).values_list("id", flat=True)
+    )
+    customers.update(ScheduledStop.objects.filter(date__lt=today).values_list("customer_id", flat=True))
+    customers.update(NextStop.objects.filter(date__lte=end).values_list("customer_id", flat=True))
+    return customers
+
+
+def plan_routes(today=None, days=DEFAULT_DAYS, full=False):
+    """
+    Materialize stops for today..today+days-1. Replans everyone when
+    ``full`` or on the first run, otherwise only customers that need it.
+    """
+    started_at = timezone.now()
+    today = today or timezone.localdate()
+    end = today + timedelta(days=days - 1)
+    checkpoint = None if full else RoutePlanRun.objects.order_by("-id").first()
+
+    with transaction.atomic():
+        customers = None if checkpoint is None else customers_to_replan(checkpoint, today, end)
+        patterns = delivery_patterns(today, customers)
+
+        for model in (ScheduledStop, NextStop):
+            stale = model.objects.all()
+            if customers is not None:
+                stale = stale.filter(customer_id__in=customers)
+            stale.delete()
+        # past days go either way, the sheet only looks forward
+        ScheduledStop.objects.filter(date__lt=today).delete()
+
+        stops, upcoming = [], []
+        for customer_id, pattern in patterns.items():
+            planned, next_due = stops_for(customer_id, pattern, today, end)
+            stops.extend(planned)
+            if next_due is not None:
+                upcoming.append(NextStop(customer_id=customer_id, date=next_due))
+        ScheduledStop.objects.bulk_create(stops, batch_size=500)
+        NextStop.objects.bulk_create(upcoming, batch_size=500)
+
+        return RoutePlanRun.objects.create(
+            started_at=started_at,
+            start=today,
+            days=days,
+            full=checkpoint is None,
+            customers_planned=len(patterns),
+            stops=len(stops),
+        )
+
+
+def route_sheet(day):
+    """Stops for ``day`` with their customers, one query however many there are."""
+    return list(
+        ScheduledStop.objects.filter(date=day)
+        .select_related("customer")
+        .only(
+            "date", "expected_bottles", "interval_days", "last_delivery", "overdue_days",
+            "customer__name", "customer__phone", "customer__address",
+            "customer__bottles_at_site", "customer__pending_balance",
+        )
+        .order_by("customer__address", "customer__name", "customer_id")
+    )
@@ -0,0 +1,97 @@
+"""
+Customer search.
+
+On SQLite customers are mirrored into an FTS5 table (delivery_customer_fts,
+kept in sync by triggers from migration 0013) over name, address and the
+digits-only phone, and queries are prefix matches ranked by bm25. Other
+databases fall back to plain filters on the same columns.
+
+A query that is only a phone number matches numbers that start or end with
+it (from MIN_SUFFIX_DIGITS digits), people quote the last few digits as often
+as the first ones. Both are range scans on indexed columns: phone_digits and
+phone_reversed (the digits backwards, so a suffix is a prefix there).
+Matches come in number order.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Customer
+
+
+PER_PAGE = 50
+AUTOCOMPLETE_LIMIT = 20
+FTS_TABLE = "delivery_customer_fts"
+
+# Shorter phone queries only match the start of numbers: "03" ends a few
+# thousand numbers but starts nearly all of them, and a prefix alone reads
+# straight down the index in number order.
+MIN_SUFFIX_DIGITS = 4
+
+_PHONE_PUNCTUATION = re.compile(r"[\s\-+().]")
+_WORD = re.compile(r"\w+")
+
+
+def normalize_phone(phone):
+    """Keep only the digits, so '0300-123 4567' and '03001234567' match."""
+    return re.sub(r"\D", "", phone or "")
+
+
+def phone_query(query):
+    """The digits of a query that is only a phone number (digits and punctuation), else ""."""
+    compact = _PHONE_PUNCTUATION.sub("", query)
+    return compact if compact.isdigit() else ""
+
+
+def phone_condition(digits):
+    """Numbers starting (or ending) with ``digits``, as index range scans (":" sorts right after "9")."""
+    condition = Q(phone_digits__gte=digits, phone_digits__lt=digits + ":")
+    if len(digits) >= MIN_SUFFIX_DIGITS:
+        backwards = digits[::-1]
+        condition |= Q(phone_reversed__gte=backwards, phone_reversed__lt=backwards + ":")
+    return condition
+
+
+def build_match(query):
+    """FTS5 MATCH expression for a search box query, an AND of word prefixes, or "" if nothing to search."""
+    words = _WORD.findall(query)
+    return " AND ".join(f'"{word}"*' for word in words)
+
+
+def search_customers(query, page=1, per_page=PER_PAGE):
+    """
+    Return (customers, has_next) for one page of ranked results.
+
+    Fetches one extra row instead of counting, so a page is a single query.
+    """
+    offset = (page - 1) * per_page
+    digits = phone_query(query)
+    if digits:
+        results = list(
+            Customer.objects.filter(phone_condition(digits)).order_by("phone_digits", "id")[offset:offset + per_page + 1]
+        )
+    elif connection.vendor == "sqlite":
+        match = build_match(query)
+        if not match:
+            return [], False
+        # every match is ranked, only the rows up to this page are joined
+        results = list(Customer.objects.raw(
+            f"SELECT c.* FROM (SELECT rowid, rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"ORDER BY rank, rowid LIMIT %s) f "
+            f"JOIN delivery_customer c ON c.id = f.rowid ORDER BY f.rank, c.id LIMIT %s OFFSET %s",
+            [match, offset + per_page + 1, per_page + 1, offset],
+        ))
+    else:
+        digits = normalize_phone(query)
+        condition = Q(name__icontains=query)
+        if digits:
+            condition |= Q(phone_digits__startswith=digits)
+        results = list(Customer.objects.filter(condition).order_by("name", "id")[offset:offset + per_page + 1])
+
+    return results[:per_page], len(results) > per_page
+
+
+def autocomplete_customers(query, limit=AUTOCOMPLETE_LIMIT):
+    """The best ``limit`` matches for a customer picker, same search as the list."""
+    return search_customers(query, per_page=limit)[0]
@@ -0,0 +1,113 @@
+from rest_framework import serializers
+
+from .models import Customer, Delivery, Transaction
+from .posting import post_delivery, post_transaction, snapshot
+from .pricing import price_on
+
+
+BULK_LIMIT = 1000
+
+
+def requested_fields(request):
+    """Field names from ?fields=a,b,c, or None for all of them."""
+    if request is None or request.method != "GET":
+        return None
+    raw = request.query_params.get("fields")
+    if not raw:
+        return None
+    return {name.strip() for name in raw.split(",") if name.strip()}
+
+
+class SparseFieldsMixin:
+    """Drop every field not named in ?fields= on reads. Unknown names are ignored."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        wanted = requested_fields(self.context.get("request"))
+        if wanted:
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+
+class CustomerSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    net_balance = serializers.DecimalField(max_digits=11, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = Customer
+        fields = [
+            "id", "name", "phone", "address", "balance", "pending_balance", "net_balance",
+            "bottles_at_site", "is_active", "created_at", "updated_at",
+        ]
+        # balances only move through postings
+        read_only_fields = ["balance", "pending_balance", "created_at", "updated_at"]
+
+
+class DeliverySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    customer_name = serializers.CharField(source="customer.name", read_only=True)
+
+    class Meta:
+        model = Delivery
+        fields = [
+            "id", "customer", "customer_name", "date", "bottles_delivered", "bottles_returned",
+            "total_amount", "amount_received", "is_paid",
+        ]
+        # priced from the bottle price on the delivery's date, like the forms
+        read_only_fields = ["total_amount", "is_paid"]
+        extra_kwargs = {"bottles_delivered": {"min_value": 0}, "bottles_returned": {"min_value": 0}}
+
+    def create(self, validated_data):
+        delivery = Delivery(**validated_data)
+        delivery.total_amount = delivery.bottles_delivered * price_on(delivery.date)
+        return post_delivery(delivery)
+
+    def update(self, instance, validated_data):
+        previous = snapshot(instance)
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.total_amount = instance.bottles_delivered * price_on(instance.date)
+        return post_delivery(instance, previous)
+
+
+class TransactionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    customer_name = serializers.CharField(source="customer.name", read_only=True)
+
+    class Meta:
+        model = Transaction
+        fields = ["id", "customer", "customer_name", "date", "transaction_type", "amount", "description", "delivery"]
+        read_only_fields = ["delivery"]
+
+    def create(self, validated_data):
+        return post_transaction(Transaction(**validated_data))
+
+
+class BulkDeliverySerializer(serializers.Serializer):
+    """
+    One row of a bulk create. Customer is a plain id so validating a batch
+    doesn't cost a query per row, the batch checks them all in one go.
+    """
+    customer = serializers.IntegerField()
+    date = serializers.DateField(required=False, allow_null=True, default=None)
+    bottles_delivered = serializers.IntegerField(min_value=0, default=0)
+    bottles_returned = serializers.IntegerField(min_value=0, default=0)
+    amount_received = serializers.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    @staticmethod
+    def to_row(data):
+        """Validated data in the shape importer._post_chunk() expects."""
+        return {
+            "customer_id": data["customer"],
+            "date": data["date"],
+            "bottles_delivered": data["bottles_delivered"],
+            "bottles_returned": data["bottles_returned"],
+            "amount_received": data["amount_received"],
+            "total_amount": None,
+        }
+
+
+class BulkDeliveryUpdateSerializer(serializers.Serializer):
+    """One row of a bulk update, only the fields given are changed."""
+    id = serializers.IntegerField()
+    date = serializers.DateField(required=False)
+    bottles_delivered = serializers.IntegerField(min_value=0, required=False)
+    bottles_returned = serializers.IntegerField(min_value=0, required=False)
+    amount_received = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
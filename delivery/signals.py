@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import caching, pricing
+from .models import BottlePrice, Customer, Delivery, Transaction
+
+
+@receiver([post_save, post_delete], sender=BottlePrice)
+def bottle_price_changed(sender, **kwargs):
+    pricing.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Customer)
+@receiver([post_save, post_delete], sender=Delivery)
+@receiver([post_save, post_delete], sender=Transaction)
+@receiver([post_save, post_delete], sender=BottlePrice)
+def model_changed(sender, **kwargs):
+    caching.changed(sender)
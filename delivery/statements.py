@@ -0,0 +1,163 @@
+"""
+Customer statements: deliveries, transactions and manual adjustments merged
+into one chronological ledger with a running balance computed by the database.
+
+Amounts are signed from the customer's side. A delivery charges its total,
+payments/advances/partials credit their amount (including the payment record
+each delivery posts) and manual "pending" entries charge. Opening balances and
+hand edits of a customer's counters are the ledger's adjustment entries. The
+running balance is balance minus pending balance, positive meaning the
+customer is in advance, so the last line agrees with Customer.net_balance.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import connections, router
+
+from .models import Delivery
+from .posting import CREDIT_TYPES
+
+
+PER_PAGE = 100
+
+# deliveries and transactions saved without a date (before posting filled it
+# in) sort first, the ledger dates them the same way
+NO_DATE = date.min
+
+_CREDIT_LIST = ", ".join(f"'{t}'" for t in sorted(CREDIT_TYPES))
+_SIGNED_AMOUNT = f"CASE WHEN t.transaction_type IN ({_CREDIT_LIST}) THEN t.amount ELSE -t.amount END"
+
+_LINES_SQL = f"""
+    SELECT COALESCE(d.date, %s) AS day, 0 AS kind, d.id AS id, 'delivery' AS entry,
+           d.bottles_delivered AS delivered, d.bottles_returned AS returned,
+           -d.total_amount AS amount, '' AS description
+    FROM delivery_delivery d
+    WHERE d.customer_id = %s {{delivery_range}}
+    UNION ALL
+    SELECT COALESCE(t.date, %s), 1, t.id, t.transaction_type, NULL, NULL,
+           {_SIGNED_AMOUNT}, COALESCE(t.description, '')
+    FROM delivery_transaction t
+    WHERE t.customer_id = %s {{transaction_range}}
+    UNION ALL
+    SELECT a.date, 2, a.id, 'adjustment',
+           CASE WHEN a.bottles > 0 THEN a.bottles END, CASE WHEN a.bottles < 0 THEN -a.bottles END,
+           a.amount, a.description
+    FROM delivery_ledgerentry a
+    WHERE a.customer_id = %s AND a.source = 'adjustment' {{adjustment_range}}
+"""
+
+
+def _money(value):
+    return Decimal(str(round(value or 0, 2))).quantize(Decimal("0.01"))
+
+
+def _as_date(value):
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def encode_cursor(day, kind, pk):
+    return f"{day.isoformat()}.{kind}.{pk}"
+
+
+def decode_cursor(cursor):
+    try:
+        raw_date, kind, pk = cursor.split(".")
+        return date.fromisoformat(raw_date), int(kind), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _connection():
+    # raw SQL skips the router, ask it which alias reads should use
+    return connections[router.db_for_read(Delivery)]
+
+
+def opening_balance(customer_id, start):
+    """Net balance at the end of the day before ``start``, from the ledger."""
+    from .ledger import balance_on  # ledger imports this module
+
+    if start <= NO_DATE:
+        return Decimal("0.00")
+    return balance_on(customer_id, start - timedelta(days=1))[0]
+
+
+def statement_page(customer_id, start=None, end=None, cursor=None, per_page=PER_PAGE):
+    """
+    One page of the statement, oldest first.
+
+    Returns (opening, lines, next_cursor). The window function runs over the
+    whole (date-ranged) statement before the cursor filter, so running
+    balances on later pages are right without replaying earlier pages.
+    """
+    opening = opening_balance(customer_id, start) if start else Decimal("0.00")
+
+    delivery_range, transaction_range, adjustment_range, range_params = "", "", "", []
+    if start:
+        delivery_range += " AND d.date >= %s"
+        transaction_range += " AND t.date >= %s"
+        adjustment_range += " AND a.date >= %s"
+        range_params.append(start)
+    if end:
+        delivery_range += " AND d.date <= %s"
+        transaction_range += " AND t.date <= %s"
+        adjustment_range += " AND a.date <= %s"
+        range_params.append(end)
+    lines_sql = _LINES_SQL.format(
+        delivery_range=delivery_range, transaction_range=transaction_range, adjustment_range=adjustment_range,
+    )
+    params = [NO_DATE, customer_id, *range_params, NO_DATE, customer_id, *range_params, customer_id, *range_params]
+
+    after = ""
+    position = decode_cursor(cursor)
+    if position:
+        after = "WHERE (day, kind, id) > (%s, %s, %s)"
+        params += list(position)
+    params.append(per_page + 1)
+
+    with _connection().cursor() as db:
+        db.execute(
+            f"""
+            SELECT day, kind, id, entry, delivered, returned, amount, description, running
+            FROM (
+                SELECT lines.*, SUM(amount) OVER (ORDER BY day, kind, id ROWS UNBOUNDED PRECEDING) AS running
+                FROM ({lines_sql}) AS lines
+            ) AS ledger
+            {after}
+            ORDER BY day, kind, id
+            LIMIT %s
+            """,
+            params,
+        )
+        rows = db.fetchall()
+
+    lines = []
+    for day, kind, pk, entry, delivered, returned, amount, description, running in rows[:per_page]:
+        day = _as_date(day)
+        amount = _money(amount)
+        lines.append({
+            "date": None if day == NO_DATE else day,
+            "id": pk,
+            "entry": entry,
+            "is_delivery": kind == 0,
+            "is_adjustment": kind == 2,
+            "bottles_delivered": delivered,
+            "bottles_returned": returned,
+            "charge": -amount if amount < 0 else None,
+            "credit": amount if amount >= 0 else None,
+            "description": description,
+            "balance": opening + _money(running),
+        })
+
+    next_cursor = None
+    if len(rows) > per_page:
+        day, kind, pk = rows[per_page - 1][:3]
+        next_cursor = encode_cursor(_as_date(day), kind, pk)
+    return opening, lines, next_cursor
+
+
+def line_as_json(line):
+    """A statement line with dates and money as strings."""
+    return {
+        key: (value.isoformat() if isinstance(value, date) else str(value) if isinstance(value, Decimal) else value)
+        for key, value in line.items()
+    }
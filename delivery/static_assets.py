@@ -0,0 +1,122 @@
+"""
+Static assets served by the app itself.
+
+collectstatic (with CompressedManifestStorage) writes every file under a
+content-hashed name next to the original, records the mapping in
+staticfiles.json, and stores a gzip copy (name.gz) of each text asset that
+compresses. Templates get hashed URLs from {% static %}.
+
+StaticAssetsMiddleware answers /static/ requests from STATIC_ROOT before the
+session and auth layers run. Hashed names never change content, so
+they go out with a one year "immutable" Cache-Control and browsers don't
+revalidate them; unhashed names get a short max-age and an ETag. Clients that
+accept gzip get the precompressed copy, nothing is compressed per request.
+The file table is built once per worker from the manifest; a deploy restarts
+the workers after collectstatic.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+
+
+COMPRESSIBLE = {".css", ".js", ".map", ".svg", ".json", ".txt", ".html", ".xml", ".ico"}
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, max-age=60"
+
+
+class CompressedManifestStorage(ManifestStaticFilesStorage):
+    """Manifest storage that also writes name.gz for text assets at collect time."""
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # ✅ not collected yet (tests, a fresh checkout): plain URL instead of a 500
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in sorted({*paths, *self.hashed_files.values()}):
+            if posixpath.splitext(name)[1].lower() not in COMPRESSIBLE:
+                continue
+            with self.open(name) as original:
+                data = original.read()
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) >= len(data):
+                continue
+            if self.exists(f"{name}.gz"):
+                self.delete(f"{name}.gz")
+            self._save(f"{name}.gz", ContentFile(compressed))
+            yield name, f"{name}.gz", True
+
+
+def build_file_table(storage):
+    """{url path: (file path, is hashed, etag, has .gz)} for everything in the manifest."""
+    table = {}
+    prefix = settings.STATIC_URL
+    for original, hashed in storage.hashed_files.items():
+        for name, immutable in ((original, False), (hashed, True)):
+            path = storage.path(name)
+            if not os.path.isfile(path):
+                continue
+            etag = f'"{posixpath.basename(hashed)}"'
+            table[prefix + name] = (path, immutable, etag, os.path.isfile(f"{path}.gz"))
+    return table
+
+
+def accepts_gzip(request):
+    return any(
+        part.split(";")[0].strip() == "gzip" and not part.replace(" ", "").endswith(";q=0")
+        for part in request.headers.get("Accept-Encoding", "").split(",")
+    )
+
+
+class StaticAssetsMiddleware:
+    """Serve collected static files with long-lived caching and precompressed gzip."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # only a manifest storage knows which names are hashed
+        if not settings.STATIC_URL.startswith("/") or not hasattr(staticfiles_storage, "hashed_files"):
+            raise MiddlewareNotUsed
+        self.files = build_file_table(staticfiles_storage)
+        if not self.files:
+            raise MiddlewareNotUsed  # nothing collected, runserver's handler serves from the apps
+
+    def __call__(self, request):
+        entry = self.files.get(request.path_info) if request.method in ("GET", "HEAD") else None
+        if entry is None:
+            return self.get_response(request)
+        return self.serve(request, *entry)
+
+    def serve(self, request, path, immutable, etag, has_gzip):
+        headers = {"Cache-Control": IMMUTABLE if immutable else REVALIDATE, "ETag": etag}
+        content_type, _ = mimetypes.guess_type(path)
+        compressible = os.path.splitext(path)[1].lower() in COMPRESSIBLE
+        if compressible:
+            headers["Vary"] = "Accept-Encoding"
+
+        if etag in request.headers.get("If-None-Match", ""):
+            response = HttpResponseNotModified()
+        else:
+            if has_gzip and accepts_gzip(request):
+                path = f"{path}.gz"
+                headers["Content-Encoding"] = "gzip"
+            if request.method == "HEAD":
+                response = HttpResponse(content_type=content_type)
+                response["Content-Length"] = os.path.getsize(path)
+            else:
+                response = FileResponse(open(path, "rb"), content_type=content_type)
+                del response["Content-Disposition"]  # inline "x.css.gz" would only confuse
+        for header, value in headers.items():
+            response[header] = value
+        return response
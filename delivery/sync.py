@@ -0,0 +1,110 @@
+"""
+Offline batch sync for drivers.
+
+A driver's app records deliveries offline and pushes the whole route as one
+compact upload, each event a positional list:
+
+    [key, customer, date, bottles_delivered, bottles_returned, amount_received]
+
+``key`` is generated on the device and never reused. Keys already in
+SyncEvent (from an earlier, maybe timed out, upload) are answered as
+duplicates without posting again, the rest are posted in one transaction with
+the importer's bulk poster and their keys stored alongside. Every upload gets
+a result per event and the device's sync cursor, the id of its latest
+SyncEvent, which ``events_since()`` takes to list what the server has.
+"""
+from django.db import IntegrityError, transaction
+
+from .importer import _parse_row, post_rows
+from .models import SyncEvent
+
+
+COLUMNS = ["key", "customer", "date", "bottles_delivered", "bottles_returned", "amount_received"]
+MAX_EVENTS = 1000
+MAX_KEY_LENGTH = 64
+
+
+class SyncConflict(Exception):
+    """Another upload stored one of the keys at the same time, retrying is safe."""
+
+
+def _parse_event(event):
+    """(key, row) from one compact event, raises ValueError like _parse_row()."""
+    if not isinstance(event, list) or not 1 <= len(event) <= len(COLUMNS):
+        raise ValueError(f"Event must be a list of up to {len(COLUMNS)} values: {', '.join(COLUMNS)}")
+    key = event[0]
+    if not isinstance(key, str) or not 0 < len(key) <= MAX_KEY_LENGTH:
+        raise ValueError(f"key must be a string of 1 to {MAX_KEY_LENGTH} characters")
+    return key, _parse_row(dict(zip(COLUMNS[1:], event[1:])))
+
+
+def sync_events(events, device=""):
+    """
+    Apply one upload. Returns (results, cursor), one result per event in order:
+
+    * ``{"key": k, "status": "created", "delivery": id}``
+    * ``{"key": k, "status": "duplicate", "delivery": id}``, already synced
+    * ``{"key": k, "status": "rejected", "error": message}``, not posted,
+      the key isn't stored so the fixed event can be sent again with it
+    """
+    results = []
+    pending = []  # (index, row) to post
+    keys = {}  # key -> index of its first event in this upload
+    for index, event in enumerate(events):
+        try:
+            key, row = _parse_event(event)
+        except ValueError as exc:
+            key = event[0] if isinstance(event, list) and event and isinstance(event[0], str) else None
+            results.append({"key": key, "status": "rejected", "error": str(exc)})
+            continue
+        results.append({"key": key})
+        if key in keys:
+            # the same event twice in one upload, answered from the first one below
+            results[index]["status"] = "duplicate"
+            continue
+        keys[key] = index
+        pending.append((index, row))
+
+    try:
+        with transaction.atomic():
+            known = dict(SyncEvent.objects.filter(key__in=keys).values_list("key", "delivery_id"))
+            for key, delivery_id in known.items():
+                results[keys[key]].update(status="duplicate", delivery=delivery_id)
+            pending = [(index, row) for index, row in pending if results[index]["key"] not in known]
+
+            posted, errors = post_rows(pending)
+            for index, message in errors:
+                results[index].update(status="rejected", error=message)
+            for index, delivery in posted.items():
+                results[index].update(status="created", delivery=delivery.pk)
+
+            SyncEvent.objects.bulk_create([
+                SyncEvent(key=results[index]["key"], device=device, delivery=delivery)
+                for index, delivery in posted.items()
+            ])
+    except IntegrityError:
+        raise SyncConflict("A concurrent upload stored some of these keys, send the batch again")
+
+    # in-upload repeats point at whatever their first event ended up as
+    for result in results:
+        if result["status"] == "duplicate" and "delivery" not in result:
+            first = results[keys[result["key"]]]
+            if first["status"] == "rejected":
+                result.update(status="rejected", error=first["error"])
+            else:
+                result["delivery"] = first["delivery"]
+
+    return results, sync_cursor(device)
+
+
+def sync_cursor(device=""):
+    return SyncEvent.objects.filter(device=device).order_by("-id").values_list("id", flat=True).first() or 0
+
+
+def events_since(device="", cursor=0, limit=MAX_EVENTS):
+    """Keys the server has stored for a device after ``cursor``, oldest first."""
+    return list(
+        SyncEvent.objects.filter(device=device, id__gt=cursor)
+        .order_by("id")
+        .values("id", "key", "delivery_id")[:limit]
+    )
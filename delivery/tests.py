@@ -1,3 +1,1437 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import re
+import tempfile
+import zipfile
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from pathlib import Path
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, router, transaction
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import async_views, pricing
+from .bottles import (
+    bottles_at_site, customers_holding, fleet_bottles_out, long_holders, rebuild_bottle_snapshots,
+)
+from .caching import changed, check_shared_caches, counters as cache_counters
+
+from .importer import import_deliveries
+from .invoicing import gather_month, generate_statements
+from .ledger import balance_on, close_months, replay_history
+from .metrics import fingerprint, stats as request_stats
+from .models import (
+    BottlePrice, BottleSnapshot, Customer, DailyRollup, Delivery, FleetBottleSnapshot, LedgerEntry,
+    LedgerSnapshot, ReconciliationRun, ScheduledStop, Transaction,
+)
+from .posting import post_delivery, post_delivery_edits, post_transaction, reverse_transaction, snapshot
+from .pricing import price_on
+from .reconcile import reconcile
+from .routers import replica_reads
+from .routes import delivery_patterns, plan_routes
+from .rollups import rebuild_rollups
+from .search import AUTOCOMPLETE_LIMIT, search_customers
+from .statements import statement_page
+
+
+class DeliveryImportTests(TestCase):
+    ROWS = [
+        # customer index, delivered, returned, received
+        (0, 5, 0, "300"),
+        (0, 3, 2, "100"),
+        (1, 2, 1, "0"),
+        (0, 1, 1, "900"),
+        (1, 4, 0, "500"),
+    ]
+
+    def setUp(self):
+        cache.clear()
+        BottlePrice.objects.create(price_per_bottle=Decimal("100"))
+
+    def make_customers(self):
+        return [
+            Customer.objects.create(name="Ali", bottles_at_site=2),
+            Customer.objects.create(name="Sara", pending_balance=Decimal("50")),
+        ]
+
+    def test_bulk_import_matches_row_by_row_save(self):
+        row_customers = self.make_customers()
+        for index, delivered, returned, received in self.ROWS:
+            customer = Customer.objects.get(pk=row_customers[index].pk)
+            Delivery(
+                customer=customer,
+                date="2025-01-10",
+                bottles_delivered=delivered,
+                bottles_returned=returned,
+                amount_received=Decimal(received),
+                total_amount=delivered * Decimal("100"),
+            ).save()
+
+        bulk_customers = self.make_customers()
+        lines = ["customer,date,bottles_delivered,bottles_returned,amount_received"]
+        for index, delivered, returned, received in self.ROWS:
+            lines.append(f"{bulk_customers[index].pk},2025-01-10,{delivered},{returned},{received}")
+        result = import_deliveries(io.StringIO("\n".join(lines)), chunk_size=2)
+
+        self.assertEqual(result.imported, len(self.ROWS))
+        self.assertEqual(result.errors, [])
+        for expected, actual in zip(row_customers, bulk_customers):
+            expected.refresh_from_db()
+            actual.refresh_from_db()
+            self.assertEqual(actual.balance, expected.balance)
+            self.assertEqual(actual.pending_balance, expected.pending_balance)
+            self.assertEqual(actual.bottles_at_site, expected.bottles_at_site)
+        self.assertEqual(
+            Transaction.objects.filter(customer__in=bulk_customers).count(), len(self.ROWS)
+        )
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        customer = Customer.objects.create(name="Ali")
+        data = "\n".join([
+            f'{{"customer": {customer.pk}, "bottles_delivered": 2, "amount_received": 200}}',
+            '{"customer": 999999, "bottles_delivered": 1}',
+            '{"customer": "x"}',
+            "not json",
+        ])
+        result = import_deliveries(io.StringIO(data), fmt="jsonl")
+
+        self.assertEqual(result.rows, 4)
+        self.assertEqual(result.imported, 1)
+        self.assertEqual([line for line, _ in result.errors], [3, 4, 2])
+        customer.refresh_from_db()
+        self.assertEqual(customer.bottles_at_site, 2)
+
+
+class PostingTests(TestCase):
+    def assertPostingQueries(self, expected, func, *args):
+        """Count the posting's own statements, not the test's savepoints."""
+        with CaptureQueriesContext(connection) as ctx:
+            func(*args)
+        statements = [q["sql"] for q in ctx.captured_queries if "SAVEPOINT" not in q["sql"]]
+        self.assertLessEqual(len(statements), expected, statements)
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Ali", balance=Decimal("50"))
+
+    def test_new_delivery_posts_in_three_queries(self):
+        delivery = Delivery(
+            customer=self.customer, bottles_delivered=4, bottles_returned=1,
+            total_amount=Decimal("400"), amount_received=Decimal("100"),
+        )
+        self.assertPostingQueries(3, post_delivery, delivery)
+
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.balance, Decimal("0"))
+        self.assertEqual(self.customer.pending_balance, Decimal("250"))
+        self.assertEqual(self.customer.bottles_at_site, 3)
+        self.assertFalse(delivery.is_paid)
+        self.assertEqual(delivery.transactions.get().transaction_type, "partial")
+
+    def test_edit_reverses_old_posting_in_three_queries(self):
+        delivery = post_delivery(Delivery(
+            customer=self.customer, bottles_delivered=4,
+            total_amount=Decimal("400"), amount_received=Decimal("100"),
+        ))
+        delivery = Delivery.objects.get(pk=delivery.pk)
+        previous = snapshot(delivery)
+        delivery.bottles_delivered = 2
+        delivery.total_amount = Decimal("200")
+        delivery.amount_received = Decimal("300")
+
+        self.assertPostingQueries(3, post_delivery, delivery, previous)
+
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.balance, Decimal("150"))
+        self.assertEqual(self.customer.pending_balance, Decimal("0"))
+        self.assertEqual(self.customer.bottles_at_site, 2)
+        self.assertEqual(delivery.transactions.get().amount, Decimal("300"))
+
+    def test_posting_views_need_a_login(self):
+        delivery = post_delivery(Delivery(
+            customer=self.customer, bottles_delivered=1, total_amount=Decimal("100"), amount_received=Decimal("0"),
+        ))
+        payment = post_transaction(Transaction(customer=self.customer, amount=Decimal("30")))
+        self.customer.refresh_from_db()
+        before = (self.customer.net_balance, self.customer.bottles_at_site)
+
+        edit = self.client.post(reverse("delivery_edit", args=[delivery.pk]), {
+            "customer": self.customer.pk, "bottles_delivered": 9, "bottles_returned": 0,
+            "total_amount": "900", "amount_received": "0",
+        })
+        delete = self.client.post(reverse("transaction_delete", args=[payment.pk]))
+        self.assertEqual(edit.status_code, 302)
+        self.assertIn(reverse("login_pg"), edit.url)
+        self.assertIn(reverse("login_pg"), delete.url)
+        self.assertTrue(Transaction.objects.filter(pk=payment.pk).exists())
+        self.customer.refresh_from_db()
+        self.assertEqual((self.customer.net_balance, self.customer.bottles_at_site), before)
+
+    def test_moving_a_delivery_reverses_the_old_customer(self):
+        other = Customer.objects.create(name="Sara")
+        delivery = post_delivery(Delivery(
+            customer=self.customer, date=date(2025, 6, 1), bottles_delivered=3,
+            total_amount=Decimal("300"), amount_received=Decimal("0"),
+        ))
+        delivery = Delivery.objects.get(pk=delivery.pk)
+        previous = snapshot(delivery)
+        delivery.customer = other
+        post_delivery(delivery, previous)
+
+        self.customer.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.customer.net_balance, self.customer.bottles_at_site), (Decimal("50.00"), 0))
+        self.assertEqual((other.net_balance, other.bottles_at_site), (Decimal("-300.00"), 3))
+        # counters and ledger agree
+        today = timezone.localdate()
+        self.assertEqual(balance_on(self.customer.pk, today), (Decimal("50.00"), 0))
+        self.assertEqual(balance_on(other.pk, today), (Decimal("-300.00"), 3))
+
+    def test_batch_edit_can_move_a_delivery(self):
+        other = Customer.objects.create(name="Sara")
+        delivery = post_delivery(Delivery(
+            customer=self.customer, bottles_delivered=3, total_amount=Decimal("300"), amount_received=Decimal("0"),
+        ))
+        previous = snapshot(delivery)
+        delivery.customer = other
+        post_delivery_edits([(delivery, previous)])
+
+        self.customer.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.customer.net_balance, self.customer.bottles_at_site), (Decimal("50.00"), 0))
+        self.assertEqual((other.net_balance, other.bottles_at_site), (Decimal("-300.00"), 3))
+        self.assertEqual(delivery.transactions.get().customer, other)
+
+    def test_manual_transaction_nets_against_pending(self):
+        Customer.objects.filter(pk=self.customer.pk).update(balance=0, pending_balance=Decimal("80"))
+        txn = Transaction(customer=self.customer, amount=Decimal("100"), transaction_type="payment")
+
+        self.assertPostingQueries(2, post_transaction, txn)
+
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.balance, Decimal("20"))
+        self.assertEqual(self.customer.pending_balance, Decimal("0"))
+        self.assertIsNotNone(txn.date)
+
+
+class DeliveryListTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("staff", password="pw")
+        self.client.force_login(self.user)
+        self.customers = [Customer.objects.create(name=f"Customer {i}") for i in range(3)]
+
+    def add_deliveries(self, count):
+        Delivery.objects.bulk_create(
+            Delivery(customer=self.customers[i % 3], date=date(2025, 1, 1) + timedelta(days=i % 7))
+            for i in range(count)
+        )
+        changed(Delivery)  # bulk_create sends no signals
+
+    @override_settings(AUTH_USER_CACHE_SECONDS=0)  # every request loads the user, not just the first
+    def test_query_count_does_not_grow_with_history(self):
+        self.add_deliveries(5)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse("delivery_list"))
+
+        self.add_deliveries(120)
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(reverse("delivery_list"))
+
+        self.assertEqual(len(small), len(large))
+
+    def test_cursor_walks_every_row_once(self):
+        self.add_deliveries(120)
+        seen = []
+        query = {"customer": self.customers[1].pk}
+        while True:
+            response = self.client.get(reverse("delivery_list"), query)
+            page = response.context["deliveries"]
+            seen.extend(d.pk for d in page)
+            if not page.has_next:
+                break
+            query["cursor"] = page.next_cursor
+
+        expected = Delivery.objects.filter(customer=self.customers[1]).order_by("-date", "-id")
+        self.assertEqual(seen, list(expected.values_list("pk", flat=True)))
+
+
+class TransactionListTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("staff", password="pw"))
+        self.customer = Customer.objects.create(name="Ali")
+        Transaction.objects.bulk_create([
+            Transaction(customer=self.customer, date=date(2025, 1, 1), amount=Decimal("100"), transaction_type="payment"),
+            Transaction(customer=self.customer, date=date(2025, 1, 2), amount=Decimal("250"), transaction_type="advance"),
+            Transaction(customer=self.customer, date=date(2025, 2, 1), amount=Decimal("40"), transaction_type="payment"),
+        ])
+
+    def test_filters_and_total_cover_the_whole_filtered_set(self):
+        response = self.client.get(reverse("transaction_list"), {
+            "date_from": "2025-01-01", "date_to": "2025-01-31", "amount_min": "50",
+        })
+        self.assertEqual(response.context["filtered_count"], 2)
+        self.assertEqual(response.context["filtered_total"], Decimal("350"))
+
+        response = self.client.get(reverse("transaction_list"), {"transaction_type": "payment"})
+        self.assertEqual([t.amount for t in response.context["transactions"]], [Decimal("40"), Decimal("100")])
+
+
+class DailyRollupTests(TestCase):
+    def rollups(self):
+        # triggers leave zeroed rows behind for days that emptied out, a rebuild doesn't
+        return list(DailyRollup.objects.exclude(delivery_count=0, cash_collected=0).order_by("date").values(
+            "date", "cash_collected", "bottles_delivered", "bottles_returned", "delivery_count", "new_pending",
+        ))
+
+    def test_triggers_match_a_full_rebuild(self):
+        customer = Customer.objects.create(name="Ali")
+        first = post_delivery(Delivery(
+            customer=customer, date=date(2025, 3, 1), bottles_delivered=4, bottles_returned=1,
+            total_amount=Decimal("400"), amount_received=Decimal("100"),
+        ))
+        post_delivery(Delivery(
+            customer=customer, date=date(2025, 3, 2), bottles_delivered=2,
+            total_amount=Decimal("200"), amount_received=Decimal("200"),
+        ))
+        post_transaction(Transaction(customer=customer, date=date(2025, 3, 2), amount=Decimal("75")))
+
+        # move the first delivery to another day and change its numbers
+        previous = snapshot(first)
+        first.date = date(2025, 3, 2)
+        first.bottles_delivered = 3
+        first.total_amount = Decimal("300")
+        post_delivery(first, previous)
+        Transaction.objects.filter(amount=Decimal("75")).delete()
+
+        maintained = self.rollups()
+        rebuild_rollups()
+        self.assertEqual(maintained, self.rollups())
+        self.assertEqual(maintained[-1]["delivery_count"], 2)
+        self.assertEqual(maintained[-1]["cash_collected"], Decimal("300"))
+        self.assertEqual(maintained[-1]["new_pending"], Decimal("200"))
+
+    def test_dashboard_reads_rollups(self):
+        self.client.force_login(User.objects.create_user("staff", password="pw"))
+        customer = Customer.objects.create(name="Ali")
+        post_transaction(Transaction(customer=customer, amount=Decimal("120")))
+
+        response = self.client.get(reverse("dashboard"))
+        self.assertEqual(response.context["daily_total"], Decimal("120"))
+        self.assertEqual(response.context["monthly_total"], Decimal("120"))
+
+
+class PricingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def add_price(self, price, day):
+        row = BottlePrice.objects.create(price_per_bottle=Decimal(price))
+        # updated_at is auto_now, back-date it the way history would look
+        BottlePrice.objects.filter(pk=row.pk).update(
+            updated_at=timezone.make_aware(datetime.combine(day, time(12)))
+        )
+        pricing.invalidate()
+
+    def test_prices_follow_the_delivery_date(self):
+        self.add_price("80", date(2025, 1, 1))
+        self.add_price("100", date(2025, 6, 1))
+
+        self.assertEqual(price_on(date(2025, 5, 31)), Decimal("80"))
+        self.assertEqual(price_on(date(2025, 6, 1)), Decimal("100"))
+        self.assertEqual(price_on(date(2024, 12, 1)), Decimal("80"))
+        with self.assertNumQueries(0):
+            price_on(date(2025, 3, 1))
+
+    def test_new_price_is_picked_up_after_save(self):
+        self.add_price("80", date(2025, 1, 1))
+        self.assertEqual(price_on(), Decimal("80"))
+
+        BottlePrice.objects.create(price_per_bottle=Decimal("120"))
+        self.assertEqual(price_on(), Decimal("120"))
+        self.assertEqual(price_on(date(2025, 2, 1)), Decimal("80"))
+
+
+class CustomerSearchTests(TestCase):
+    def setUp(self):
+        self.ali = Customer.objects.create(name="Ali Raza", phone="0300-123 4567", address="House 5, Gulberg")
+        self.sara = Customer.objects.create(name="Sara Alvi", phone="03211234567", address="DHA Phase 5")
+
+    def names(self, query):
+        return [c.name for c in search_customers(query)[0]]
+
+    def test_phone_matches_ignore_formatting(self):
+        self.assertEqual(self.names("03001234567"), ["Ali Raza"])
+        self.assertEqual(self.names("0321-123"), ["Sara Alvi"])
+
+    def test_trailing_digits_find_the_customer(self):
+        Customer.objects.create(name="Bilal", phone="0333 765-4321")
+        self.assertEqual(self.names("4321"), ["Bilal"])
+        self.assertEqual(self.names("765 4321"), ["Bilal"])
+        self.assertEqual(self.names("1234567"), ["Ali Raza", "Sara Alvi"])
+        # too short to be a suffix, only the start of a number
+        self.assertEqual(self.names("321"), [])
+        self.assertEqual(self.names("032"), ["Sara Alvi"])
+
+    def test_prefix_search_over_name_and_address(self):
+        self.assertEqual(self.names("gulb"), ["Ali Raza"])
+        self.assertEqual(set(self.names("al")), {"Ali Raza", "Sara Alvi"})
+        self.assertEqual(self.names("sara dha"), ["Sara Alvi"])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.ali.name = "Bilal Raza"
+        self.ali.phone = "0333 7654321"
+        self.ali.save()
+        self.assertEqual(self.names("bilal"), ["Bilal Raza"])
+        self.assertEqual(self.names("03337654"), ["Bilal Raza"])
+        self.assertEqual(self.names("03001234567"), [])
+
+        self.sara.delete()
+        self.assertEqual(self.names("sara"), [])
+
+    def test_pages_do_not_overlap(self):
+        Customer.objects.bulk_create(Customer(name=f"Hamza {i}") for i in range(7))
+        first, has_next = search_customers("hamza", page=1, per_page=5)
+        second, more = search_customers("hamza", page=2, per_page=5)
+        self.assertTrue(has_next)
+        self.assertFalse(more)
+        self.assertEqual(len({c.pk for c in first + second}), 7)
+
+
+    def test_best_match_is_ranked_among_all_matches(self):
+        Customer.objects.bulk_create(
+            Customer(name=f"Hamza {i}", address=f"House {i}, Street 12, Model Town, Lahore") for i in range(1100)
+        )
+        Customer.objects.create(name="Hamza")
+        self.assertEqual([c.name for c in search_customers("hamza", per_page=1)[0]], ["Hamza"])
+        second = search_customers("hamza", page=2, per_page=1)[0]
+        self.assertNotEqual([c.name for c in second], ["Hamza"])
+
+
+class CustomerPickerTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("staff", password="pw"))
+        self.ali = Customer.objects.create(name="Ali Raza", phone="03001234567")
+        Customer.objects.bulk_create(Customer(name=f"Hamza {i}") for i in range(30))
+        changed(Customer)
+
+    def test_autocomplete_is_a_limited_prefix_search(self):
+        url = reverse("customer_autocomplete")
+        self.assertEqual(len(self.client.get(url, {"q": "hamz"}).json()["results"]), AUTOCOMPLETE_LIMIT)
+        self.assertEqual(
+            self.client.get(url, {"q": "0300"}).json()["results"],
+            [{"id": self.ali.pk, "text": str(self.ali)}],
+        )
+        self.assertEqual(self.client.get(url).json()["results"], [])
+
+    def test_forms_render_only_the_chosen_customer(self):
+        response = self.client.get(reverse("delivery_add"))
+        self.assertNotContains(response, "Hamza")
+        self.assertEqual(response.content.decode().count("<option"), 1)
+
+        response = self.client.post(reverse("delivery_add"), {"customer": self.ali.pk, "bottles_delivered": "x"})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, f'<option value="{self.ali.pk}" selected>')
+        self.assertNotContains(response, "Hamza")
+
+        response = self.client.get(reverse("transaction_add"))
+        self.assertNotContains(response, "Hamza")
+
+    def test_list_filters_pick_the_customer(self):
+        for name in ("delivery_list", "transaction_list"):
+            response = self.client.get(reverse(name))
+            self.assertContains(response, '<option value="" selected>All customers</option>', html=True)
+            self.assertContains(response, 'data-picker-for="id_customer"')
+
+            response = self.client.get(reverse(name), {"customer": self.ali.pk})
+            self.assertContains(response, f'<option value="{self.ali.pk}" selected>')
+            self.assertNotContains(response, "Hamza")
+
+    @override_settings(AUTH_USER_CACHE_SECONDS=0)  # every request loads the user, not just the first
+    def test_render_queries_do_not_grow_with_customers(self):
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse("delivery_add"))
+        Customer.objects.bulk_create(Customer(name=f"Extra {i}") for i in range(50))
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(reverse("delivery_add"))
+        self.assertEqual(len(few), len(many))
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        request_stats.reset()
+        self.client.force_login(User.objects.create_user("staff", password="pw", is_staff=True))
+
+    def test_server_timing_and_per_view_stats(self):
+        response = self.client.get(reverse("customer_list"))
+        timing = response["Server-Timing"]
+        self.assertIn("db;dur=", timing)
+        self.assertIn("render;dur=", timing)
+
+        summary = {row["view"]: row for row in request_stats.summary()}
+        self.assertEqual(summary["customer_list"]["requests"], 1)
+        self.assertGreater(summary["customer_list"]["avg_queries"], 0)
+        self.assertGreater(summary["customer_list"]["avg_sql_ms"], 0)
+        self.assertGreater(summary["customer_list"]["avg_render_ms"], 0)
+
+        response = self.client.get(reverse("metrics"))
+        self.assertContains(response, "customer_list")
+
+    def test_repeated_queries_per_view(self):
+        lookup = fingerprint("SELECT name FROM delivery_customer WHERE id = 1")
+        request_stats.record("delivery_list", 12.0, 7, 8.0, 3.0, {lookup: 5})
+        request_stats.record("delivery_list", 10.0, 5, 6.0, 3.0, {lookup: 3})
+
+        row = {row["view"]: row for row in request_stats.summary()}["delivery_list"]
+        self.assertEqual((row["avg_sql_ms"], row["avg_render_ms"]), (7.0, 3.0))
+        self.assertEqual(row["duplicates"], [(lookup, 6)])
+        self.assertContains(self.client.get(reverse("metrics")), "delivery_customer WHERE id = ?")
+
+    def test_slow_requests_are_logged_as_json(self):
+        with self.settings(SLOW_REQUEST_MS=0), self.assertLogs("delivery.slow_requests") as logs:
+            self.client.get(reverse("customer_list"))
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry["view"], "customer_list")
+        self.assertGreater(entry["queries"], 0)
+
+    def test_slow_request_log_is_created_in_log_dir_on_first_use(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log_dir = Path(tmp) / "logs"
+            with self.settings(SLOW_REQUEST_MS=0, LOG_DIR=log_dir):
+                self.client.get(reverse("customer_list"))
+                lines = (log_dir / "slow_requests.jsonl").read_text().splitlines()
+            self.assertEqual(json.loads(lines[-1])["view"], "customer_list")
+
+    def test_metrics_page_is_staff_only(self):
+        self.client.force_login(User.objects.create_user("driver", password="pw"))
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 302)
+
+    def test_fingerprint_ignores_literal_values(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id = 5 AND name = 'x'"),
+            fingerprint("SELECT * FROM t WHERE id = 17 AND name = 'it''s'"),
+        )
+
+
+class RunBenchmarksTests(TestCase):
+    def test_every_route_is_driven(self):
+        customer = Customer.objects.create(name="Ali")
+        post_delivery(Delivery(customer=customer, bottles_delivered=1, total_amount=Decimal("100"),
+                               amount_received=Decimal("100")))
+        out, err = io.StringIO(), io.StringIO()
+        call_command("run_benchmarks", iterations=1, stdout=out, stderr=err)
+
+        self.assertEqual(err.getvalue(), "")
+        for name in ("customer_list", "monthly_statement_file", "export", "delivery_add (POST)"):
+            self.assertIn(name, out.getvalue())
+
+
+class CustomerStatementTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("staff", password="pw"))
+        self.customer = Customer.objects.create(name="Ali")
+        for day, delivered, received in [(1, 2, "200"), (3, 3, "100"), (5, 1, "300"), (8, 2, "0")]:
+            post_delivery(Delivery(
+                customer=self.customer, date=date(2025, 4, day), bottles_delivered=delivered,
+                total_amount=delivered * Decimal("100"), amount_received=Decimal(received),
+            ))
+        post_transaction(Transaction(customer=self.customer, date=date(2025, 4, 6), amount=Decimal("150")))
+
+    def test_running_balance_ends_at_the_customer_net_balance(self):
+        opening, lines, next_cursor = statement_page(self.customer.pk)
+        self.customer.refresh_from_db()
+        self.assertEqual(len(lines), 9)
+        self.assertIsNone(next_cursor)
+        self.assertEqual(lines[-1]["balance"], self.customer.net_balance)
+
+    def test_pages_continue_the_running_balance(self):
+        _, everything, _ = statement_page(self.customer.pk)
+        _, first, cursor = statement_page(self.customer.pk, per_page=4)
+        _, second, _ = statement_page(self.customer.pk, cursor=cursor, per_page=4)
+        self.assertEqual(
+            [line["balance"] for line in first + second],
+            [line["balance"] for line in everything[:8]],
+        )
+
+    def test_undated_deliveries_page_first(self):
+        undated = Delivery.objects.filter(customer=self.customer, date__lt=date(2025, 4, 6))
+        self.assertEqual(undated.update(date=None), 3)
+        _, everything, _ = statement_page(self.customer.pk)
+        self.assertEqual([line["date"] for line in everything[:3]], [None, None, None])
+
+        balances, cursor = [], None
+        while True:
+            _, lines, cursor = statement_page(self.customer.pk, cursor=cursor, per_page=1)
+            balances += [line["balance"] for line in lines]
+            if not cursor:
+                break
+        self.assertEqual(balances, [line["balance"] for line in everything])
+        self.customer.refresh_from_db()
+        self.assertEqual(balances[-1], self.customer.net_balance)
+
+    def test_date_range_starts_from_opening_balance(self):
+        _, everything, _ = statement_page(self.customer.pk)
+        opening, lines, _ = statement_page(self.customer.pk, start=date(2025, 4, 4), end=date(2025, 4, 6))
+        self.assertEqual(opening, everything[3]["balance"])
+        self.assertEqual([line["balance"] for line in lines], [line["balance"] for line in everything[4:7]])
+
+    def test_opening_balance_and_manual_edits_are_on_the_statement(self):
+        self.customer.balance += Decimal("500")
+        self.customer.save()
+        self.customer.pending_balance = Decimal("50")
+        self.customer.save()
+        self.customer.refresh_from_db()
+
+        _, lines, _ = statement_page(self.customer.pk)
+        self.assertEqual([line["entry"] for line in lines[-2:]], ["adjustment", "adjustment"])
+        self.assertEqual(lines[-1]["balance"], self.customer.net_balance)
+
+        today = timezone.localdate()
+        opening, lines, _ = statement_page(self.customer.pk, start=today + timedelta(days=1))
+        self.assertEqual(lines, [])
+        self.assertEqual(opening, self.customer.net_balance)
+
+    def test_json_endpoint(self):
+        response = self.client.get(
+            reverse("customer_statement", args=[self.customer.pk]), {"format": "json", "date_from": "2025-04-05"}
+        )
+        data = response.json()
+        self.assertEqual(data["lines"][0]["date"], "2025-04-05")
+        self.assertEqual(data["opening_balance"], "-200.00")
+
+
+class MonthlyStatementTests(TestCase):
+    def setUp(self):
+        self.ali = Customer.objects.create(name="Ali")
+        Customer.objects.create(name="Sara")
+        for day, delivered, received in [(date(2025, 3, 30), 3, "100"), (date(2025, 4, 2), 2, "200"), (date(2025, 4, 9), 1, "0")]:
+            post_delivery(Delivery(
+                customer=self.ali, date=day, bottles_delivered=delivered, bottles_returned=1,
+                total_amount=delivered * Decimal("100"), amount_received=Decimal(received),
+            ))
+        post_transaction(Transaction(customer=self.ali, date=date(2025, 4, 20), amount=Decimal("150")))
+        self.output = tempfile.TemporaryDirectory()
+        self.addCleanup(self.output.cleanup)
+
+    def test_month_matches_the_statement_page(self):
+        with self.assertNumQueries(5):
+            statements = gather_month(date(2025, 4, 1), date(2025, 4, 30))
+        ali = statements[0]
+        opening, lines, _ = statement_page(self.ali.pk, start=date(2025, 4, 1), end=date(2025, 4, 30))
+        self.assertEqual(ali["opening"], opening)
+        self.assertEqual([line["balance"] for line in ali["lines"]], [line["balance"] for line in lines])
+        self.assertEqual(ali["closing"], Decimal("-150.00"))
+        self.assertEqual((ali["bottles_opening"], ali["bottles_closing"]), (2, 3))
+        self.assertEqual(statements[1]["lines"], [])
+
+    def test_rerun_only_writes_missing_statements(self):
+        run = generate_statements(date(2025, 4, 15), root=self.output.name, workers=1)
+        self.assertEqual((run.rendered, run.skipped), (2, 0))
+        files = sorted(path.name for path in run.directory.iterdir())
+        self.assertEqual(len(files), 6)  # two statements in two formats plus the index
+        self.assertIn("-150.00", (run.directory / files[0]).read_text())
+
+        (run.directory / files[0]).with_suffix(".html").unlink()  # interrupted before the .html
+        run = generate_statements(date(2025, 4, 15), root=self.output.name, workers=1)
+        self.assertEqual((run.rendered, run.skipped), (1, 1))
+
+    def test_process_pool(self):
+        run = generate_statements(date(2025, 4, 15), root=self.output.name, workers=2)
+        self.assertEqual(run.rendered, 2)
+        with open(run.directory / "index.csv") as handle:
+            rows = list(csv.DictReader(handle))
+        self.assertEqual([row["closing_balance"] for row in rows], ["-150.00", "0.00"])
+
+    def test_view_serves_generated_files_to_staff(self):
+        generate_statements(date(2025, 4, 15), root=self.output.name, workers=1)
+        self.client.force_login(User.objects.create_user("boss", password="pw", is_staff=True))
+        with override_settings(STATEMENTS_DIR=self.output.name):
+            listing = self.client.get(reverse("monthly_statements"))
+            self.assertEqual(listing.context["runs"], [{"month": "2025-04", "count": 2}])
+            index = self.client.get(reverse("monthly_statement_file", args=["2025-04", "index.html"]))
+            self.assertIn("Ali", b"".join(index.streaming_content).decode())
+            missing = self.client.get(reverse("monthly_statement_file", args=["2025-04", "..db.sqlite3"]))
+            self.assertEqual(missing.status_code, 404)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("staff", password="pw"))
+        self.ali = Customer.objects.create(name="Ali", phone="0300-1234567")
+        self.sara = Customer.objects.create(name="Sara & Co <HQ>")
+        for customer, day in [(self.ali, 1), (self.ali, 2), (self.sara, 2)]:
+            post_delivery(Delivery(
+                customer=customer, date=date(2025, 5, day), bottles_delivered=1,
+                total_amount=Decimal("100"), amount_received=Decimal("100"),
+            ))
+
+    def read(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_csv_streams_filtered_rows(self):
+        response = self.client.get(
+            reverse("export", args=["deliveries"]), {"date_from": "2025-05-02", "customer": self.ali.pk}
+        )
+        self.assertTrue(response.streaming)
+        self.assertIn("deliveries-", response["Content-Disposition"])
+        rows = list(csv.reader(io.StringIO(self.read(response).decode())))
+        self.assertEqual(rows[0][0], "Date")
+        self.assertEqual([row[0] for row in rows[1:]], ["2025-05-02"])
+
+    def test_xlsx_is_a_valid_workbook(self):
+        response = self.client.get(reverse("export", args=["transactions"]), {"format": "xlsx"})
+        with zipfile.ZipFile(io.BytesIO(self.read(response))) as book:
+            self.assertIsNone(book.testzip())
+            sheet = book.read("xl/worksheets/sheet1.xml").decode()
+        self.assertEqual(sheet.count("<row>"), 4)
+        self.assertIn("Sara &amp; Co &lt;HQ&gt;", sheet)
+
+    def test_formulas_and_control_characters_are_defused(self):
+        evil = Customer.objects.create(name='=HYPERLINK("http://x","y")', phone="+92 300 1234567")
+        post_transaction(Transaction(customer=evil, amount=Decimal("5"), description="bell\x07 and\x00 nul"))
+
+        rows = list(csv.reader(io.StringIO(self.read(self.client.get(reverse("export", args=["balances"]))).decode())))
+        self.assertEqual(rows[-1][1:3], ['\'=HYPERLINK("http://x","y")', "'+92 300 1234567"])
+
+        response = self.client.get(reverse("export", args=["transactions"]), {"format": "xlsx"})
+        with zipfile.ZipFile(io.BytesIO(self.read(response))) as book:
+            sheet = book.read("xl/worksheets/sheet1.xml")
+        ElementTree.fromstring(sheet)
+        self.assertIn(b"bell and nul", sheet)
+
+    def test_balances_and_unknown_kind(self):
+        rows = list(csv.reader(io.StringIO(self.read(self.client.get(reverse("export", args=["balances"]))).decode())))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(self.client.get(reverse("export", args=["nope"])).status_code, 404)
+
+
+class DeliveryApiTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("dispatch", password="pw"))
+        BottlePrice.objects.create(price_per_bottle=Decimal("100"))
+        pricing.invalidate()
+        self.ali = Customer.objects.create(name="Ali")
+        self.sara = Customer.objects.create(name="Sara")
+        self.url = reverse("delivery-list", kwargs={"version": "v1"})
+        self.bulk_url = reverse("delivery-bulk", kwargs={"version": "v1"})
+
+    def bulk(self, method, rows):
+        return getattr(self.client, method)(self.bulk_url, json.dumps(rows), content_type="application/json")
+
+    def test_bulk_create_posts_the_batch_in_constant_queries(self):
+        rows = [
+            {"customer": customer.pk, "date": f"2025-06-{day:02d}", "bottles_delivered": 2, "amount_received": "150"}
+            for customer in (self.ali, self.sara) for day in range(1, 11)
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.bulk("post", rows)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()), 20)
+        self.assertLess(len(ctx), 15)
+
+        self.ali.refresh_from_db()
+        self.assertEqual(self.ali.pending_balance, Decimal("500.00"))
+        self.assertEqual(self.ali.bottles_at_site, 20)
+        self.assertEqual(Transaction.objects.filter(customer=self.ali, delivery__isnull=False).count(), 10)
+
+    def test_bulk_create_is_all_or_nothing(self):
+        response = self.bulk("post", [
+            {"customer": self.ali.pk, "bottles_delivered": 1},
+            {"customer": 999999, "bottles_delivered": 1},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["errors"][0]["index"], 1)
+        self.assertFalse(Delivery.objects.exists())
+
+    def test_bulk_update_matches_single_edits(self):
+        created = self.bulk("post", [
+            {"customer": self.ali.pk, "date": "2025-06-01", "bottles_delivered": 2, "amount_received": "200"},
+            {"customer": self.ali.pk, "date": "2025-06-02", "bottles_delivered": 1, "amount_received": "100"},
+        ]).json()
+        response = self.bulk("patch", [
+            {"id": created[0]["id"], "bottles_delivered": 3},
+            {"id": created[1]["id"], "amount_received": "300"},
+        ])
+        self.assertEqual(response.status_code, 200)
+
+        self.ali.refresh_from_db()
+        # 300 charged for 3 bottles against 200 paid, 200 extra on the second
+        self.assertEqual(self.ali.net_balance, Decimal("100.00"))
+        self.assertEqual(self.ali.bottles_at_site, 4)
+        self.assertEqual(
+            Transaction.objects.get(delivery_id=created[1]["id"]).amount, Decimal("300.00")
+        )
+
+    def test_cursor_pages_sparse_fields_and_etag(self):
+        self.bulk("post", [{"customer": self.ali.pk, "date": f"2025-06-{day:02d}"} for day in range(1, 6)])
+
+        first = self.client.get(self.url, {"page_size": 3, "fields": "id,date"})
+        body = first.json()
+        self.assertEqual(set(body["results"][0]), {"id", "date"})
+        self.assertEqual([row["date"] for row in body["results"]], ["2025-06-05", "2025-06-04", "2025-06-03"])
+        second = self.client.get(body["next"]).json()
+        self.assertEqual([row["date"] for row in second["results"]], ["2025-06-02", "2025-06-01"])
+        self.assertIsNone(second["next"])
+
+        with CaptureQueriesContext(connection) as ctx:
+            again = self.client.get(self.url, {"page_size": 3, "fields": "id,date"}, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertFalse([q for q in ctx.captured_queries if "delivery_delivery" in q["sql"]])
+
+        self.bulk("patch", [{"id": body["results"][0]["id"], "bottles_delivered": 4}])
+        again = self.client.get(self.url, {"page_size": 3, "fields": "id,date"}, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 200)
+
+
+class DriverSyncTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("driver", password="pw"))
+        BottlePrice.objects.create(price_per_bottle=Decimal("100"))
+        pricing.invalidate()
+        self.customer = Customer.objects.create(name="Ali")
+        self.url = reverse("sync", kwargs={"version": "v1"})
+
+    def upload(self, events, device="van-1"):
+        return self.client.post(
+            self.url, json.dumps({"device": device, "events": events}), content_type="application/json"
+        )
+
+    def test_retried_upload_never_double_posts(self):
+        events = [[f"van-1-{n}", self.customer.pk, "2025-06-01", 2, 0, "100"] for n in range(50)]
+        with CaptureQueriesContext(connection) as ctx:
+            first = self.upload(events).json()
+        self.assertLess(len(ctx), 15)
+        self.assertEqual({r["status"] for r in first["results"]}, {"created"})
+
+        retry = self.upload(events).json()
+        self.assertEqual({r["status"] for r in retry["results"]}, {"duplicate"})
+        self.assertEqual(
+            [r["delivery"] for r in retry["results"]], [r["delivery"] for r in first["results"]]
+        )
+        self.assertEqual(retry["cursor"], first["cursor"])
+
+        self.customer.refresh_from_db()
+        self.assertEqual(Delivery.objects.count(), 50)
+        self.assertEqual(self.customer.pending_balance, Decimal("5000.00"))
+        self.assertEqual(self.customer.bottles_at_site, 100)
+
+    def test_per_event_results(self):
+        results = self.upload([
+            ["a", self.customer.pk, "2025-06-01", 1],
+            ["b", 999999, "2025-06-01", 1],
+            ["c", self.customer.pk, "not a date", 1],
+            ["a", self.customer.pk, "2025-06-01", 1],
+        ]).json()["results"]
+        self.assertEqual([r["status"] for r in results], ["created", "rejected", "rejected", "duplicate"])
+        self.assertEqual(results[3]["delivery"], results[0]["delivery"])
+        self.assertEqual(Delivery.objects.count(), 1)
+
+        # rejected keys aren't burned, the fixed event goes through
+        fixed = self.upload([["b", self.customer.pk, "2025-06-01", 1]]).json()["results"]
+        self.assertEqual(fixed[0]["status"], "created")
+
+    def test_events_since_cursor(self):
+        first = self.upload([["a", self.customer.pk], ["b", self.customer.pk]]).json()
+        self.upload([["c", self.customer.pk]])
+        since = self.client.get(self.url, {"device": "van-1", "cursor": first["cursor"]}).json()
+        self.assertEqual([key for key, _ in since["events"]], ["c"])
+        self.assertEqual(since["cursor"], since["latest"])
+
+
+class ReconcileTests(TestCase):
+    def setUp(self):
+        self.ali = Customer.objects.create(name="Ali")
+        self.sara = Customer.objects.create(name="Sara")
+        for customer in (self.ali, self.sara):
+            post_delivery(Delivery(
+                customer=customer, bottles_delivered=4, bottles_returned=1,
+                total_amount=Decimal("400"), amount_received=Decimal("100"),
+            ))
+            post_transaction(Transaction(customer=customer, amount=Decimal("50"), transaction_type="payment"))
+
+    def test_posted_ledger_has_no_drift(self):
+        result = reconcile(full=True)
+        self.assertEqual(result.run.customers_checked, 2)
+        self.assertEqual(result.drift, [])
+
+    def test_deleted_transaction_is_found_and_repaired(self):
+        reconcile(full=True)
+        Transaction.objects.filter(customer=self.ali, transaction_type="payment").delete()
+        Customer.objects.filter(pk=self.sara.pk).update(bottles_at_site=99)  # hand edit, no activity
+
+        # incremental: the delete trigger touched Ali, Sara's raw edit isn't activity
+        result = reconcile()
+        self.assertEqual(result.run.customers_checked, 1)
+        self.assertEqual([row.customer_id for row in result.drift], [self.ali.pk])
+        self.assertEqual(result.drift[0].net_drift, Decimal("50"))
+        self.assertEqual(Customer.objects.get(pk=self.ali.pk).pending_balance, Decimal("250"))
+
+        result = reconcile(full=True, repair=True)
+        self.assertEqual(result.run.repaired, 2)
+        self.ali.refresh_from_db()
+        self.sara.refresh_from_db()
+        self.assertEqual((self.ali.balance, self.ali.pending_balance), (Decimal("0"), Decimal("300")))
+        self.assertEqual(self.sara.bottles_at_site, 3)
+        self.assertEqual(reconcile(full=True).drift, [])
+
+    def test_opening_and_manual_counters_are_not_drift(self):
+        opening = Customer.objects.create(name="Omar", bottles_at_site=5, pending_balance=Decimal("100"))
+        self.sara.bottles_at_site = 7
+        self.sara.save()
+
+        result = reconcile(full=True, repair=True)
+        self.assertEqual(result.drift, [])
+        opening.refresh_from_db()
+        self.assertEqual((opening.pending_balance, opening.bottles_at_site), (Decimal("100"), 5))
+        self.assertEqual(Customer.objects.get(pk=self.sara.pk).bottles_at_site, 7)
+
+    def test_incremental_run_checks_new_activity_only(self):
+        reconcile(full=True, repair=True)
+        post_transaction(Transaction(customer=self.sara, amount=Decimal("10"), transaction_type="payment"))
+
+        result = reconcile()
+        self.assertFalse(result.run.full)
+        self.assertEqual(result.run.customers_checked, 1)
+        self.assertEqual(result.drift, [])
+        self.assertEqual(ReconciliationRun.objects.count(), 2)
+
+
+class BottleSnapshotTests(TestCase):
+    def snapshots(self):
+        # deletes leave zero-movement rows behind, a rebuild only has days with deliveries
+        return (
+            list(BottleSnapshot.objects.exclude(delta=0).order_by("customer_id", "date").values_list(
+                "customer_id", "date", "delta", "bottles_at_site",
+            )),
+            list(FleetBottleSnapshot.objects.exclude(delta=0).order_by("date").values_list(
+                "date", "delta", "bottles_out",
+            )),
+        )
+
+    def deliver(self, customer, day, delivered, returned=0):
+        return post_delivery(Delivery(
+            customer=customer, date=day, bottles_delivered=delivered, bottles_returned=returned,
+            total_amount=delivered * 100, amount_received=delivered * 100,
+        ))
+
+    def setUp(self):
+        self.ali = Customer.objects.create(name="Ali")
+        self.sara = Customer.objects.create(name="Sara")
+        self.deliver(self.ali, date(2025, 1, 5), 4)
+        self.deliver(self.sara, date(2025, 1, 20), 2)
+        self.returned = self.deliver(self.ali, date(2025, 3, 10), 1, 3)
+
+    def test_point_in_time_lookups(self):
+        self.assertEqual(bottles_at_site(self.ali.pk, date(2025, 1, 4)), 0)
+        self.assertEqual(bottles_at_site(self.ali.pk, date(2025, 1, 31)), 4)
+        self.assertEqual(bottles_at_site(self.ali.pk, date(2025, 3, 31)), 2)
+        self.assertEqual(fleet_bottles_out(date(2025, 1, 31)), 6)
+        self.assertEqual(
+            dict(customers_holding(date(2025, 1, 10)).values_list("name", "bottles")), {"Ali": 4},
+        )
+
+    def test_backdated_edit_and_delete_match_a_rebuild(self):
+        # move the March return before Sara's first delivery, shifting every later row
+        previous = snapshot(self.returned)
+        self.returned.date = date(2025, 1, 10)
+        self.returned.bottles_returned = 4
+        post_delivery(self.returned, previous)
+        self.deliver(self.sara, date(2025, 1, 1), 5)
+        Delivery.objects.filter(customer=self.sara, date=date(2025, 1, 20)).delete()
+
+        maintained = self.snapshots()
+        rebuild_bottle_snapshots()
+        self.assertEqual(maintained, self.snapshots())
+        self.assertEqual(bottles_at_site(self.ali.pk, date(2025, 2, 1)), 1)
+        self.assertEqual(fleet_bottles_out(date(2025, 2, 1)), 6)
+
+    def test_long_holders(self):
+        holders = long_holders(days=60, on=date(2025, 3, 31))
+        # Ali has held since January, Sara too; Ali's March return didn't bring him to zero
+        self.assertEqual(set(holders.values_list("name", flat=True)), {"Ali", "Sara"})
+        self.deliver(self.sara, date(2025, 3, 1), 0, 2)
+        self.assertEqual(list(long_holders(days=60, on=date(2025, 3, 31)).values_list("name", flat=True)), ["Ali"])
+
+    def test_deleting_a_customer_drops_its_snapshots(self):
+        self.ali.delete()
+        self.assertFalse(BottleSnapshot.objects.filter(customer_id=self.ali.pk).exists())
+        self.assertEqual(fleet_bottles_out(date(2025, 3, 31)), 2)
+
+
+    def test_opening_and_manual_counts_are_snapshotted(self):
+        today = timezone.localdate()
+        omar = Customer.objects.create(name="Omar", bottles_at_site=5)
+        self.deliver(omar, today, 2)
+        self.assertEqual(bottles_at_site(omar.pk, today), 7)
+        omar.refresh_from_db()
+        omar.bottles_at_site = 4
+        omar.save()
+        self.assertEqual(bottles_at_site(omar.pk, today), 4)
+        self.assertEqual(fleet_bottles_out(today), 2 + 2 + 4)
+
+        maintained = self.snapshots()
+        rebuild_bottle_snapshots()
+        self.assertEqual(maintained, self.snapshots())
+
+        omar.delete()
+        self.assertEqual(fleet_bottles_out(today), 4)
+        maintained = self.snapshots()
+        rebuild_bottle_snapshots()
+        self.assertEqual(maintained, self.snapshots())
+
+
+class ListCacheTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("staff", password="pw"))
+        self.customer = Customer.objects.create(name="Ali")
+        self.delivery = post_delivery(Delivery(
+            customer=self.customer, date=date(2025, 1, 1), bottles_delivered=2,
+            total_amount=Decimal("200"), amount_received=Decimal("200"),
+        ))
+        cache_counters.reset()
+
+    def get(self, name):
+        return self.client.get(reverse(name)).content.decode()
+
+    def counts(self):
+        return {row["name"]: (row["hits"], row["misses"]) for row in cache_counters.summary()}
+
+    def test_second_view_is_served_from_cache(self):
+        self.get("delivery_list")
+        with CaptureQueriesContext(connection) as ctx:
+            self.get("delivery_list")
+        self.assertFalse([q for q in ctx.captured_queries if "delivery_delivery" in q["sql"]])
+        self.assertEqual(self.counts()["delivery_table"], (1, 1))
+
+    def test_writes_are_never_served_stale(self):
+        for name in ("customer_list", "delivery_list", "transaction_list"):
+            self.get(name)
+
+        # posting: delivery saved, transaction updated in place, customer updated with a queryset update
+        previous = snapshot(self.delivery)
+        self.delivery.bottles_delivered = 7
+        self.delivery.amount_received = Decimal("123")
+        post_delivery(self.delivery, previous)
+        self.assertIn("<td>7</td>", self.get("delivery_list"))
+        self.assertIn("123", self.get("transaction_list"))
+        self.assertIn("<td>7</td>", self.get("customer_list"))
+
+        # bulk import: bulk_create/bulk_update only
+        import_deliveries(io.StringIO(f"customer,date,bottles_delivered\n{self.customer.pk},2025-01-02,5\n"))
+        self.assertIn("<td>12</td>", self.get("customer_list"))
+
+        # plain model writes through signals
+        Customer.objects.filter(pk=self.customer.pk).get().delete()
+        self.assertIn("No customers found", self.get("customer_list"))
+        self.assertIn("No deliveries yet", self.get("delivery_list"))
+        self.assertIn("No transactions found", self.get("transaction_list"))
+
+        hits, misses = zip(*self.counts().values())
+        self.assertEqual(sum(hits), 0)  # every read after a write rebuilt its entry
+
+
+    def test_seeding_refreshes_the_lists(self):
+        self.get("customer_list")
+        call_command("seed_data", customers=3, days=5, stdout=io.StringIO())
+        self.assertEqual(self.get("customer_list").count("House "), 3)
+
+
+class SharedCacheCheckTests(TestCase):
+    def test_several_workers_need_shared_caches(self):
+        with override_settings(WEB_CONCURRENCY=1):
+            self.assertEqual(check_shared_caches(None), [])
+        with override_settings(WEB_CONCURRENCY=4):
+            self.assertEqual(sorted(error.msg.split("'")[1] for error in check_shared_caches(None)),
+                             ["default", "lists", "sessions"])
+        shared = {
+            alias: {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": f"/tmp/{alias}"}
+            for alias in ("default", "lists", "sessions")
+        }
+        with override_settings(WEB_CONCURRENCY=4, CACHES=shared):
+            self.assertEqual(check_shared_caches(None), [])
+
+
+class RoutePlanningTests(TestCase):
+    TODAY = date(2025, 6, 1)
+
+    def deliver(self, customer, days_ago, bottles=2):
+        return post_delivery(Delivery(
+            customer=customer, date=self.TODAY - timedelta(days=days_ago), bottles_delivered=bottles,
+            total_amount=bottles * 100, amount_received=bottles * 100,
+        ))
+
+    def setUp(self):
+        # every 3 days, last delivered 2 days ago -> due tomorrow
+        self.ali = Customer.objects.create(name="Ali", address="Street 1")
+        for days_ago, bottles in [(11, 2), (8, 3), (5, 3), (2, 4)]:
+            self.deliver(self.ali, days_ago, bottles)
+        # weekly, last delivered 9 days ago -> 2 days overdue
+        self.sara = Customer.objects.create(name="Sara", address="Street 2")
+        for days_ago in (23, 16, 9):
+            self.deliver(self.sara, days_ago, 5)
+
+    def stops(self, customer):
+        return list(ScheduledStop.objects.filter(customer=customer).order_by("date").values_list(
+            "date", "expected_bottles", "overdue_days",
+        ))
+
+    def test_patterns_from_one_windowed_query(self):
+        with self.assertNumQueries(1):
+            patterns = delivery_patterns(self.TODAY)
+        self.assertEqual(patterns[self.ali.pk], (3, 3, self.TODAY - timedelta(days=2)))
+        self.assertEqual(patterns[self.sara.pk].interval, 7)
+
+    def test_plan_rolls_missed_stops_to_the_first_day(self):
+        plan_routes(self.TODAY, days=7)
+        day = lambda n: self.TODAY + timedelta(days=n)
+        self.assertEqual(self.stops(self.ali), [(day(1), 3, 0), (day(4), 3, 0)])
+        self.assertEqual(self.stops(self.sara), [(day(0), 5, 2)])
+
+    def test_nightly_refresh_only_replans_what_changed(self):
+        plan_routes(self.TODAY, days=5)
+        tomorrow = self.TODAY + timedelta(days=1)
+        # nothing posted: Sara's stop today went past, Ali's next stop isn't in the new horizon yet
+        run = plan_routes(tomorrow, days=5)
+        self.assertFalse(run.full)
+        self.assertEqual(run.customers_planned, 1)
+
+        # Ali gets his delivery tomorrow, a day early: his plan follows it
+        self.TODAY = tomorrow
+        self.deliver(self.ali, 0, 6)
+        plan_routes(tomorrow + timedelta(days=1), days=5)
+        self.assertEqual(self.stops(self.ali)[0][0], tomorrow + timedelta(days=3))
+
+    def test_interval_longer_than_the_horizon(self):
+        # every 10 days, last delivered 2 days ago -> due in 8, past a 7 day horizon
+        omar = Customer.objects.create(name="Omar")
+        for days_ago in (12, 2):
+            self.deliver(omar, days_ago)
+        plan_routes(self.TODAY, days=7, full=True)
+        self.assertEqual(self.stops(omar), [])
+
+        for n in range(1, 14):
+            plan_routes(self.TODAY + timedelta(days=n), days=7)
+            if n == 2:
+                self.assertEqual(self.stops(omar), [(self.TODAY + timedelta(days=8), 2, 0)])
+        # never delivered: overdue on the first day
+        self.assertEqual(self.stops(omar), [(self.TODAY + timedelta(days=13), 2, 5)])
+
+    @override_settings(AUTH_USER_CACHE_SECONDS=0)  # every request loads the user, not just the first
+    def test_route_sheet_queries_do_not_grow_with_stops(self):
+        self.client.force_login(User.objects.create_user("staff", password="pw"))
+        plan_routes(self.TODAY, days=7)
+        url = reverse("route_sheet") + f"?day={self.TODAY + timedelta(days=1)}"
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get(url)
+        self.assertContains(response, "Ali")
+
+        for n in range(10):
+            customer = Customer.objects.create(name=f"Extra {n}")
+            for days_ago in (5, 2):
+                self.deliver(customer, days_ago)
+        plan_routes(self.TODAY, days=7, full=True)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+        self.assertEqual(len(response.context["stops"]), 11)
+        self.assertEqual(len(few), len(many))
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Ali")
+        for day, delivered, received in [(date(2025, 3, 10), 2, "100"), (date(2025, 4, 2), 3, "300")]:
+            post_delivery(Delivery(
+                customer=self.customer, date=day, bottles_delivered=delivered, bottles_returned=1,
+                total_amount=delivered * Decimal("100"), amount_received=Decimal(received),
+            ))
+        post_transaction(Transaction(customer=self.customer, date=date(2025, 4, 5), amount=Decimal("50")))
+        self.customer.refresh_from_db()
+
+    def entries(self):
+        return list(LedgerEntry.objects.filter(customer=self.customer).order_by("id").values_list(
+            "source", "amount", "bottles", "is_reversal",
+        ))
+
+    def test_posting_appends_entries_that_add_up_to_the_counters(self):
+        self.assertEqual(len(self.entries()), 5)
+        self.assertEqual(
+            balance_on(self.customer.pk, date(2025, 5, 1)),
+            (self.customer.net_balance, self.customer.bottles_at_site),
+        )
+        self.assertEqual(balance_on(self.customer.pk, date(2025, 3, 31)), (Decimal("-100"), 1))
+
+    def test_edits_and_deletes_append_reversals(self):
+        delivery = Delivery.objects.get(customer=self.customer, date=date(2025, 4, 2))
+        previous = snapshot(delivery)
+        delivery.bottles_delivered, delivery.total_amount = 4, Decimal("400")
+        post_delivery(delivery, previous)
+        reverse_transaction(Transaction.objects.get(customer=self.customer, delivery__isnull=True))
+
+        self.assertEqual(self.entries()[5:], [
+            ("delivery", Decimal("300"), -2, True),
+            ("delivery", Decimal("-400"), 3, False),
+            ("transaction", Decimal("-300"), 0, True),
+            ("transaction", Decimal("300"), 0, False),
+            ("transaction", Decimal("-50"), 0, True),
+        ])
+        self.customer.refresh_from_db()
+        self.assertEqual(
+            balance_on(self.customer.pk, date.max),
+            (self.customer.net_balance, self.customer.bottles_at_site),
+        )
+
+    def test_delivery_payment_is_not_deleted_on_its_own(self):
+        self.client.force_login(User.objects.create_user("staff", password="pw"))
+        delivery = post_delivery(Delivery(
+            customer=self.customer, date=date(2025, 4, 10), bottles_delivered=1,
+            total_amount=Decimal("100"), amount_received=Decimal("100"),
+        ))
+        payment = Transaction.objects.get(delivery=delivery)
+        response = self.client.post(reverse("transaction_delete", args=[payment.pk]))
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(Transaction.objects.filter(pk=payment.pk).exists())
+        with self.assertRaises(ValueError):
+            reverse_transaction(payment)
+
+        previous = snapshot(delivery)
+        delivery.bottles_delivered = 2
+        post_delivery(delivery, previous)
+        self.customer.refresh_from_db()
+        self.assertEqual(
+            balance_on(self.customer.pk, date.max),
+            (self.customer.net_balance, self.customer.bottles_at_site),
+        )
+
+    def test_entries_are_immutable(self):
+        entry = LedgerEntry.objects.filter(customer=self.customer).first()
+        with self.assertRaises(ValueError):
+            entry.save()
+        with self.assertRaises(ValueError):
+            entry.delete()
+        if connection.vendor == "sqlite":
+            with self.assertRaises(Exception), transaction.atomic():
+                LedgerEntry.objects.filter(pk=entry.pk).update(amount=0)
+
+    def test_manual_counter_edits_are_adjustments(self):
+        self.customer.bottles_at_site += 2
+        self.customer.pending_balance += Decimal("25")
+        self.customer.save()
+        self.assertEqual(self.entries()[-1], ("adjustment", Decimal("-25"), 2, False))
+        self.assertEqual(
+            balance_on(self.customer.pk, date.max),
+            (self.customer.net_balance, self.customer.bottles_at_site),
+        )
+
+    def test_saves_that_skip_the_counters_skip_the_ledger(self):
+        count = LedgerEntry.objects.count()
+        self.customer.name = "Ali Raza"
+        with self.assertNumQueries(1):
+            self.customer.save(update_fields=["name"])
+        self.assertEqual(LedgerEntry.objects.count(), count)
+
+    def test_snapshot_lookup_matches_the_statement(self):
+        self.assertEqual(close_months(date(2025, 4, 30)), 2)
+        _, lines, _ = statement_page(self.customer.pk)
+        with self.assertNumQueries(2):
+            balance = balance_on(self.customer.pk, date(2025, 5, 20))
+        self.assertEqual(balance[0], lines[-1]["balance"])
+        # later months start from the closing snapshot
+        self.assertEqual(close_months(date(2025, 5, 31)), 0)
+        self.assertEqual(balance_on(self.customer.pk, date(2025, 4, 3))[0], lines[-2]["balance"])
+
+    def test_backdated_entry_moves_closed_snapshots(self):
+        close_months(date(2025, 4, 30))
+        post_transaction(Transaction(customer=self.customer, date=date(2025, 2, 20), amount=Decimal("30")))
+        self.assertEqual(
+            list(LedgerSnapshot.objects.filter(customer=self.customer).order_by("month").values_list("month", "balance")),
+            [(date(2025, 2, 1), Decimal("30")), (date(2025, 3, 1), Decimal("-70")), (date(2025, 4, 1), Decimal("-20"))],
+        )
+        self.customer.refresh_from_db()
+        self.assertEqual(balance_on(self.customer.pk, date(2025, 6, 1))[0], self.customer.net_balance)
+
+    def test_replay_rebuilds_the_same_history(self):
+        Customer.objects.create(name="Sara", balance=Decimal("80"), bottles_at_site=3)
+        triggered = sorted(LedgerEntry.objects.filter(is_reversal=False).values_list("customer_id", "amount", "bottles"))
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM delivery_ledgerentry")
+        replay_history(LedgerEntry, Delivery, Transaction, Customer)
+        self.assertEqual(sorted(LedgerEntry.objects.values_list("customer_id", "amount", "bottles")), triggered)
+
+
+class StaticAssetsTests(TestCase):
+    # the whole first visit to the dashboard, HTML plus our own assets (the
+    # Bootstrap CDN isn't ours to serve)
+    PAGE_BUDGET = 12_000
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        collected = override_settings(STATIC_ROOT=root.name)
+        collected.enable()
+        self.addCleanup(collected.disable)
+        call_command("collectstatic", interactive=False, verbosity=0)
+        self.root = root.name
+        self.client.force_login(User.objects.create_user("staff", password="pw"))
+
+    def assets(self, response):
+        return re.findall(r'(?:href|src)="(/static/[^"]+)"', response.content.decode())
+
+    def test_first_and_repeat_visit_bytes(self):
+        page = self.client.get(reverse("dashboard"))
+        assets = self.assets(page)
+        self.assertIn("/static/delivery/style.", assets[0])
+        self.assertRegex(assets[0], r"\.[0-9a-f]{12}\.css$")
+
+        sent = plain = 0
+        for url in assets:
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip, deflate, br")
+            self.assertEqual(response["Content-Encoding"], "gzip")
+            self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+            self.assertEqual(response["Vary"], "Accept-Encoding")
+            body = b"".join(response.streaming_content)
+            with open(f"{self.root}/{url.removeprefix('/static/')}", "rb") as fh:
+                original = fh.read()
+            self.assertEqual(gzip.decompress(body), original)
+            sent += len(body)
+            plain += len(original)
+
+        self.assertLess(sent, plain)
+        self.assertLess(len(page.content) + sent, self.PAGE_BUDGET)
+        # immutable assets aren't asked for again, a repeat visit is the HTML only
+        self.assertEqual(self.assets(self.client.get(reverse("dashboard"))), assets)
+
+    def test_identity_encoding_and_revalidation(self):
+        url = self.assets(self.client.get(reverse("login_pg")))[0]
+        response = self.client.get(url)
+        self.assertNotIn("Content-Encoding", response)
+        self.assertIn(b".gradient-custom", b"".join(response.streaming_content))
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        unhashed = self.client.get("/static/auth_user/style.css")
+        self.assertEqual(unhashed["Cache-Control"], "public, max-age=60")
+
+
+class ConditionalPageTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("staff", password="pw")
+        self.client.force_login(self.user)
+        self.customer = Customer.objects.create(name="Ali")
+        post_delivery(Delivery(customer=self.customer, date=date(2025, 4, 1), bottles_delivered=2,
+                               total_amount=Decimal("200"), amount_received=Decimal("200")))
+
+    def revisit(self, url):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("no-cache", first["Cache-Control"])
+        with CaptureQueriesContext(connection) as ctx:
+            again = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        return first, again, ctx
+
+    def test_unchanged_pages_are_304_without_rendering(self):
+        urls = [
+            reverse("customer_list"), reverse("customer_detail", args=[self.customer.pk]),
+            reverse("delivery_list"), reverse("transaction_list") + "?transaction_type=payment",
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                _, again, ctx = self.revisit(url)
+                self.assertEqual(again.status_code, 304)
+                self.assertEqual(again.content, b"")
+                self.assertEqual(again.templates, [])
+                self.assertEqual([q["sql"] for q in ctx.captured_queries if "delivery_" in q["sql"]], [])
+
+    def test_changes_and_other_users_get_a_fresh_page(self):
+        url = reverse("delivery_list")
+        first = self.client.get(url)
+        post_delivery(Delivery(customer=self.customer, date=date(2025, 4, 2), bottles_delivered=1,
+                               total_amount=Decimal("100"), amount_received=Decimal("0")))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 200)
+
+        first = self.client.get(url)
+        self.client.force_login(User.objects.create_user("other", password="pw"))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 200)
+
+    def test_no_304_while_a_message_is_pending(self):
+        url = reverse("customer_detail", args=[self.customer.pk])
+        self.client.post(url, {"bottles_at_site": 5})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("ETag", response)
+
+    def test_html_is_gzipped_when_accepted(self):
+        response = self.client.get(reverse("customer_list"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn(b"Ali", gzip.decompress(response.content))
+        self.assertLess(len(response.content), len(self.client.get(reverse("customer_list")).content))
+
+
+class ReadReplicaRoutingTests(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    def test_reads_go_to_the_replica_only_when_asked(self):
+        self.assertEqual(Delivery.objects.all().db, "default")
+        with replica_reads():
+            self.assertEqual(Delivery.objects.all().db, "replica")
+            self.assertEqual(router.db_for_write(Customer), "default")
+            with transaction.atomic():
+                # the replica can't see this transaction's own writes
+                self.assertEqual(Delivery.objects.all().db, "default")
+
+    def test_list_pages_read_from_the_replica(self):
+        self.client.force_login(User.objects.create_user("staff", password="pw"))
+        post_delivery(Delivery(customer=Customer.objects.create(name="Ali"), bottles_delivered=1))
+        with CaptureQueriesContext(connections["replica"]) as ctx:
+            response = self.client.get(reverse("delivery_list"))
+        self.assertContains(response, "Ali")
+        self.assertTrue(any("delivery_delivery" in query["sql"] for query in ctx.captured_queries))
+
+    def test_connections_apply_the_pragmas(self):
+        with connections["default"].cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 20000)
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+
+class AsyncViewTests(TransactionTestCase):
+    # the async views read from worker threads, which need committed rows
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        self.user = User.objects.create_user("staff", password="pw")
+        self.customer = Customer.objects.create(name="Ali")
+        post_delivery(Delivery(
+            customer=self.customer, date=timezone.localdate(), bottles_delivered=2,
+            total_amount=Decimal("200"), amount_received=Decimal("200"),
+        ))
+
+    async def get(self, view, path, data=None):
+        request = AsyncRequestFactory().get(path, data or {})
+        request.session = {SESSION_KEY: str(self.user.pk)}
+        request.user = self.user
+
+        async def auser():
+            return self.user
+        request.auser = auser
+        return await view(request)
+
+    async def test_dashboard(self):
+        response = await self.get(async_views.dashboard, "/")
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "200")
+
+    async def test_list_views(self):
+        deliveries = await self.get(async_views.delivery_list, "/deliveries/", {"customer": self.customer.pk})
+        self.assertContains(deliveries, "Ali")
+        transactions = await self.get(async_views.transaction_list, "/transactions/")
+        self.assertContains(transactions, "Ali")
+        customers = await self.get(async_views.customer_list, "/customers/")
+        self.assertContains(customers, "Ali")
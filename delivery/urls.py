@@ -1,27 +1,49 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# ✅ under ASGI the dashboard and list pages are served by their async versions
+pages = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
-    path('', views.dashboard, name="dashboard"),
+    path('', pages.dashboard, name="dashboard"),
 
     # Customers
-    path('customers/', views.customer_list, name="customer_list"),
+    path('customers/', pages.customer_list, name="customer_list"),
     path('customers/add/', views.customer_add, name="customer_add"),
+    path('customers/autocomplete/', views.customer_autocomplete, name="customer_autocomplete"),
     path('customers/<int:pk>/', views.customer_detail, name="customer_detail"),
     path("customers/<int:pk>/edit/", views.customer_edit, name="customer_edit"),
     path("customers/<int:pk>/delete/", views.customer_delete, name="customer_delete"),
     path("customers/<int:pk>/balance/edit/", views.customer_balance_edit, name="customer_balance_edit"),
+    path("customers/<int:pk>/statement/", views.customer_statement, name="customer_statement"),
+    path("statements/monthly/", views.monthly_statements, name="monthly_statements"),
+    path(
+        "statements/monthly/<str:month>/<str:filename>",
+        views.monthly_statement_file,
+        name="monthly_statement_file",
+    ),
 
     # Deliveries
-    path('deliveries/', views.delivery_list, name="delivery_list"),
+    path('deliveries/', pages.delivery_list, name="delivery_list"),
     path("deliveries/<int:pk>/edit/", views.delivery_edit, name="delivery_edit"),
     path('deliveries/add/', views.delivery_add, name="delivery_add"),
+    path('deliveries/import/', views.delivery_import, name="delivery_import"),
+
+    # Route sheets
+    path('routes/', views.route_sheet, name="route_sheet"),
 
     # Transactions
-    path('transactions/', views.transaction_list, name="transaction_list"),
+    path('transactions/', pages.transaction_list, name="transaction_list"),
     path("transactions/<int:pk>/delete/", views.transaction_delete, name="transaction_delete"),
     path('transactions/add/', views.transaction_add, name="transaction_add"),
 
+    # Exports
+    path('export/<slug:kind>/', views.export, name="export"),
+
     # Bottle Price
     path('bottle-price/', views.bottle_price, name="bottle_price"),
+
+    # Request metrics (staff only)
+    path('metrics/', views.metrics, name="metrics"),
 ]
@@ -1,50 +1,106 @@
+import re
+from datetime import date, timedelta
+from pathlib import Path
+
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
-from django.db.models import Sum , Q
+from django.template.loader import render_to_string
+from django.contrib import messages
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.db.models import Count, Sum , Q
 from .models import Customer, Delivery, Transaction, BottlePrice
-from .forms import CustomerForm, BottleUpdateForm, DeliveryForm, TransactionForm, BottlePriceForm, CustomerBalanceForm
-from django.contrib.auth.decorators import login_required
+from .forms import CustomerForm, BottleUpdateForm, DeliveryForm, TransactionForm, BottlePriceForm, CustomerBalanceForm, DeliveryImportForm, DateRangeFilterForm, TransactionFilterForm
+from .caching import cached, counters as cache_counters
+from .conditional import conditional
+from .exports import EXPORTS, export_rows, stream_csv, stream_xlsx
+from .importer import import_uploaded_file
+from .pagination import keyset_paginate, page_querystring
+from .posting import post_delivery, post_transaction, reverse_transaction, snapshot
+from .pricing import price_on
+from .routers import reads_from_replica
+from .routes import route_sheet as planned_stops
+from .metrics import stats as request_stats
+from .rollups import dashboard_totals, monthly_totals
+from .search import PER_PAGE as SEARCH_PER_PAGE, autocomplete_customers, search_customers
+from .statements import line_as_json, statement_page
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.utils import timezone
 
+RECENT_ACTIVITY = 10
+
+
 @login_required
+@reads_from_replica
 def dashboard(request):
-    total_customers = Customer.objects.count()
-    total_bottles = Customer.objects.aggregate(total=Sum("bottles_at_site"))["total"] or 0
-
     today = timezone.localdate()  # ✅ local timezone aware
-    first_day_month = today.replace(day=1)
-
-    # Daily total
-    # Daily total
-    daily_total = Transaction.objects.filter(date=today).aggregate(total=Sum("amount"))["total"] or 0
+    context = dashboard_context(
+        Customer.objects.aggregate(count=Count("id"), bottles=Sum("bottles_at_site")),
+        # ✅ daily/monthly totals come from the pre-aggregated rollup rows
+        dashboard_totals(today),
+        list(monthly_totals(today.year)),
+    )
+    return render(request, "delivery/dashboard.html", context)
 
-# Monthly total
-    monthly_total = Transaction.objects.filter(date__gte=first_day_month).aggregate(total=Sum("amount"))["total"] or 0
 
-    context = {
-        "total_customers": total_customers,
-        "total_bottles": total_bottles,
-        "daily_total": daily_total,
-        "monthly_total": monthly_total,
+def dashboard_context(customers, sales, months):
+    return {
+        "total_customers": customers["count"],
+        "total_bottles": customers["bottles"] or 0,
+        "daily_total": sales["daily"] or 0,
+        "monthly_total": sales["monthly"] or 0,
+        "months": months,
     }
-    return render(request, "delivery/dashboard.html", context)
 
 
 
 # Customer Management
 @login_required
+@conditional(Customer)
+@reads_from_replica
 def customer_list(request):
-    query = request.GET.get("q", "")
-    customers = Customer.objects.all()
+    query, page = customer_list_params(request)
+    return render(request, "delivery/customers.html", {"query": query, "table": customer_table(query, page)})
+
 
+def customer_list_params(request):
+    query = request.GET.get("q", "").strip()
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        page = 1
+    return query, page
+
+
+def customer_table(query, page):
+    """Rendered customer table and pager, cached until a customer changes."""
+    def render_table():
+        customers, has_next = customer_page(query, page)
+        return render_to_string("delivery/customer_table.html", {
+            "customers": customers,
+            "query": query,
+            "page": page,
+            "has_next": has_next,
+        })
+    return cached("customer_table", [Customer], (query, page), render_table)
+
+
+def customer_page(query, page):
     if query:
-        customers = customers.filter(
-            Q(name__icontains=query) | Q(phone__icontains=query)
-        )
+        # ✅ ranked prefix search on the FTS index, digits-only phone matching
+        return search_customers(query, page)
+    offset = (page - 1) * SEARCH_PER_PAGE
+    customers = list(Customer.objects.order_by("name", "id")[offset:offset + SEARCH_PER_PAGE + 1])
+    return customers[:SEARCH_PER_PAGE], len(customers) > SEARCH_PER_PAGE
 
-    return render(request, "delivery/customers.html", {
-        "customers": customers,
-        "query": query,
-    })
+@login_required
+@reads_from_replica
+def customer_autocomplete(request):
+    """JSON matches for the customer picker on the delivery and transaction forms."""
+    query = request.GET.get("q", "").strip()
+
+    def lookup():
+        return [{"id": c.pk, "text": str(c)} for c in autocomplete_customers(query)] if query else []
+    return JsonResponse({"results": cached("customer_autocomplete", [Customer], query, lookup)})
 
 @login_required
 def customer_add(request):
@@ -58,10 +114,13 @@ def customer_add(request):
     return render(request, "delivery/customer_add.html", {"form": form})
 
 @login_required
+@conditional(Customer, Delivery, Transaction)
+@reads_from_replica
 def customer_detail(request, pk):
     customer = get_object_or_404(Customer, pk=pk)
-    deliveries = Delivery.objects.filter(customer=customer)
-    transactions = Transaction.objects.filter(customer=customer)
+    # ✅ only the latest activity here, the full history lives on the statement
+    deliveries = Delivery.objects.filter(customer=customer).order_by("-date", "-id")[:RECENT_ACTIVITY]
+    transactions = Transaction.objects.filter(customer=customer).order_by("-date", "-id")[:RECENT_ACTIVITY]
 
     # Handle bottle update directly on detail page
     if request.method == "POST":
@@ -80,6 +139,59 @@ def customer_detail(request, pk):
         "form": form,
     })
 
+@login_required
+@reads_from_replica
+def customer_statement(request, pk):
+    customer = get_object_or_404(Customer.objects.only("name", "balance", "pending_balance"), pk=pk)
+    filters = DateRangeFilterForm(request.GET)
+    start = end = None
+    if filters.is_valid():
+        start, end = filters.cleaned_data["date_from"], filters.cleaned_data["date_to"]
+
+    opening, lines, next_cursor = statement_page(customer.pk, start, end, request.GET.get("cursor"))
+
+    if request.GET.get("format") == "json":
+        return JsonResponse({
+            "customer": customer.pk,
+            "opening_balance": str(opening),
+            "lines": [line_as_json(line) for line in lines],
+            "next_cursor": next_cursor,
+        })
+
+    return render(request, "delivery/customer_statement.html", {
+        "customer": customer,
+        "filters": filters,
+        "opening": opening,
+        "lines": lines,
+        "is_first": not request.GET.get("cursor"),
+        "next_query": page_querystring(request, next_cursor) if next_cursor else "",
+        "first_query": page_querystring(request, None),
+    })
+
+MONTH_DIR = re.compile(r"^\d{4}-\d{2}$")
+
+
+@user_passes_test(lambda user: user.is_staff)
+def monthly_statements(request):
+    root = Path(settings.STATEMENTS_DIR)
+    runs = []
+    if root.is_dir():
+        for directory in sorted(root.iterdir(), reverse=True):
+            if directory.is_dir() and MONTH_DIR.match(directory.name):
+                runs.append({"month": directory.name, "count": len(list(directory.glob("*.html"))) - 1})
+    return render(request, "delivery/monthly_statements.html", {"runs": runs})
+
+
+@user_passes_test(lambda user: user.is_staff)
+def monthly_statement_file(request, month, filename):
+    # ✅ only plain file names inside a month directory, nothing else on disk
+    if not MONTH_DIR.match(month) or "/" in filename or filename.startswith("."):
+        raise Http404("No such statement")
+    path = Path(settings.STATEMENTS_DIR) / month / filename
+    if path.suffix not in (".html", ".txt", ".csv") or not path.is_file():
+        raise Http404("No such statement")
+    return FileResponse(path.open("rb"), as_attachment=path.suffix == ".csv")
+
 @login_required
 def customer_edit(request, pk):
     customer = get_object_or_404(Customer, pk=pk)
@@ -120,24 +232,62 @@ def customer_balance_edit(request, pk):
 # Delivery Management
 
 @login_required
+@conditional(Delivery, Customer)
+@reads_from_replica
 def delivery_list(request):
-    # show newest first
-    deliveries = Delivery.objects.all().order_by("-date")
+    filters = DateRangeFilterForm(request.GET)
+    context = delivery_list_context(
+        request, filters, delivery_table(request, filters),
+        daily_delivery_totals(timezone.localdate()), selected_customer(filters),
+    )
+    return render(request, "delivery/deliveries.html", context)
+
+
+def delivery_table(request, filters):
+    """Rendered delivery table and pager, cached until a delivery or customer changes."""
+    def render_table():
+        # show newest first, one index range scan per page
+        page = keyset_paginate(delivery_queryset(filters), request.GET.get("cursor"))
+        return render_to_string("delivery/delivery_table.html", {
+            "deliveries": page,
+            "next_query": page_querystring(request, page.next_cursor) if page.has_next else "",
+            "first_query": page_querystring(request, None),
+        })
+    return cached("delivery_table", [Delivery, Customer], sorted(request.GET.lists()), render_table)
+
+
+def delivery_queryset(filters):
+    return filters.filter(
+        Delivery.objects.select_related("customer").only(
+            "date", "bottles_delivered", "bottles_returned", "total_amount", "amount_received",
+            "customer__name", "customer__bottles_at_site", "customer__pending_balance",
+        )
+    )
 
-    today = timezone.localdate()  # ✅ use local date
 
+def daily_delivery_totals(today):
     # ✅ Aggregate today's totals
-    daily_totals = deliveries.filter(date=today).aggregate(
+    return cached("delivery_daily_totals", [Delivery], today, lambda: Delivery.objects.filter(date=today).aggregate(
         total_delivered=Sum("bottles_delivered"),
         total_returned=Sum("bottles_returned"),
-    )
+    ))
 
-    context = {
-        "deliveries": deliveries,
+
+def selected_customer(filters):
+    if filters.is_valid() and filters.cleaned_data["customer"]:
+        return Customer.objects.filter(pk=filters.cleaned_data["customer"]).only("name").first()
+    return None
+
+
+def delivery_list_context(request, filters, table, daily_totals, customer):
+    return {
+        "table": table,
+        "filters": filters,
+        "selected_customer": customer,
+        "first_query": page_querystring(request, None),
         "daily_total_delivered": daily_totals["total_delivered"] or 0,
         "daily_total_returned": daily_totals["total_returned"] or 0,
     }
-    return render(request, "delivery/deliveries.html", context)
 
 @login_required
 def delivery_add(request):
@@ -145,31 +295,27 @@ def delivery_add(request):
         form = DeliveryForm(request.POST)
         if form.is_valid():
             delivery = form.save(commit=False)
-            try:
-                bottle_price = BottlePrice.objects.last().price_per_bottle
-            except AttributeError:
-                bottle_price = 0
-            delivery.total_amount = delivery.bottles_delivered * bottle_price
-            delivery.save()
+            # ✅ price in effect on the delivery's own date, no query
+            delivery.total_amount = delivery.bottles_delivered * price_on(delivery.date)
+            post_delivery(delivery)
             return redirect("delivery_list")
     else:
         form = DeliveryForm()
     return render(request, "delivery/delivery_add.html", {"form": form})
 
 
+@login_required
 def delivery_edit(request, pk):
     delivery = get_object_or_404(Delivery, pk=pk)
 
     if request.method == "POST":
+        previous = snapshot(delivery)  # ✅ before the form overwrites the instance
         form = DeliveryForm(request.POST, instance=delivery)
         if form.is_valid():
             delivery = form.save(commit=False)
-            try:
-                bottle_price = BottlePrice.objects.last().price_per_bottle
-            except AttributeError:
-                bottle_price = 0
-            delivery.total_amount = delivery.bottles_delivered * bottle_price
-            delivery.save()
+            # ✅ price in effect on the delivery's own date, no query
+            delivery.total_amount = delivery.bottles_delivered * price_on(delivery.date)
+            post_delivery(delivery, previous)
             return redirect("delivery_list")
     else:
         form = DeliveryForm(instance=delivery)
@@ -177,18 +323,108 @@ def delivery_edit(request, pk):
     return render(request, "delivery/delivery_edit.html", {"form": form, "delivery": delivery})
 
 
+@login_required
+def delivery_import(request):
+    result = None
+    if request.method == "POST":
+        form = DeliveryImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            result = import_uploaded_file(form.cleaned_data["file"])
+    else:
+        form = DeliveryImportForm()
+    return render(request, "delivery/delivery_import.html", {"form": form, "result": result})
+
+
+# Route sheets
+
+@login_required
+@reads_from_replica
+def route_sheet(request):
+    today = timezone.localdate()
+    try:
+        day = date.fromisoformat(request.GET.get("day", "")) if request.GET.get("day") else today
+    except ValueError:
+        day = today
+    stops = planned_stops(day)
+    return render(request, "delivery/route_sheet.html", {
+        "day": day,
+        "stops": stops,
+        "total_bottles": sum(stop.expected_bottles for stop in stops),
+        "previous_day": day - timedelta(days=1),
+        "next_day": day + timedelta(days=1),
+    })
+
+
 # Transaction Management
 
 @login_required
+@conditional(Transaction, Customer)
+@reads_from_replica
 def transaction_list(request):
-    transactions = Transaction.objects.all()
-    return render(request, "delivery/transactions.html", {"transactions": transactions})
+    filters = TransactionFilterForm(request.GET)
+    transactions = filters.filter(Transaction.objects.all())
+    context = transaction_list_context(
+        request,
+        filters,
+        transaction_table(request, transactions),
+        transaction_totals(request, transactions),
+        selected_customer(filters),
+    )
+    return render(request, "delivery/transactions.html", context)
+
+
+def transaction_table(request, transactions):
+    """Rendered transaction table and pager, cached until a transaction or customer changes."""
+    def render_table():
+        page = transaction_page(transactions, request.GET.get("cursor"))
+        return render_to_string("delivery/transaction_table.html", {
+            "transactions": page,
+            "next_query": page_querystring(request, page.next_cursor) if page.has_next else "",
+            "first_query": page_querystring(request, None),
+        })
+    return cached("transaction_table", [Transaction, Customer], sorted(request.GET.lists()), render_table)
+
+
+def transaction_totals(request, transactions):
+    # ✅ totals for the whole filtered set in one query, not per page
+    filters = sorted((key, values) for key, values in request.GET.lists() if key != "cursor")
+    return cached(
+        "transaction_totals", [Transaction], filters,
+        lambda: transactions.aggregate(total=Sum("amount"), count=Count("id")),
+    )
+
 
+def transaction_page(transactions, cursor):
+    return keyset_paginate(
+        transactions.select_related("customer").only(
+            "date", "amount", "transaction_type", "delivery_id", "customer__name",
+        ),
+        cursor,
+    )
+
+
+def transaction_list_context(request, filters, table, totals, customer):
+    return {
+        "table": table,
+        "filters": filters,
+        "selected_customer": customer,
+        "filtered_total": totals["total"] or 0,
+        "filtered_count": totals["count"],
+        "first_query": page_querystring(request, None),
+    }
+
+@login_required
 def transaction_delete(request, pk):
     transaction = get_object_or_404(Transaction, pk=pk)
 
+    # ✅ a delivery's payment record is corrected by editing the delivery
+    if transaction.delivery_id:
+        status = 400 if request.method == "POST" else 200
+        return render(request, "delivery/transaction_confirm_delete.html", {"transaction": transaction}, status=status)
+
     if request.method == "POST":
-        transaction.delete()
+        # ✅ the ledger gets the reversing entry, the customer gets the amount back
+        reverse_transaction(transaction)
         return redirect("transaction_list")
 
     return render(request, "delivery/transaction_confirm_delete.html", {"transaction": transaction})
@@ -198,13 +434,38 @@ def transaction_add(request):
     if request.method == "POST":
         form = TransactionForm(request.POST)
         if form.is_valid():
-            form.save()
+            post_transaction(form.save(commit=False))
             return redirect("transaction_list")
     else:
         form = TransactionForm()
     return render(request, "delivery/transaction_add.html", {"form": form})
 
 
+# Exports
+
+@login_required
+@reads_from_replica
+def export(request, kind):
+    if kind not in EXPORTS:
+        raise Http404("Unknown export")
+    filters = DateRangeFilterForm(request.GET)
+    data = filters.cleaned_data if filters.is_valid() else {}
+    header, rows = export_rows(kind, data.get("date_from"), data.get("date_to"), data.get("customer"))
+
+    stamp = timezone.localdate().isoformat()
+    if request.GET.get("format") == "xlsx":
+        response = StreamingHttpResponse(
+            stream_xlsx(header, rows, sheet_name=kind.title()),
+            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        )
+        filename = f"{kind}-{stamp}.xlsx"
+    else:
+        response = StreamingHttpResponse(stream_csv(header, rows), content_type="text/csv")
+        filename = f"{kind}-{stamp}.csv"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
 # Bottle Price
 
 @login_required
@@ -219,3 +480,16 @@ def bottle_price(request):
     prices = BottlePrice.objects.all().order_by("-updated_at")
     return render(request, "delivery/bottle_price.html", {"form": form, "prices": prices})
 
+
+# Request metrics
+
+@user_passes_test(lambda user: user.is_staff)
+def metrics(request):
+    if request.method == "POST" and "reset" in request.POST:
+        request_stats.reset()
+        cache_counters.reset()
+        return redirect("metrics")
+    return render(request, "delivery/metrics.html", {
+        "views": request_stats.summary(),
+        "caches": cache_counters.summary(),
+    })
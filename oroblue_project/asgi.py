@@ -5,6 +5,14 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Serving through this module switches the dashboard and list pages to their
+async views (ASYNC_VIEWS=1), e.g.
+
+    WEB_CONCURRENCY=4 gunicorn oroblue_project.asgi:application -k uvicorn.workers.UvicornWorker
+
+gunicorn takes its worker count from WEB_CONCURRENCY, and settings.py gives
+several workers shared caches from it.
 """
 
 import os
@@ -12,5 +20,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'oroblue_project.settings')
+os.environ.setdefault('ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -1,4 +1,6 @@
 import os
+import sys
+import tempfile
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -21,16 +23,23 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'rest_framework',
     'delivery',
     'auth_user',
 ]
 
 MIDDLEWARE = [
+    'delivery.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # /static/ straight from STATIC_ROOT, before sessions and auth
+    'delivery.static_assets.StaticAssetsMiddleware',
+    # gzip text responses; after the static files, those are precompressed
+    'delivery.conditional.CompressTextMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # AuthenticationMiddleware with a per-worker user cache, see auth_user/middleware.py
+    'auth_user.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -39,7 +48,8 @@ ROOT_URLCONF = 'oroblue_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates plus render timing for delivery.metrics
+        'BACKEND': 'delivery.metrics.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / "templates"],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -55,13 +65,99 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'oroblue_project.wsgi.application'
 
+# ✅ run on every new SQLite connection. WAL lets readers work while a delivery
+# is being written, busy_timeout waits for the write lock instead of failing
+# with "database is locked", NORMAL sync is safe with WAL and much cheaper.
+SQLITE_PRAGMAS = "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; PRAGMA busy_timeout=20000"
+
+# the benchmarks point their servers at a throwaway copy through this
+SQLITE_PATH = Path(os.getenv("SQLITE_PATH", BASE_DIR / "db.sqlite3"))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': SQLITE_PATH,
+        'CONN_MAX_AGE': int(os.getenv("DB_CONN_MAX_AGE", 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': SQLITE_PRAGMAS,
+            # take the write lock at BEGIN, a deferred transaction that reads and
+            # then writes can't be upgraded while another writer is active
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+    },
+    # same file, reader only, see delivery/routers.py
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': SQLITE_PATH,
+        'CONN_MAX_AGE': int(os.getenv("DB_CONN_MAX_AGE", 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': "PRAGMA busy_timeout=20000; PRAGMA query_only=ON",
+            'timeout': 20,
+        },
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['delivery.routers.ReadReplicaRouter']
+
+# Serve the async dashboard and list views, asgi.py turns this on
+ASYNC_VIEWS = os.getenv("ASYNC_VIEWS", "0") == "1"
+
+# Local memory is per process, fine for runserver and the tests. gunicorn starts
+# WEB_CONCURRENCY workers, and they have to share these caches or version bumps,
+# price changes and user changes don't reach the others (stale list tables,
+# 304s for stale pages): with more than one worker every cache defaults to
+# files under CACHE_DIR. Each can still be pointed at another shared backend
+# (memcached, redis) with its own *_BACKEND/*_LOCATION. See delivery/caching.py
+# for the check that refuses per-process caches with several workers.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+CACHE_DIR = Path(os.getenv("CACHE_DIR", "/var/tmp/oroblue_cache"))
+
+
+def _cache(env_prefix, name, **options):
+    if WEB_CONCURRENCY > 1:
+        backend, location = "django.core.cache.backends.filebased.FileBasedCache", str(CACHE_DIR / name)
+    else:
+        backend, location = "django.core.cache.backends.locmem.LocMemCache", f"oroblue-{name}"
+    return {
+        'BACKEND': os.getenv(f"{env_prefix}BACKEND", backend),
+        'LOCATION': os.getenv(f"{env_prefix}LOCATION", location),
+        'OPTIONS': options,
     }
+
+
+CACHES = {
+    'default': _cache("CACHE_", "default"),
+    # rendered list tables and totals, see delivery/caching.py
+    'lists': _cache("LIST_CACHE_", "lists", MAX_ENTRIES=int(os.getenv("LIST_CACHE_MAX_ENTRIES", "5000"))),
+    # sessions and user versions, see auth_user/sessions.py and middleware.py
+    'sessions': _cache(
+        "SESSION_CACHE_", "sessions", MAX_ENTRIES=int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "10000")),
+    ),
 }
 
+# Seconds a cached list fragment lives; writes invalidate it sooner
+LIST_CACHE_TIMEOUT = int(os.getenv("LIST_CACHE_TIMEOUT", "300"))
+
+# Sessions live in the cache, the database copy is written behind
+SESSION_ENGINE = "auth_user.sessions"
+SESSION_CACHE_ALIAS = "sessions"
+SESSION_DB_WRITE_INTERVAL = int(os.getenv("SESSION_DB_WRITE_INTERVAL", "60"))
+
+# How long a worker trusts a user it has already loaded for a session
+AUTH_USER_CACHE_SECONDS = int(os.getenv("AUTH_USER_CACHE_SECONDS", "30"))
+
+# Failed logins from one address before login_pg refuses it, and for how long
+LOGIN_MAX_ATTEMPTS = int(os.getenv("LOGIN_MAX_ATTEMPTS", "5"))
+LOGIN_THROTTLE_SECONDS = int(os.getenv("LOGIN_THROTTLE_SECONDS", "300"))
+# Longest wait between attempts on one username past LOGIN_MAX_ATTEMPTS failures
+LOGIN_BACKOFF_MAX_SECONDS = int(os.getenv("LOGIN_BACKOFF_MAX_SECONDS", "60"))
+# Proxies in front of the app that append to X-Forwarded-For (Render has one)
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1" if os.getenv("RENDER") else "0"))
+
 AUTH_PASSWORD_VALIDATORS = []
 
 LANGUAGE_CODE = 'en-us'
@@ -75,12 +171,69 @@ STATIC_URL = '/static/'
 # Where collectstatic will put files (needed for Render/production)
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
+# Hashed names plus .gz copies at collect time, served by
+# delivery.static_assets.StaticAssetsMiddleware
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "delivery.static_assets.CompressedManifestStorage"},
+}
+
 # Only add static dir if it exists (avoids warning on Render)
 if (BASE_DIR / "static").exists():
     STATICFILES_DIRS = [BASE_DIR / "static"]
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Request instrumentation (delivery.metrics)
+SLOW_REQUEST_MS = int(os.getenv("SLOW_REQUEST_MS", "500"))
+SLOW_REQUEST_QUERIES = int(os.getenv("SLOW_REQUEST_QUERIES", "50"))
+
+# Month-end statements (manage.py generate_statements), one directory per month
+STATEMENTS_DIR = Path(os.getenv("STATEMENTS_DIR", BASE_DIR / "statements"))
+
+# Created by the first slow request, not here (delivery.metrics.SlowRequestLogHandler).
+# The test suite logs to a temporary directory instead of the deployment's.
+LOG_DIR = Path(os.getenv("LOG_DIR", BASE_DIR / "logs"))
+if sys.argv[1:2] == ["test"]:
+    LOG_DIR = Path(tempfile.gettempdir()) / "oroblue-test-logs"
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        # the slow request log is already one JSON object per message
+        "jsonl": {"format": "%(message)s"},
+    },
+    "handlers": {
+        "slow_requests": {
+            "class": "delivery.metrics.SlowRequestLogHandler",
+            "filename": "slow_requests.jsonl",
+            "maxBytes": 5 * 1024 * 1024,
+            "backupCount": 5,
+            "formatter": "jsonl",
+        },
+    },
+    "loggers": {
+        "delivery.slow_requests": {
+            "handlers": ["slow_requests"],
+            "level": "WARNING",
+            "propagate": False,
+        },
+    },
+}
+
+REST_FRAMEWORK = {
+    # session for the browser, basic auth for dispatch tools
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "rest_framework.authentication.SessionAuthentication",
+        "rest_framework.authentication.BasicAuthentication",
+    ],
+    "DEFAULT_PERMISSION_CLASSES": ["rest_framework.permissions.IsAuthenticated"],
+    "DEFAULT_RENDERER_CLASSES": ["rest_framework.renderers.JSONRenderer"],
+    "DEFAULT_VERSIONING_CLASS": "rest_framework.versioning.URLPathVersioning",
+    "ALLOWED_VERSIONS": ["v1"],
+}
+
 LOGIN_URL = "/login/"
 LOGIN_REDIRECT_URL = "/"   # After successful login
 LOGOUT_REDIRECT_URL = "/"  # After logout
@@ -1,8 +1,9 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    re_path(r'^api/(?P<version>v1)/', include('delivery.api_urls')),
     path('', include('delivery.urls')),
     path('', include('auth_user.urls'))
 ]